@@ -0,0 +1,173 @@
+"""Process-wide admission control against the OpenAI rate limits
+
+Every session shares one API key, so requests-per-minute and
+tokens-per-minute are budgets of the whole process. Jobs reserve their
+cost (requests, plus prompt tokens and the ``max_tokens`` budget, which is
+what the API counts against TPM) when they are submitted and wait in a
+bounded FIFO queue until both token buckets can cover it. Waiting jobs can
+report their queue position and an ETA; once the queue is full new work
+is rejected immediately instead of piling up and timing out.
+
+Configuration (environment variables):
+
+- ``FITBOT_OPENAI_RPM``: requests per minute (0 disables the limit)
+- ``FITBOT_OPENAI_TPM``: tokens per minute (0 disables the limit)
+- ``FITBOT_ADMISSION_QUEUE``: jobs allowed to wait before new ones are rejected
+"""
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
+
+from instrumentation import count, observe
+
+DEFAULT_RPM = 500
+DEFAULT_TPM = 200000
+DEFAULT_MAX_QUEUE = 100
+
+class Overloaded(Exception):
+    """Raised when the admission queue is full"""
+
+class TokenBucket:
+    """Refills continuously at ``per_minute`` and holds at most one minute's worth"""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def cost(self, amount: float) -> float:
+        # A single request larger than the bucket is let through once it is full
+        return min(amount, self.capacity)
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until ``amount`` can be taken, ignoring anyone else"""
+        return max(0.0, (self.cost(amount) - self.level) / self.rate)
+
+    def take(self, amount: float):
+        self.level -= self.cost(amount)
+
+class Ticket:
+    """A queued reservation of requests and tokens"""
+
+    def __init__(self, requests: int, tokens: int):
+        self.requests = requests
+        self.tokens = tokens
+        self.enqueued = time.monotonic()
+        self.admitted = False
+        self.cancelled = False
+
+class AdmissionController:
+    """Token buckets for RPM and TPM in front of a bounded FIFO queue"""
+
+    def __init__(self, rpm: float = DEFAULT_RPM, tpm: float = DEFAULT_TPM, max_queue: int = DEFAULT_MAX_QUEUE):
+        self._buckets = {
+            name: TokenBucket(limit)
+            for name, limit in (('requests', rpm), ('tokens', tpm))
+            if limit > 0
+        }
+        self.max_queue = max_queue
+        self._cond = threading.Condition()
+        self._queue: deque = deque()
+        self.admitted = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        return cls(
+            rpm=float(os.getenv("FITBOT_OPENAI_RPM", str(DEFAULT_RPM))),
+            tpm=float(os.getenv("FITBOT_OPENAI_TPM", str(DEFAULT_TPM))),
+            max_queue=int(os.getenv("FITBOT_ADMISSION_QUEUE", str(DEFAULT_MAX_QUEUE)))
+        )
+
+    def _refill(self):
+        now = time.monotonic()
+        for bucket in self._buckets.values():
+            bucket.refill(now)
+
+    def _admit(self, ticket: Ticket) -> float:
+        """Charge the buckets for ``ticket`` if they cover it, else return the seconds to wait"""
+        self._refill()
+        # Bucket names match the ticket attributes they limit
+        delay = max([bucket.wait_time(getattr(ticket, name)) for name, bucket in self._buckets.items()], default=0.0)
+        if delay <= 0:
+            for name, bucket in self._buckets.items():
+                bucket.take(getattr(ticket, name))
+            ticket.admitted = True
+            self.admitted += 1
+            count('fitbot_admission_total', outcome='admitted')
+            observe('fitbot_admission_wait_seconds', time.monotonic() - ticket.enqueued)
+        return delay
+
+    def reserve(self, requests: int, tokens: int) -> Ticket:
+        """Admit straight away when nobody is waiting and the budget allows, else join the queue
+
+        Raises ``Overloaded`` immediately when the queue is full.
+        """
+        with self._cond:
+            ticket = Ticket(requests, tokens)
+            if not self._queue and self._admit(ticket) <= 0:
+                return ticket
+            if len(self._queue) >= self.max_queue:
+                self.rejected += 1
+                count('fitbot_admission_total', outcome='rejected')
+                raise Overloaded(f"{len(self._queue)} requests are already waiting")
+            self._queue.append(ticket)
+            return ticket
+
+    def wait(self, ticket: Ticket) -> bool:
+        """Block until ``ticket`` reaches the head of the queue and the buckets cover it
+
+        Returns False instead if the reservation is cancelled meanwhile.
+        """
+        with self._cond:
+            while not ticket.admitted:
+                if ticket.cancelled:
+                    return False
+                delay = None
+                if self._queue[0] is ticket:
+                    delay = self._admit(ticket)
+                    if delay <= 0:
+                        self._queue.popleft()
+                        self._cond.notify_all()
+                        break
+                self._cond.wait(delay)
+            return True
+
+    def cancel(self, ticket: Ticket):
+        """Give up a reservation that has not been admitted, waking anyone waiting on it"""
+        with self._cond:
+            if ticket.admitted:
+                return
+            ticket.cancelled = True
+            if ticket in self._queue:
+                self._queue.remove(ticket)
+            self._cond.notify_all()
+
+    def position(self, ticket: Ticket) -> Optional[Tuple[int, float]]:
+        """1-based queue position and estimated seconds until admission; None once admitted"""
+        with self._cond:
+            if ticket not in self._queue:
+                return None
+            ahead = []
+            for queued in self._queue:
+                ahead.append(queued)
+                if queued is ticket:
+                    break
+            self._refill()
+            # Every reservation up to and including this one has to be paid for
+            # before it is admitted
+            eta = max([max(0.0, (sum(bucket.cost(getattr(queued, name)) for queued in ahead) - bucket.level) / bucket.rate)
+                       for name, bucket in self._buckets.items()], default=0.0)
+            return len(ahead), eta
+
+    def stats(self) -> Dict[str, Any]:
+        """Waiting reservations and how many were admitted or rejected"""
+        with self._cond:
+            return {'waiting': len(self._queue), 'admitted': self.admitted, 'rejected': self.rejected}
@@ -1,12 +1,41 @@
 import streamlit as st
-from openai import OpenAI
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+import asyncio
+import functools
+import hashlib
 import json
 import os
+import random
+import re
+import secrets
 from datetime import datetime, timedelta
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 from dotenv import load_dotenv
 import time
 
+from admission import AdmissionController, Overloaded
+from fitness_metrics import compute_metrics
+from instrumentation import begin_rerun, count, end_rerun, observe, stage, start_metrics_server
+from openai_transport import ResilientTransport
+from plan_cache import PlanCache, plan_cache_key
+from plan_exports import EXPORT_FORMATS, ExportCache, export_file_name, export_key, next_week_start, render_export
+from plan_history import PlanHistory, affected_sections, split_plan
+from plan_jobs import Job, JobQueue
+from plan_labels import section_titles
+from plan_prompts import (
+    PERSONALIZATION_MAX_TOKENS, PERSONALIZATION_TITLES, PLAN_MAX_TOKENS, PLAN_MODEL, PLAN_SECTIONS,
+    PROMPT_VERSION, personalization_messages, plan_messages, section_messages
+)
+from plan_sections import SECTION_ERROR, assemble_plan, generate_sections
+from plan_skeletons import SkeletonLibrary, build_library, fill_skeleton
+from plan_translation import translation_cache_key, translation_max_tokens, translation_messages
+from session_store import SessionStore, deep_size
+from structured_plan import (
+    SCHEMA_VERSION, STRUCTURED_MAX_TOKENS, STRUCTURED_SECTIONS, StructuredPlan, parse_plan, plan_markdown,
+    render_section, restore_numbers, structured_plan_messages
+)
+from token_budget import UsageStore, count_message_tokens, fit_messages
+
 # Load environment variables
 load_dotenv()
 
@@ -18,8 +47,13 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Start timing this script rerun
+_ctx = get_script_run_ctx()
+rerun_trace = begin_rerun(_ctx.session_id if _ctx else "bare")
+
 # Custom CSS for better styling
-st.markdown("""
+with stage('css'):
+    st.markdown("""
 <style>
     .main-header {
         font-size: 3rem;
@@ -70,14 +104,29 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Initialize OpenAI client
+# Initialize the pooled, retrying OpenAI transport. The SDK and client are
+# only loaded on first use, so without an API key the page still renders
 @st.cache_resource
-def init_openai_client():
+def init_openai_client() -> Optional[ResilientTransport]:
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
-        st.error("⚠️ OpenAI API key not found! Please set OPENAI_API_KEY in your .env file")
-        st.stop()
-    return OpenAI(api_key=api_key)
+        return None
+    with stage('client_init'):
+        return ResilientTransport(api_key=api_key)
+
+def require_transport() -> ResilientTransport:
+    """The OpenAI transport, failing the generation when no API key is configured"""
+    if transport is None:
+        raise RuntimeError("OpenAI API key not found! Please set OPENAI_API_KEY in your .env file")
+    return transport
+
+# Load the SDK and open a connection once the first page has been sent, so a
+# cold process neither paints later nor makes its first plan wait for them
+@st.cache_resource
+def warm_up_openai():
+    if transport is None or os.getenv("FITBOT_WARMUP", "1").lower() in ("0", "false", "no"):
+        return None
+    return transport.start_warm_up()
 
 # Helper function for rerun compatibility
 def safe_rerun():
@@ -90,7 +139,99 @@ def safe_rerun():
         except AttributeError:
             st.warning("Please refresh the page manually")
 
-openai_client = init_openai_client()
+# Initialize persistent plan cache
+@st.cache_resource
+def init_plan_cache():
+    return PlanCache(
+        max_bytes=int(os.getenv("FITBOT_CACHE_MAX_MB", "50")) * 1024 * 1024,
+        ttl_seconds=float(os.getenv("FITBOT_CACHE_TTL_DAYS", "30")) * 24 * 3600
+    )
+
+# Initialize token usage telemetry
+@st.cache_resource
+def init_usage_store():
+    return UsageStore()
+
+# Load the precomputed plan skeleton library, if it has been built
+@st.cache_resource
+def init_skeleton_library():
+    library = SkeletonLibrary.load()
+    if library is not None and library.is_stale:
+        # Built from older templates; a rebuild takes well under a second
+        build_library()
+        library = SkeletonLibrary.load()
+    return library
+
+# Expose Prometheus metrics when FITBOT_METRICS_PORT is set
+@st.cache_resource
+def init_metrics_server():
+    port = os.getenv("FITBOT_METRICS_PORT")
+    return start_metrics_server(int(port)) if port else None
+
+# Shared background workers for plan generation, admitted against the
+# process-wide OpenAI rate limits
+@st.cache_resource
+def init_job_queue():
+    return JobQueue(max_workers=int(os.getenv("FITBOT_JOB_WORKERS", "8")), admission=AdmissionController.from_env())
+
+# Plan bodies and profiles are stored once, compressed, outside session state
+@st.cache_resource
+def init_session_store():
+    return SessionStore(
+        memory_bytes=int(os.getenv("FITBOT_SESSION_CACHE_MB", "16")) * 1024 * 1024,
+        idle_seconds=float(os.getenv("FITBOT_SESSION_IDLE_MINUTES", "30")) * 60
+    )
+
+# Plans generated per owner, for restoring them and for incremental edits
+@st.cache_resource
+def init_plan_history():
+    return PlanHistory()
+
+# Rendered Markdown, PDF and calendar downloads, shared by every session
+@st.cache_resource
+def init_export_cache():
+    return ExportCache(max_bytes=int(os.getenv("FITBOT_EXPORT_CACHE_MB", "100")) * 1024 * 1024)
+
+init_metrics_server()
+transport = init_openai_client()
+plan_cache = init_plan_cache()
+export_cache = init_export_cache()
+job_queue = init_job_queue()
+session_store = init_session_store()
+plan_history = init_plan_history()
+skeleton_library = init_skeleton_library()
+usage_store = init_usage_store()
+
+# Seconds between progress polls while a plan job is running
+JOB_POLL_INTERVAL = 0.5
+
+# Plans up to this size are exported during the rerun; larger ones are
+# rendered on a background worker
+EXPORT_INLINE_BYTES = int(os.getenv("FITBOT_EXPORT_INLINE_KB", "64")) * 1024
+
+# Plan history tokens in the page URL (``?u=``): 24 random bytes, URL-safe
+# base64. Anything shorter, including the 16-character owner IDs of older
+# links, is not accepted.
+HISTORY_TOKEN_BYTES = 24
+HISTORY_TOKEN = re.compile(r"[A-Za-z0-9_-]{32}")
+
+# Profile fields the summary above the plan shows
+SUMMARY_FIELDS = ('weight', 'height', 'age', 'goal')
+
+# Download formats offered below the plan
+EXPORT_LABELS = {
+    'markdown': "📝 Markdown (.md)",
+    'pdf': "📄 PDF (.pdf)",
+    'ics': "📅 Calendar (.ics)"
+}
+
+# Plan generation modes
+GENERATION_MODES = {
+    "📝 Full plan": "full",
+    "⚡ Parallel sections": "sections",
+    "🚀 Quick plan (skeleton)": "skeleton",
+    "🧩 Structured plan": "structured"
+}
 
 # Language settings
 LANGUAGES = {
@@ -105,7 +246,12 @@ CONTENT = {
         'description': "Get a personalized fitness and nutrition plan tailored just for you!",
         'form_title': "📋 Personal Information",
         'generating': "🔄 Generating your personalized fitness plan...",
+        'translating': "🌐 Translating your plan...",
+        'queued': "⏳ Lots of people are training with FitBot right now: you're #{position} in line, starting in about {eta}s",
+        'overloaded': "🚦 FitBot is at capacity right now. Please try again in a minute.",
         'plan_ready': "🎉 Your Personalized Fitness Plan is Ready!",
+        'export_title': "My FitBot Fitness Plan",
+        'preparing_exports': "📦 Preparing your downloads...",
         'questions': {
             'weight': "Current Weight (kg or lbs)",
             'height': "Height (e.g., 5'8\" or 175cm)",
@@ -150,7 +296,12 @@ CONTENT = {
         'description': "¡Obtén un plan de fitness y nutrición personalizado hecho para ti!",
         'form_title': "📋 Información Personal",
         'generating': "🔄 Generando tu plan de fitness personalizado...",
+        'translating': "🌐 Traduciendo tu plan...",
+        'queued': "⏳ Mucha gente está entrenando con FitBot ahora mismo: eres el n.º {position} en la fila, empezamos en unos {eta} s",
+        'overloaded': "🚦 FitBot está al máximo de su capacidad ahora mismo. Inténtalo de nuevo en un minuto.",
         'plan_ready': "🎉 ¡Tu Plan de Fitness Personalizado está Listo!",
+        'export_title': "Mi Plan de Fitness de FitBot",
+        'preparing_exports': "📦 Preparando tus descargas...",
         'questions': {
             'weight': "Peso Actual (kg o libras)",
             'height': "Altura (ej: 1.75m o 5'8\")",
@@ -191,88 +342,711 @@ CONTENT = {
     }
 }
 
-def generate_fitness_plan(user_data: Dict[str, Any], language: str) -> str:
-    """Generate personalized fitness plan using OpenAI"""
-    
-    language_instruction = "English" if language == 'english' else "Spanish"
-    
-    prompt = f"""
-    Create a comprehensive, personalized fitness and nutrition plan in {language_instruction} for someone with these characteristics:
-    
-    Personal Information:
-    - Weight: {user_data.get('weight', 'Not specified')}
-    - Height: {user_data.get('height', 'Not specified')}
-    - Age: {user_data.get('age', 'Not specified')}
-    - Gender: {user_data.get('gender', 'Not specified')}
-    - Activity Level: {user_data.get('activity_level', 'Not specified')}
-    - Primary Goal: {user_data.get('goal', 'Not specified')}
-    - Dietary Restrictions: {user_data.get('diet_restrictions', 'None')}
-    - Available Training Days: {user_data.get('training_days', 'Not specified')} days per week
-    - Workout Preference: {user_data.get('workout_pref', 'Not specified')}
-    
-    Please provide a comprehensive plan with the following sections:
-    
-    1. 📊 PERSONAL ASSESSMENT
-    - BMI calculation and assessment
-    - Fitness level evaluation
-    - Goal feasibility and timeline
-    
-    2. 🏋️‍♂️ WEEKLY WORKOUT SCHEDULE
-    - Detailed day-by-day workout plan
-    - Specific exercises with sets and reps
-    - Progressive difficulty recommendations
-    
-    3. 🥗 NUTRITION PLAN
-    - Daily calorie target
-    - Macronutrient breakdown
-    - Meal timing suggestions
-    - Sample meal ideas
-    
-    4. 📈 PROGRESS TRACKING
-    - Key metrics to monitor
-    - Timeline for expected results
-    - Milestone checkpoints
-    
-    5. 💡 SUCCESS TIPS
-    - Motivation strategies
-    - Common pitfalls to avoid
-    - Lifestyle integration tips
-    
-    Make it practical, motivating, and achievable. Use emojis and clear formatting.
-    Ensure the advice is safe and encourages consulting healthcare professionals when appropriate.
+# Localized option label -> key lookups for the form's select boxes, built once
+LABEL_KEYS = {
+    language: {
+        field: {label: key for key, label in content[field].items()}
+        for field in ('activity_levels', 'goals', 'workout_prefs')
+    }
+    for language, content in CONTENT.items()
+}
+
+def stream_completion(messages: List[Dict[str, str]], max_tokens: int,
+                      usage_out: Optional[Dict[str, Any]] = None,
+                      response_format: Optional[Dict[str, str]] = None) -> Iterator[str]:
+    """Stream a chat completion from OpenAI as text deltas arrive
+    
+    When ``usage_out`` is given it receives the token usage and finish
+    reason once the stream ends.
+    """
+    extra = {'response_format': response_format} if response_format else {}
+    started = time.perf_counter()
+    first_token_at = None
+    with stage('api'):
+        stream = require_transport().stream_chat(
+            model=PLAN_MODEL,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=0.7,
+            stream_options={"include_usage": True},
+            **extra
+        )
+        deltas, usage, finish_reason, model = 0, None, None, PLAN_MODEL
+        for chunk in stream:
+            model = chunk.model or model
+            if chunk.usage:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            finish_reason = chunk.choices[0].finish_reason or finish_reason
+            if chunk.choices[0].delta.content:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    observe('fitbot_time_to_first_token_seconds', first_token_at - started)
+                deltas += 1
+                yield chunk.choices[0].delta.content
+    
+    completion_tokens = usage.completion_tokens if usage else deltas
+    if first_token_at is not None and time.perf_counter() > first_token_at:
+        observe('fitbot_generation_tokens_per_second', completion_tokens / (time.perf_counter() - first_token_at))
+    
+    if usage_out is not None:
+        usage_out.update(
+            prompt_tokens=usage.prompt_tokens if usage else count_message_tokens(messages),
+            completion_tokens=completion_tokens,
+            max_tokens=max_tokens,
+            finish_reason=finish_reason,
+            latency_s=time.perf_counter() - started,
+            model=model
+        )
+
+def record_usage(kind: str, user_data: Dict[str, Any], language: str, usage: Dict[str, Any]):
+    """Store a finished request's token usage for budgeting and reporting"""
+    if usage:
+        usage = dict(usage)
+        model = usage.pop('model', None) or PLAN_MODEL
+        usage_store.record(kind, language, user_data.get('goal', ''), model, **usage)
+
+def stream_plan(job: Job, messages: List[Dict[str, str]], max_tokens: int,
+                prefix: str = "", usage_out: Optional[Dict[str, Any]] = None) -> str:
+    """Stream a completion into a job's progress text and return the finished plan
+    
+    ``prefix`` is shown immediately and kept at the start of the plan.
+    """
+    text = prefix
+    job.update(text, 0.0)
+    received = 0
+    for piece in stream_completion(messages, max_tokens, usage_out):
+        # Each streamed delta is roughly one token, so progress is measured
+        # against the completion budget rather than a fake timer
+        received += 1
+        text += piece
+        job.update(text, min(received / max_tokens, 1.0))
+    return text.strip()
+
+def generate_plan_sections(job: Job, user_data: Dict[str, Any], language: str,
+                           sections: Optional[List[str]] = None,
+                           reuse: Optional[Dict[str, str]] = None) -> Tuple[str, bool]:
+    """Generate the plan sections concurrently, publishing the partial plan as they stream
+    
+    ``sections`` limits generation to those keys and ``reuse`` supplies the
+    text of the others. Returns the assembled plan and whether every
+    generated section succeeded.
     """
+    goal = user_data.get('goal', '')
+    keys = sections or [section['key'] for section in PLAN_SECTIONS]
+    reuse = reuse or {}
+    budgets = {
+        section['key']: usage_store.adaptive_max_tokens(f"section:{section['key']}", language, goal, section['max_tokens'])
+        for section in PLAN_SECTIONS if section['key'] in keys
+    }
+    total_budget = sum(budgets.values())
+    partial = {section['key']: reuse.get(section['key'], "") for section in PLAN_SECTIONS}
+    received = {key: 0 for key in keys}
+    started = time.perf_counter()
     
+    def on_delta(section_key: str, text: str):
+        # All sections run on this worker's event loop, one callback at a time
+        if not any(received.values()):
+            observe('fitbot_time_to_first_token_seconds', time.perf_counter() - started)
+        received[section_key] += 1
+        partial[section_key] = text
+        job.update(assemble_plan(partial, language), min(sum(received.values()) / total_budget, 1.0))
+    
+    upstream = require_transport()
+    
+    async def run():
+        async with upstream.async_client() as client:
+            return await generate_sections(
+                client, user_data, language,
+                max_concurrency=int(os.getenv("FITBOT_SECTION_CONCURRENCY", "5")),
+                on_delta=on_delta,
+                sections=keys,
+                budgets=budgets,
+                on_usage=lambda section_key, usage: record_usage(f"section:{section_key}", user_data, language, usage),
+                transport=upstream
+            )
+    
+    with stage('api'):
+        generated, failed = asyncio.run(run())
+    return assemble_plan({**reuse, **generated}, language), not failed
+
+def run_plan_job(job: Job, user_data: Dict[str, Any], language: str, mode: str,
+                 skeleton: Optional[str], cache_key: str) -> str:
+    """Generate a plan on a background worker and cache it if it succeeded"""
+    goal = user_data.get('goal', '')
+    usage = {}
     try:
-        with st.spinner("🤖 AI is creating your personalized fitness plan..."):
-            response = openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a professional fitness and nutrition coach with expertise in creating personalized, safe, and effective fitness plans. Always prioritize user safety and encourage professional consultation when needed."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=3000,
-                temperature=0.7
+        if mode == 'structured':
+            with stage('prompt_build'):
+                messages = fit_messages(structured_plan_messages(user_data, language))
+            max_tokens = usage_store.adaptive_max_tokens('structured', language, goal, STRUCTURED_MAX_TOKENS)
+            text, received = "", 0
+            # Raw JSON is not worth showing while it streams, so only progress is published
+            for piece in stream_completion(messages, max_tokens, usage, response_format={"type": "json_object"}):
+                received += 1
+                text += piece
+                job.update("", min(received / max_tokens, 1.0))
+            record_usage('structured', user_data, language, usage)
+            plan = parse_plan(text).to_json()
+            complete = True
+        elif mode == 'sections':
+            plan, complete = generate_plan_sections(job, user_data, language)
+        elif mode == 'skeleton':
+            with stage('prompt_build'):
+                metrics = compute_metrics(user_data)
+                filled = fill_skeleton(skeleton, metrics, language)
+                title = PERSONALIZATION_TITLES.get(language, PERSONALIZATION_TITLES['english'])
+                messages = fit_messages(personalization_messages(filled, user_data, language, metrics))
+            plan = stream_plan(
+                job, messages,
+                usage_store.adaptive_max_tokens('personalization', language, goal, PERSONALIZATION_MAX_TOKENS),
+                prefix=f"{filled}\n\n## {title}\n\n",
+                usage_out=usage
             )
+            record_usage('personalization', user_data, language, usage)
+            complete = True
+        else:
+            with stage('prompt_build'):
+                messages = fit_messages(plan_messages(user_data, language))
+            plan = stream_plan(
+                job, messages,
+                usage_store.adaptive_max_tokens('plan', language, goal, PLAN_MAX_TOKENS),
+                usage_out=usage
+            )
+            record_usage('plan', user_data, language, usage)
+            complete = True
+    except Exception:
+        count('fitbot_generations_total', mode=mode, status='error')
+        raise
+    
+    # A partially degraded plan is shown but not cached
+    count('fitbot_generations_total', mode=mode, status='ok' if complete else 'error')
+    if complete:
+        plan_cache.put(cache_key, plan)
+    return plan
+
+def run_incremental_job(job: Job, user_data: Dict[str, Any], language: str, reuse: Dict[str, str],
+                        regenerate: List[str], cache_key: str) -> str:
+    """Regenerate only the sections a profile edit affects, keeping the rest of the previous plan"""
+    try:
+        plan, complete = generate_plan_sections(job, user_data, language, sections=regenerate, reuse=reuse)
+    except Exception:
+        count('fitbot_generations_total', mode='incremental', status='error')
+        raise
+    
+    count('fitbot_generations_total', mode='incremental', status='ok' if complete else 'error')
+    if complete:
+        plan_cache.put(cache_key, plan)
+    return plan
+
+def incremental_sections(base: Optional[Dict[str, Any]], user_data: Dict[str, Any], language: str,
+                         mode: str) -> Optional[Tuple[Dict[str, str], List[str]]]:
+    """Sections of a previous plan to reuse and section keys to regenerate after a profile edit
+    
+    Returns None when the plan has to be generated from scratch: no
+    previous plan, another language or a format without separable sections.
+    """
+    if base is None or base['language'] != language or {mode, base['mode']} - {'full', 'sections'}:
+        return None
+    sections = split_plan(base['plan'])
+    if sections is None:
+        return None
+    # Sections that failed last time are always retried
+    failed_prefix = SECTION_ERROR.split('{')[0]
+    regenerate = set(affected_sections(base['profile'], user_data))
+    regenerate.update(key for key, text in sections.items() if text.startswith(failed_prefix))
+    if len(regenerate) == len(PLAN_SECTIONS):
+        return None
+    reuse = {key: text for key, text in sections.items() if key not in regenerate}
+    return reuse, [section['key'] for section in PLAN_SECTIONS if section['key'] in regenerate]
+
+def plan_cost(user_data: Dict[str, Any], language: str, mode: str, skeleton: Optional[str],
+              sections: Optional[List[str]] = None) -> Tuple[int, int]:
+    """Requests and tokens (prompt plus completion budget) a plan job reserves against the rate limits"""
+    goal = user_data.get('goal', '')
+    if mode == 'sections':
+        metrics = compute_metrics(user_data)
+        keys = sections or [section['key'] for section in PLAN_SECTIONS]
+        tokens = sum(
+            count_message_tokens(fit_messages(section_messages(section['key'], user_data, language, metrics)))
+            + usage_store.adaptive_max_tokens(f"section:{section['key']}", language, goal, section['max_tokens'])
+            for section in PLAN_SECTIONS if section['key'] in keys
+        )
+        return len(keys), tokens
+    if mode == 'structured':
+        messages = structured_plan_messages(user_data, language)
+        max_tokens = usage_store.adaptive_max_tokens('structured', language, goal, STRUCTURED_MAX_TOKENS)
+    elif mode == 'skeleton':
+        metrics = compute_metrics(user_data)
+        messages = personalization_messages(fill_skeleton(skeleton, metrics, language), user_data, language, metrics)
+        max_tokens = usage_store.adaptive_max_tokens('personalization', language, goal, PERSONALIZATION_MAX_TOKENS)
+    else:
+        messages = plan_messages(user_data, language)
+        max_tokens = usage_store.adaptive_max_tokens('plan', language, goal, PLAN_MAX_TOKENS)
+    return 1, count_message_tokens(fit_messages(messages)) + max_tokens
+
+def request_plan(user_data: Dict[str, Any], language: str, mode: str = 'full',
+                 base: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """Serve the plan from the persistent cache, or start a background job on a miss
+    
+    ``mode`` is 'full' (one streamed request), 'sections' (five concurrent
+    section requests), 'skeleton' (precomputed skeleton plus a short
+    personalization pass; falls back to 'full' without a library) or
+    'structured' (a schema-validated JSON plan). ``base`` is the history
+    entry of the plan being edited; only the sections that depend on the
+    changed profile fields are then regenerated. Returns the job ID to
+    poll, or None when the plan was ready at once; raises ``Overloaded``
+    when too many plans are already waiting for the rate limits.
+    """
+    skeleton = skeleton_library.lookup(user_data, language) if mode == 'skeleton' and skeleton_library else None
+    if mode == 'skeleton' and skeleton is None:
+        st.toast("ℹ️ Quick plans are unavailable (run `python plan_skeletons.py build`); generating a full plan instead.")
+        mode = 'full'
+    
+    prompt_version = {
+        'full': PROMPT_VERSION,
+        'sections': f"{PROMPT_VERSION}-sections",
+        'skeleton': f"{PROMPT_VERSION}-skeleton-{skeleton_library.library_version if skeleton_library else ''}",
+        'structured': f"{PROMPT_VERSION}-structured-{SCHEMA_VERSION}"
+    }[mode]
+    st.session_state.plan_mode = mode
+    st.session_state.plan_language = language
+    clear_plan_variants()
+    with stage('cache_lookup'):
+        key = plan_cache_key(user_data, language, PLAN_MODEL, prompt_version)
+        cached = plan_cache.get(key)
+    if cached is not None:
+        store_plan(cached, language)
+        remember_plan(cached, language)
+        count('fitbot_generations_total', mode=mode, status='cached')
+        return None
+    
+    incremental = incremental_sections(base, user_data, language, mode)
+    if incremental is not None:
+        reuse, regenerate = incremental
+        if not regenerate:
+            # Nothing the plan depends on changed
+            plan = assemble_plan(reuse, language)
+            plan_cache.put(key, plan)
+            store_plan(plan, language)
+            remember_plan(plan, language)
+            count('fitbot_generations_total', mode='incremental', status='reused')
+            return None
+        titles = section_titles(language)
+        st.toast(f"♻️ Keeping {len(reuse)} sections of your plan; rewriting {', '.join(titles[key] for key in regenerate)}")
+        job = job_queue.submit(
+            key, lambda job: run_incremental_job(job, user_data, language, reuse, regenerate, key),
+            cost=plan_cost(user_data, language, 'sections', None, sections=regenerate)
+        )
+        return job.id
+    
+    # Identical in-flight requests share one job (and one API call)
+    job = job_queue.submit(
+        key, lambda job: run_plan_job(job, user_data, language, mode, skeleton, key),
+        cost=plan_cost(user_data, language, mode, skeleton)
+    )
+    return job.id
+
+def store_plan(plan: str, language: str):
+    """Show a finished plan (or a translation of it); session state keeps only its reference"""
+    ref = session_store.put(plan)
+    if st.session_state.plan_mode == 'structured':
+        # Parse once up front so a malformed plan fails here, not mid-render
+        session_store.load(ref, parse_plan)
+    st.session_state.plan_variants[language] = ref
+    show_plan_variant(language)
+
+def remember_plan(plan: str, language: str):
+    """Record a newly generated plan in the owner's history (translations are not recorded)"""
+    st.session_state.plan_history_id = plan_history.record(
+        history_owner(), current_profile(), language, st.session_state.plan_mode, plan
+    )
+
+def history_owner(create: bool = True) -> Optional[str]:
+    """Plan history owner, derived from the private token kept in the page URL
+    
+    The token is the only credential, so it is random and long enough not to
+    be guessed; only its hash is stored with the history. Without a valid
+    token in the URL a new one is issued, or None is returned if ``create``
+    is false.
+    """
+    if st.session_state.get('history_owner') is None:
+        token = st.query_params.get('u', '')
+        if not HISTORY_TOKEN.fullmatch(token):
+            if not create:
+                return None
+            token = secrets.token_urlsafe(HISTORY_TOKEN_BYTES)
+            st.query_params['u'] = token
+        st.session_state.history_owner = hashlib.sha256(token.encode('utf-8')).hexdigest()
+    return st.session_state.history_owner
+
+def forget_history_owner():
+    """Detach the session from its plan history, so a reload starts with an empty form"""
+    st.session_state.history_owner = None
+    st.query_params.pop('u', None)
+
+def restore_plan(entry: Dict[str, Any]):
+    """Show a plan from history as if it had just been generated"""
+    store_profile(entry['profile'])
+    st.session_state.plan_mode = entry['mode']
+    st.session_state.plan_language = entry['language']
+    clear_plan_variants()
+    store_plan(entry['plan'], entry['language'])
+    st.session_state.plan_history_id = entry['id']
+    st.session_state.plan_generated = True
+
+def show_plan_variant(language: str):
+    """Switch the displayed plan to an already stored language variant"""
+    st.session_state.plan_ref = st.session_state.plan_variants[language]
+    st.session_state.plan_error = None
+    st.session_state.plan_shown_language = language
+
+def decode_profile(text: str) -> Dict[str, Any]:
+    return json.loads(text)
+
+def current_profile() -> Dict[str, Any]:
+    """The submitted profile (read-only; shared with other sessions that entered the same one)
+    
+    Empty when there is none or it has expired from the session store.
+    """
+    return session_store.load(st.session_state.profile_ref, decode_profile) or {}
+
+def store_profile(user_data: Dict[str, Any]):
+    """Keep a reference to the profile instead of the dict itself"""
+    st.session_state.profile_ref = session_store.put(json.dumps(user_data, sort_keys=True, ensure_ascii=False)) if user_data else None
+
+def current_structured_plan() -> Optional[StructuredPlan]:
+    """The parsed plan being shown, for structured plans"""
+    if st.session_state.plan_mode != 'structured' or st.session_state.plan_error:
+        return None
+    return session_store.load(st.session_state.plan_ref, parse_plan)
+
+def current_plan_text() -> str:
+    """The plan being shown as markdown, or the generation error"""
+    if st.session_state.plan_error:
+        return st.session_state.plan_error
+    plan = current_structured_plan()
+    if plan is not None:
+        return plan_markdown(plan, st.session_state.plan_shown_language)
+    return session_store.get(st.session_state.plan_ref) or ""
+
+def track_session():
+    """Report this session's plan references and state size to the session store"""
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return
+    refs = [st.session_state.plan_ref, st.session_state.profile_ref, *st.session_state.plan_variants.values()]
+    # Keys are the same string literals in every session, so only values count
+    state_bytes = sum(deep_size(value) for value in st.session_state.to_dict().values())
+    session_store.touch(ctx.session_id, refs, state_bytes)
+    observe('fitbot_session_state_bytes', state_bytes)
+
+def clear_plan_variants():
+    """Forget translations of the previous plan, cancelling one still waiting to start"""
+    job_queue.cancel(st.session_state.get('translation_job_id'))
+    st.session_state.plan_variants = {}
+    st.session_state.plan_shown_language = None
+    st.session_state.translation_job_id = None
+    st.session_state.translation_errors = {}
+
+def run_translation_job(job: Job, source: str, target_language: str, structured: bool,
+                        user_data: Dict[str, Any], cache_key: str) -> str:
+    """Translate a finished plan on a background worker and cache the variant"""
+    usage = {}
+    try:
+        # The whole plan has to be translated, so the prompt is never compacted
+        messages = translation_messages(source, target_language, structured)
+        max_tokens = translation_max_tokens(source)
+        text, received = "", 0
+        response_format = {"type": "json_object"} if structured else None
+        for piece in stream_completion(messages, max_tokens, usage, response_format=response_format):
+            received += 1
+            text += piece
+            job.update("", min(received / max_tokens, 1.0))
+        # Translation spend is recorded under its own kind, apart from generation
+        record_usage('translation', user_data, target_language, usage)
+        if usage.get('finish_reason') == 'length':
+            raise RuntimeError("the translation was cut off")
+        if structured:
+            translated = restore_numbers(parse_plan(text), parse_plan(source)).to_json()
+        else:
+            translated = text.strip()
+    except Exception:
+        count('fitbot_translations_total', status='error')
+        raise
+    count('fitbot_translations_total', status='ok')
+    plan_cache.put(cache_key, translated)
+    return translated
+
+def request_translation(language: str) -> Optional[str]:
+    """Show the plan in another language from the cache, or start translating it
+    
+    Returns the job ID to poll, or None when the variant was cached; raises
+    ``Overloaded`` when too many requests are already waiting.
+    """
+    source_language = st.session_state.plan_language
+    source = session_store.get(st.session_state.plan_variants.get(source_language))
+    if source is None:
+        st.session_state.translation_errors[language] = "the original plan is no longer available"
+        return None
+    structured = st.session_state.plan_mode == 'structured'
+    key = translation_cache_key(source, source_language, language, PLAN_MODEL)
+    cached = plan_cache.get(key)
+    if cached is not None:
+        store_plan(cached, language)
+        count('fitbot_translations_total', status='cached')
+        return None
+    
+    user_data = current_profile()
+    cost = (1, count_message_tokens(translation_messages(source, language, structured)) + translation_max_tokens(source))
+    job = job_queue.submit(
+        key, lambda job: run_translation_job(job, source, language, structured, user_data, key),
+        cost=cost
+    )
+    st.session_state.translation_target = language
+    return job.id
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def show_plan_progress(generating_label: str, language: str):
+    """Poll the session's plan job, showing the plan as it streams in"""
+    job = job_queue.get(st.session_state.plan_job_id)
+    if job is None or job.done:
+        if job is not None and job.status == 'done':
+            # The plan is in the language it was requested in, even if the
+            # sidebar was switched while it was generating; the main script
+            # then translates it
+            store_plan(job.result, st.session_state.plan_language)
+            remember_plan(job.result, st.session_state.plan_language)
+        else:
+            error = job.error if job is not None else "the generation job expired"
+            st.session_state.plan_ref = None
+            st.session_state.plan_error = f"❌ Error generating fitness plan: {error}"
+        st.session_state.plan_job_id = None
+        st.session_state.plan_generated = True
+        safe_rerun()
+        return
+    
+    show_queue_position(job, language)
+    st.progress(job.progress, text=generating_label)
+    if job.text:
+        st.markdown(job.text)
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def show_translation_progress(translating_label: str, language: str):
+    """Poll the session's translation job; the current plan stays on screen meanwhile"""
+    job = job_queue.get(st.session_state.translation_job_id)
+    if job is None or job.done:
+        target = st.session_state.translation_target
+        st.session_state.translation_job_id = None
+        if job is not None and job.status == 'done':
+            if target == language:
+                store_plan(job.result, target)
+            else:
+                st.session_state.plan_variants[target] = session_store.put(job.result)
+        else:
+            st.session_state.translation_errors[target] = job.error if job is not None else "the translation job expired"
+        safe_rerun()
+        return
+    
+    show_queue_position(job, language)
+    st.progress(job.progress, text=translating_label)
+
+def plan_export_keys(language: str) -> Dict[str, str]:
+    """Export cache key of the plan being shown, per download format
+    
+    Keyed on the plan's content reference, so looking downloads up never
+    renders the plan.
+    """
+    week_start = next_week_start(datetime.now().date())
+    return {
+        fmt: export_key(st.session_state.plan_ref, fmt, language, week_start if fmt == 'ics' else None)
+        for fmt in EXPORT_FORMATS
+    }
+
+def run_export_job(key: str, fmt: str, render) -> str:
+    """Render a large export on a background worker and cache it"""
+    export_cache.put(key, fmt, render())
+    count('fitbot_exports_total', format=fmt, mode='background')
+    return key
+
+def prepare_exports(language: str) -> List[str]:
+    """Make sure every download of the plan being shown is cached
+    
+    Small plans are rendered straight away; larger ones are rendered on a
+    background worker so the rerun never waits on them. Returns the IDs of
+    export jobs that are still running.
+    """
+    if st.session_state.plan_error:
+        return []
+    missing = {fmt: key for fmt, key in plan_export_keys(language).items() if not export_cache.has(key)}
+    if not missing:
+        return []
+    text = current_plan_text()
+    render = functools.partial(
+        render_export, plan=text, title=CONTENT[language]['export_title'], language=language,
+        structured=current_structured_plan(), training_days=current_profile().get('training_days'),
+        week_start=next_week_start(datetime.now().date())
+    )
+    pending = []
+    for fmt, key in missing.items():
+        if len(text.encode('utf-8')) <= EXPORT_INLINE_BYTES:
+            with stage('export'):
+                export_cache.put(key, fmt, render(fmt))
+            count('fitbot_exports_total', format=fmt, mode='inline')
+            continue
+        job = job_queue.submit(f"export:{key}",
+                               lambda job, key=key, fmt=fmt: run_export_job(key, fmt, functools.partial(render, fmt)))
+        if not job.done:
+            pending.append(job.id)
+    return pending
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def show_export_progress(preparing_label: str, job_ids: List[str]):
+    """Poll background export jobs and rerun once their downloads are ready"""
+    jobs = [job_queue.get(job_id) for job_id in job_ids]
+    if any(job is not None and not job.done for job in jobs):
+        st.caption(preparing_label)
+        return
+    errors = [job.error for job in jobs if job is not None and job.status != 'done']
+    if errors:
+        st.warning(f"⚠️ Could not prepare your downloads: {errors[0]}")
+        return
+    safe_rerun()
+
+def show_queue_position(job: Job, language: str):
+    """Tell the user where a job waiting for the rate limits is in line"""
+    queued = job_queue.queue_position(job)
+    if queued:
+        position, eta = queued
+        st.info(CONTENT[language]['queued'].format(position=position, eta=max(1, round(eta))))
+
+def show_profile_summary(user_data: Dict[str, Any]):
+    """Collapsible summary of the submitted profile and its metrics"""
+    with stage('profile_summary'), st.expander("👤 Your Profile Summary", expanded=False):
+        col1, col2, col3, col4 = st.columns(4)
+        
+        with col1:
+            st.markdown(f'<div class="metric-card"><strong>Weight</strong><br>{user_data["weight"]}</div>', 
+                      unsafe_allow_html=True)
+        with col2:
+            st.markdown(f'<div class="metric-card"><strong>Height</strong><br>{user_data["height"]}</div>', 
+                      unsafe_allow_html=True)
+        with col3:
+            st.markdown(f'<div class="metric-card"><strong>Age</strong><br>{user_data["age"]}</div>', 
+                      unsafe_allow_html=True)
+        with col4:
+            st.markdown(f'<div class="metric-card"><strong>Goal</strong><br>{user_data["goal"]}</div>', 
+                      unsafe_allow_html=True)
+        
+        # Locally calculated metrics, the same values the plan was given
+        metrics = compute_metrics(user_data)
+        if metrics:
+            col1, col2, col3, col4 = st.columns(4)
             
-            return response.choices[0].message.content.strip()
-            
-    except Exception as e:
-        error_msg = f"❌ Error generating fitness plan: {str(e)}"
-        st.error(error_msg)
-        return error_msg
+            with col1:
+                st.markdown(f'<div class="metric-card"><strong>BMI</strong><br>{metrics["bmi"]} ({metrics["bmi_category"]})</div>', 
+                          unsafe_allow_html=True)
+            with col2:
+                st.markdown(f'<div class="metric-card"><strong>Maintenance</strong><br>{metrics["tdee"]} kcal</div>', 
+                          unsafe_allow_html=True)
+            with col3:
+                st.markdown(f'<div class="metric-card"><strong>Daily Target</strong><br>{metrics["calorie_target"]} kcal</div>', 
+                          unsafe_allow_html=True)
+            with col4:
+                st.markdown(f'<div class="metric-card"><strong>Macros (P/C/F)</strong><br>{metrics["protein_g"]}g / {metrics["carbs_g"]}g / {metrics["fat_g"]}g</div>', 
+                          unsafe_allow_html=True)
+
+@st.fragment
+def show_plan_view(language: str):
+    """Profile summary and the generated plan"""
+    # Display user summary; the profile can expire from the session store
+    # before the plan does, and a summary with blanks is worse than none
+    user_data = current_profile()
+    if all(field in user_data for field in SUMMARY_FIELDS):
+        show_profile_summary(user_data)
+    
+    # Display the fitness plan
+    with stage('render_plan'):
+        st.markdown('<div class="plan-section">', unsafe_allow_html=True)
+        plan = current_structured_plan()
+        if plan is not None:
+            # Only the selected section is rendered and sent; tabs and
+            # expanders would ship every section's content up front
+            titles = section_titles(language)
+            section = st.radio("📑 Plan section", options=STRUCTURED_SECTIONS, format_func=titles.get,
+                               horizontal=True, label_visibility="collapsed")
+            st.markdown(f"## {titles[section]}")
+            st.markdown(render_section(plan, section, language))
+        else:
+            st.markdown(current_plan_text())
+        st.markdown('</div>', unsafe_allow_html=True)
+
+@st.fragment
+def show_plan_actions(language: str):
+    """Download, summary and tips buttons below the plan"""
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        if not st.session_state.plan_error:
+            with st.popover("⬇️ Download Plan"):
+                # Downloads are served from the export cache; formats still
+                # rendering in the background show as disabled
+                for fmt, key in plan_export_keys(language).items():
+                    data = export_cache.get(key)
+                    if data is None:
+                        st.button(EXPORT_LABELS[fmt], key=f"export_{fmt}", disabled=True,
+                                  help=CONTENT[language]['preparing_exports'])
+                    else:
+                        st.download_button(EXPORT_LABELS[fmt], data=data, file_name=export_file_name(fmt),
+                                           mime=EXPORT_FORMATS[fmt][1], key=f"export_{fmt}")
+    
+    with col2:
+        if st.button("📊 View Plan Summary"):
+            st.info("📈 Plan Summary: Your personalized fitness journey starts here!")
+    
+    with col3:
+        if st.button("💡 Get Tips"):
+            tips = [
+                "💧 Stay hydrated - aim for 8 glasses of water daily",
+                "😴 Get 7-9 hours of sleep for optimal recovery",
+                "📱 Track your progress with photos and measurements",
+                "🥗 Prep your meals in advance for consistency",
+                "👥 Find a workout buddy for accountability"
+            ]
+            tip = random.choice(tips)
+            st.success(f"💡 **Tip:** {tip}")
 
 def main():
     # Initialize session state
-    if 'user_data' not in st.session_state:
-        st.session_state.user_data = {}
-    if 'fitness_plan' not in st.session_state:
-        st.session_state.fitness_plan = ""
+    # Only references and flags live in session state; plan bodies and
+    # profiles are in the session store
+    if 'profile_ref' not in st.session_state:
+        st.session_state.profile_ref = None
+    if 'plan_ref' not in st.session_state:
+        st.session_state.plan_ref = None
+        st.session_state.plan_error = None
     if 'plan_generated' not in st.session_state:
         st.session_state.plan_generated = False
     if 'reset_form' not in st.session_state:
         st.session_state.reset_form = False
     if 'generate_new' not in st.session_state:
         st.session_state.generate_new = False
+    if 'plan_job_id' not in st.session_state:
+        st.session_state.plan_job_id = None
+    if 'plan_mode' not in st.session_state:
+        st.session_state.plan_mode = 'full'
+    if 'plan_language' not in st.session_state:
+        st.session_state.plan_language = None
+        st.session_state.translation_target = None
+        clear_plan_variants()
+    if 'plan_history_id' not in st.session_state:
+        # Reloading a page whose URL carries a history token shows its latest plan
+        st.session_state.plan_history_id = None
+        owner = history_owner(create=False)
+        latest = plan_history.latest(owner) if owner else None
+        if latest is not None:
+            restore_plan(latest)
     
     # Sidebar for language and settings
     with st.sidebar:
@@ -286,11 +1060,25 @@ def main():
         language = LANGUAGES[selected_language]
         content = CONTENT[language]
         
+        default_mode = os.getenv("FITBOT_GENERATION_MODE", "full")
+        mode_labels = list(GENERATION_MODES.keys())
+        selected_mode = st.selectbox(
+            "⚙️ Generation Mode",
+            options=mode_labels,
+            index=list(GENERATION_MODES.values()).index(default_mode) if default_mode in GENERATION_MODES.values() else 0,
+            help="Parallel sections requests the five plan sections concurrently; "
+                 "quick plans personalize a precomputed plan skeleton; "
+                 "structured plans come back as JSON and render one section at a time"
+        )
+        generation_mode = GENERATION_MODES[selected_mode]
+        
         st.markdown("---")
         st.markdown("### 📊 Your Progress")
         if st.session_state.plan_generated:
             st.success("✅ Plan Generated!")
             st.info("📅 Plan created: " + datetime.now().strftime("%Y-%m-%d %H:%M"))
+        elif st.session_state.plan_job_id:
+            st.info(content['generating'])
         else:
             st.info("📝 Fill out the form to get started")
         
@@ -299,16 +1087,24 @@ def main():
         
         # Reset form button
         if st.button("🔄 Reset Form"):
-            st.session_state.user_data = {}
-            st.session_state.fitness_plan = ""
+            st.session_state.profile_ref = None
+            st.session_state.plan_ref = None
+            st.session_state.plan_error = None
             st.session_state.plan_generated = False
+            job_queue.cancel(st.session_state.plan_job_id)
+            st.session_state.plan_job_id = None
+            st.session_state.plan_history_id = None
+            clear_plan_variants()
+            forget_history_owner()
             st.session_state.reset_form = True
         
         # Generate new plan button
         if st.session_state.plan_generated:
             if st.button("📄 Generate New Plan"):
-                st.session_state.fitness_plan = ""
+                st.session_state.plan_ref = None
+                st.session_state.plan_error = None
                 st.session_state.plan_generated = False
+                clear_plan_variants()
                 st.session_state.generate_new = True
         
         # Handle resets without using rerun
@@ -318,52 +1114,85 @@ def main():
         
         if st.session_state.generate_new:
             st.session_state.generate_new = False
-            st.info("📝 Please fill out the form to generate a new plan.")
+            st.info("📝 Edit your answers below; only the parts of your plan they affect are rewritten.")
+        
+        cache_stats = plan_cache.stats()
+        st.caption(f"⚡ Plan cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses")
+        job_stats = job_queue.stats()
+        st.caption(f"🧵 Jobs: {job_stats['running']} running / {job_stats['queued']} queued, "
+                   f"{job_stats['deduplicated']} shared, {job_stats.get('rejected', 0)} turned away")
+        store_stats = session_store.stats()
+        ctx = get_script_run_ctx()
+        session_usage = session_store.usage(ctx.session_id) if ctx else {'state_bytes': 0}
+        st.caption(f"🧠 Sessions: {store_stats['sessions']} active, this one {session_usage['state_bytes']} B; "
+                   f"{store_stats['memory_bytes'] // 1024} KB of plans in memory, {store_stats['disk_bytes'] // 1024} KB on disk")
+        if transport is not None and transport.degraded():
+            st.caption("🛟 AI service is having trouble; answering with the backup model")
     
     # Main content area
     st.markdown(f'<h1 class="main-header">{content["welcome"]}</h1>', unsafe_allow_html=True)
     st.markdown(f'<h2 style="text-align: center; color: #666;">{content["subtitle"]}</h2>', unsafe_allow_html=True)
+    if transport is None:
+        st.error("⚠️ OpenAI API key not found! Please set OPENAI_API_KEY in your .env file")
     st.markdown(f'<p style="text-align: center; font-size: 1.2rem; margin-bottom: 2rem;">{content["description"]}</p>', unsafe_allow_html=True)
     
     # Show motivational message
-    import random
     motivational_msg = random.choice(content['motivational_messages'])
     st.markdown(f'<div class="fitness-card">{motivational_msg}</div>', unsafe_allow_html=True)
     
+    # Plan being generated in the background
+    if st.session_state.plan_job_id and not st.session_state.plan_generated:
+        show_plan_progress(content['generating'], language)
+    
     # Main form
-    if not st.session_state.plan_generated:
+    if not st.session_state.plan_generated and not st.session_state.plan_job_id:
         st.markdown(f'<h2 class="sub-header">{content["form_title"]}</h2>', unsafe_allow_html=True)
         
+        # Editing a plan starts from the previous answers
+        previous = current_profile()
+        
+        def answer(field: str) -> str:
+            value = previous.get(field, '')
+            return '' if value == 'None' else value
+        
+        def option_index(options: List[str], value: Any) -> int:
+            return options.index(value) if value in options else 0
+        
         with st.form("fitness_form"):
             col1, col2 = st.columns(2)
             
             with col1:
-                weight = st.text_input(content['questions']['weight'], 
+                weight = st.text_input(content['questions']['weight'], value=answer('weight'),
                                      placeholder="e.g., 70kg or 154lbs")
-                height = st.text_input(content['questions']['height'], 
+                height = st.text_input(content['questions']['height'], value=answer('height'),
                                      placeholder="e.g., 175cm or 5'9\"")
                 age = st.number_input(content['questions']['age'], 
-                                    min_value=13, max_value=100, value=25)
+                                    min_value=13, max_value=100, value=previous.get('age', 25))
                 gender = st.selectbox(content['questions']['gender'], 
-                                    ["Male", "Female", "Other"])
+                                    ["Male", "Female", "Other"],
+                                    index=option_index(["Male", "Female", "Other"], previous.get('gender')))
                 activity_level = st.selectbox(content['questions']['activity_level'], 
-                                            list(content['activity_levels'].values()))
+                                            list(content['activity_levels'].values()),
+                                            index=option_index(list(content['activity_levels']), previous.get('activity_level')))
             
             with col2:
                 goal = st.selectbox(content['questions']['goal'], 
-                                  list(content['goals'].values()))
-                diet_restrictions = st.text_area(content['questions']['diet_restrictions'], 
+                                  list(content['goals'].values()),
+                                  index=option_index(list(content['goals']), previous.get('goal')))
+                diet_restrictions = st.text_area(content['questions']['diet_restrictions'], value=answer('diet_restrictions'),
                                                placeholder="e.g., vegetarian, lactose intolerant, none")
                 training_days = st.number_input(content['questions']['training_days'], 
-                                              min_value=1, max_value=7, value=3)
+                                              min_value=1, max_value=7, value=previous.get('training_days', 3))
                 workout_pref = st.selectbox(content['questions']['workout_pref'], 
-                                          list(content['workout_prefs'].values()))
+                                          list(content['workout_prefs'].values()),
+                                          index=option_index(list(content['workout_prefs']), previous.get('workout_pref')))
                 
                 # Add some additional optional fields
                 st.markdown("**Optional Information:**")
                 experience_level = st.selectbox("Fitness Experience Level", 
-                                              ["Beginner", "Intermediate", "Advanced"])
-                injuries = st.text_input("Any injuries or physical limitations?", 
+                                              ["Beginner", "Intermediate", "Advanced"],
+                                              index=option_index(["Beginner", "Intermediate", "Advanced"], previous.get('experience_level')))
+                injuries = st.text_input("Any injuries or physical limitations?", value=answer('injuries'),
                                        placeholder="e.g., knee injury, back problems, none")
             
             submitted = st.form_submit_button("🚀 Generate My Fitness Plan", use_container_width=True)
@@ -374,11 +1203,11 @@ def main():
                     st.error("⚠️ Please fill in your weight and height!")
                 else:
                     # Store user data
-                    activity_key = [k for k, v in content['activity_levels'].items() if v == activity_level][0]
-                    goal_key = [k for k, v in content['goals'].items() if v == goal][0]
-                    workout_key = [k for k, v in content['workout_prefs'].items() if v == workout_pref][0]
+                    activity_key = LABEL_KEYS[language]['activity_levels'][activity_level]
+                    goal_key = LABEL_KEYS[language]['goals'][goal]
+                    workout_key = LABEL_KEYS[language]['workout_prefs'][workout_pref]
                     
-                    st.session_state.user_data = {
+                    user_data = {
                         'weight': weight,
                         'height': height,
                         'age': age,
@@ -391,80 +1220,56 @@ def main():
                         'experience_level': experience_level,
                         'injuries': injuries if injuries else 'None'
                     }
+                    store_profile(user_data)
                     
-                    # Generate fitness plan
-                    with st.spinner(content['generating']):
-                        progress_bar = st.progress(0)
-                        for i in range(100):
-                            time.sleep(0.01)
-                            progress_bar.progress(i + 1)
-                        
-                        st.session_state.fitness_plan = generate_fitness_plan(
-                            st.session_state.user_data, language
+                    # Generate fitness plan in the background; the page polls the job
+                    try:
+                        st.session_state.plan_job_id = request_plan(
+                            user_data, language, mode=generation_mode,
+                            base=plan_history.get(st.session_state.plan_history_id)
                         )
-                        st.session_state.plan_generated = True
+                    except Overloaded:
+                        # Rejected up front so the user can retry instead of waiting to time out
+                        st.error(content['overloaded'])
+                    else:
+                        st.session_state.plan_generated = st.session_state.plan_job_id is None
                         safe_rerun()
     
+    # Follow the sidebar language: switch to a stored variant, or translate
+    # the plan once instead of generating a new one
+    if st.session_state.plan_generated and st.session_state.plan_variants:
+        if st.session_state.plan_shown_language != language:
+            if language in st.session_state.plan_variants:
+                show_plan_variant(language)
+            elif not st.session_state.translation_job_id and language not in st.session_state.translation_errors:
+                try:
+                    st.session_state.translation_job_id = request_translation(language)
+                except Overloaded:
+                    st.warning(content['overloaded'])
+        if st.session_state.translation_job_id and st.session_state.translation_target == language:
+            show_translation_progress(content['translating'], language)
+        elif language in st.session_state.translation_errors:
+            st.warning(f"⚠️ Could not translate your plan: {st.session_state.translation_errors[language]}")
+    
     # Display fitness plan
-    if st.session_state.plan_generated and st.session_state.fitness_plan:
+    if st.session_state.plan_generated and (st.session_state.plan_ref or st.session_state.plan_error):
         st.markdown(f'<h2 class="sub-header">{content["plan_ready"]}</h2>', unsafe_allow_html=True)
         
-        # Display user summary
-        with st.expander("👤 Your Profile Summary", expanded=False):
-            col1, col2, col3, col4 = st.columns(4)
-            
-            with col1:
-                st.markdown(f'<div class="metric-card"><strong>Weight</strong><br>{st.session_state.user_data["weight"]}</div>', 
-                          unsafe_allow_html=True)
-            with col2:
-                st.markdown(f'<div class="metric-card"><strong>Height</strong><br>{st.session_state.user_data["height"]}</div>', 
-                          unsafe_allow_html=True)
-            with col3:
-                st.markdown(f'<div class="metric-card"><strong>Age</strong><br>{st.session_state.user_data["age"]}</div>', 
-                          unsafe_allow_html=True)
-            with col4:
-                st.markdown(f'<div class="metric-card"><strong>Goal</strong><br>{st.session_state.user_data["goal"]}</div>', 
-                          unsafe_allow_html=True)
-        
-        # Display the fitness plan
-        st.markdown('<div class="plan-section">', unsafe_allow_html=True)
-        st.markdown(st.session_state.fitness_plan)
-        st.markdown('</div>', unsafe_allow_html=True)
-        
-        # Action buttons
-        col1, col2, col3 = st.columns(3)
-        
-        with col1:
-            if st.button("📋 Copy Plan to Clipboard"):
-                try:
-                    # Try to copy to clipboard (requires pyperclip)
-                    import pyperclip
-                    pyperclip.copy(st.session_state.fitness_plan)
-                    st.success("✅ Plan copied to clipboard!")
-                except ImportError:
-                    st.info("📋 Copy the plan text manually from above")
-        
-        with col2:
-            if st.button("📊 View Plan Summary"):
-                st.info("📈 Plan Summary: Your personalized fitness journey starts here!")
-        
-        with col3:
-            if st.button("💡 Get Tips"):
-                tips = [
-                    "💧 Stay hydrated - aim for 8 glasses of water daily",
-                    "😴 Get 7-9 hours of sleep for optimal recovery",
-                    "📱 Track your progress with photos and measurements",
-                    "🥗 Prep your meals in advance for consistency",
-                    "👥 Find a workout buddy for accountability"
-                ]
-                tip = random.choice(tips)
-                st.success(f"💡 **Tip:** {tip}")
+        # Plan view and action bar rerun on their own, so a button click
+        # only re-executes (and re-sends) its fragment
+        show_plan_view(language)
+        export_jobs = prepare_exports(language)
+        show_plan_actions(language)
+        if export_jobs:
+            show_export_progress(content['preparing_exports'], export_jobs)
         
         # Show another motivational message
         st.markdown("---")
         final_motivation = random.choice(content['motivational_messages'])
         st.markdown(f'<div class="goal-card">{final_motivation}</div>', unsafe_allow_html=True)
 
+    track_session()
+    
     # Footer
     st.markdown("---")
     st.markdown("""
@@ -473,7 +1278,12 @@ def main():
         <p><small>⚠️ Always consult with healthcare professionals before starting any new fitness program.</small></p>
     </div>
     """, unsafe_allow_html=True)
+    
+    warm_up_openai()
 
 if __name__ == "__main__":
 
-    main()
+    try:
+        main()
+    finally:
+        end_rerun(rerun_trace)
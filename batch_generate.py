@@ -0,0 +1,259 @@
+"""Headless batch generation of fitness plans from profile files
+
+Reads member profiles from JSONL or CSV, generates a plan for each with
+the same prompts as the Streamlit app, and appends results to a JSONL
+file. Rows already written successfully are skipped on rerun, so an
+interrupted job resumes where it stopped and failed rows are retried.
+
+    python batch_generate.py members.csv plans.jsonl --workers 8
+    python batch_generate.py members.jsonl plans.jsonl --base-url http://127.0.0.1:8765/v1
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+from dotenv import load_dotenv
+from openai import OpenAI
+
+from fitness_metrics import compute_profile_metrics
+from plan_cache import PlanCache, plan_cache_key
+from plan_prompts import PLAN_MAX_TOKENS, PLAN_MODEL, PROMPT_VERSION, plan_messages
+from token_budget import UsageStore, fit_messages
+
+INT_FIELDS = ('age', 'training_days')
+LANGUAGES = ('english', 'spanish')
+# Profiles are scored with the vectorized metrics engine in chunks this size
+METRICS_CHUNK_SIZE = 512
+
+def read_profiles(path: str, default_language: str = 'english') -> Iterator[Dict[str, Any]]:
+    """Yield profiles from a JSONL or CSV file, each with an ``id`` and ``language``
+    
+    Rows without an ``id`` column are identified by their 1-based row number.
+    Rows that cannot be parsed, or ask for an unsupported language, are
+    yielded with an ``error`` instead of stopping the file.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.lower().endswith('.csv'):
+            rows = csv.DictReader(f)
+        else:
+            rows = (line for line in f if line.strip())
+        for number, row in enumerate(rows, start=1):
+            if isinstance(row, str):
+                try:
+                    row = json.loads(row)
+                except json.JSONDecodeError as e:
+                    yield {'id': str(number), 'language': default_language, 'error': f"invalid profile: {e}"}
+                    continue
+            profile = {k: v for k, v in row.items() if v not in (None, '')}
+            profile['id'] = str(profile.get('id', number))
+            profile['language'] = profile.get('language', default_language)
+            if profile['language'] not in LANGUAGES:
+                profile['error'] = f"invalid profile: unsupported language {profile['language']!r}"
+                yield profile
+                continue
+            for field in INT_FIELDS:
+                if field in profile:
+                    try:
+                        profile[field] = int(profile[field])
+                    except (TypeError, ValueError):
+                        profile['error'] = f"invalid profile: {field} must be a whole number, got {profile[field]!r}"
+                        break
+            yield profile
+
+def completed_ids(output_path: str) -> Set[str]:
+    """IDs already written successfully to the output file
+    
+    A truncated last line from a crash is ignored, so that row is redone.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if not record.get('error'):
+                done.add(record['id'])
+    return done
+
+def _chunked(profiles: Iterator[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    while True:
+        chunk = list(islice(profiles, size))
+        if not chunk:
+            return
+        yield chunk
+
+def generate_plan_record(client: OpenAI, profile: Dict[str, Any], cache: Optional[PlanCache] = None,
+                         metrics: Optional[Dict[str, Any]] = None,
+                         usage_store: Optional[UsageStore] = None) -> Dict[str, Any]:
+    """Generate one plan and describe the outcome as an output record
+
+    Any failure, from the request to saving the result, becomes the
+    record's ``error`` so one bad profile does not stop the batch.
+    """
+    user_data = {k: v for k, v in profile.items() if k not in ('id', 'language')}
+    language = profile['language']
+    record = {'id': profile['id'], 'language': language, 'metrics': metrics}
+    key = plan_cache_key(user_data, language, PLAN_MODEL, PROMPT_VERSION)
+    
+    started = time.perf_counter()
+    try:
+        cached = cache.get(key) if cache else None
+        if cached is not None:
+            record.update(plan=cached, cached=True, usage=None, latency_s=round(time.perf_counter() - started, 4))
+            return record
+        
+        max_tokens = PLAN_MAX_TOKENS
+        if usage_store:
+            max_tokens = usage_store.adaptive_max_tokens('plan', language, user_data.get('goal', ''), PLAN_MAX_TOKENS)
+        response = client.chat.completions.create(
+            model=PLAN_MODEL,
+            messages=fit_messages(plan_messages(user_data, language, metrics)),
+            max_tokens=max_tokens,
+            temperature=0.7
+        )
+        
+        latency = time.perf_counter() - started
+        content = response.choices[0].message.content
+        if not content:
+            raise ValueError(f"empty plan (finish_reason={response.choices[0].finish_reason})")
+        plan = content.strip()
+        if cache:
+            cache.put(key, plan)
+        if usage_store and response.usage:
+            usage_store.record(
+                'plan', language, user_data.get('goal', ''), PLAN_MODEL,
+                prompt_tokens=response.usage.prompt_tokens,
+                completion_tokens=response.usage.completion_tokens,
+                max_tokens=max_tokens,
+                finish_reason=response.choices[0].finish_reason,
+                latency_s=latency
+            )
+        record.update(
+            plan=plan,
+            cached=False,
+            finish_reason=response.choices[0].finish_reason,
+            usage=response.usage.model_dump() if response.usage else None,
+            latency_s=round(latency, 4)
+        )
+    except Exception as e:
+        record.update(error=str(e) or type(e).__name__, latency_s=round(time.perf_counter() - started, 4))
+    return record
+
+class BatchStats:
+    """Running totals for throughput reporting"""
+    
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.succeeded = 0
+        self.failed = 0
+        self.cached = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+    
+    def add(self, record: Dict[str, Any]):
+        with self._lock:
+            if record.get('error'):
+                self.failed += 1
+                return
+            self.succeeded += 1
+            self.cached += bool(record.get('cached'))
+            self.completion_tokens += (record.get('usage') or {}).get('completion_tokens', 0)
+    
+    def summary(self) -> Dict[str, Any]:
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return {
+            'succeeded': self.succeeded,
+            'failed': self.failed,
+            'cached': self.cached,
+            'elapsed_s': round(elapsed, 2),
+            'plans_per_min': round(self.succeeded / elapsed * 60, 2),
+            'tokens_per_s': round(self.completion_tokens / elapsed, 2)
+        }
+
+def run_batch(input_path: str, output_path: str, client: OpenAI, workers: int = 4,
+              max_in_flight: Optional[int] = None, language: str = 'english',
+              cache: Optional[PlanCache] = None, progress_every: int = 25,
+              usage_store: Optional[UsageStore] = None) -> Dict[str, Any]:
+    """Generate plans for every pending profile and append them to the output
+    
+    At most ``max_in_flight`` profiles (default: twice the worker count) are
+    queued at once, so huge input files are streamed rather than loaded.
+    """
+    max_in_flight = max_in_flight or workers * 2
+    done = completed_ids(output_path)
+    stats = BatchStats()
+    write_lock = threading.Lock()
+    
+    with open(output_path, 'a', encoding='utf-8') as out, ThreadPoolExecutor(max_workers=workers) as pool:
+        def record_result(record: Dict[str, Any]):
+            with write_lock:
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                os.fsync(out.fileno())
+            stats.add(record)
+            processed = stats.succeeded + stats.failed
+            if progress_every and processed % progress_every == 0:
+                print(f"📈 {processed} done | {stats.summary()}", file=sys.stderr)
+        
+        pending = set()
+        todo = (profile for profile in read_profiles(input_path, language) if profile['id'] not in done)
+        for chunk in _chunked(todo, METRICS_CHUNK_SIZE):
+            # Unreadable rows are written as failed records (and retried on the next run)
+            for profile in chunk:
+                if profile.get('error'):
+                    record_result({'id': profile['id'], 'language': profile['language'], 'error': profile['error']})
+            chunk = [profile for profile in chunk if not profile.get('error')]
+            for profile, metrics in zip(chunk, compute_profile_metrics(chunk)):
+                if len(pending) >= max_in_flight:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        record_result(future.result())
+                pending.add(pool.submit(generate_plan_record, client, profile, cache, metrics, usage_store))
+        for future in wait(pending).done:
+            record_result(future.result())
+    
+    summary = stats.summary()
+    summary['skipped'] = len(done)
+    return summary
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Generate fitness plans for a file of member profiles")
+    parser.add_argument("input", help="Profiles as .jsonl or .csv")
+    parser.add_argument("output", help="JSONL output file (appended to; existing rows are skipped)")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent API requests")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="Profiles queued at once (default: 2x workers)")
+    parser.add_argument("--language", choices=LANGUAGES, default="english",
+                        help="Plan language for rows without a language column")
+    parser.add_argument("--base-url", default=os.getenv("OPENAI_BASE_URL"), help="API base URL, e.g. a local mock server")
+    parser.add_argument("--use-cache", action="store_true", help="Serve and fill the persistent plan cache")
+    parser.add_argument("--no-usage", action="store_true", help="Do not record token usage or adapt max_tokens")
+    args = parser.parse_args()
+    
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        parser.error("OPENAI_API_KEY is not set")
+    client = OpenAI(api_key=api_key, base_url=args.base_url, max_retries=2)
+    
+    summary = run_batch(
+        args.input, args.output, client,
+        workers=args.workers,
+        max_in_flight=args.max_in_flight,
+        language=args.language,
+        cache=PlanCache() if args.use_cache else None,
+        usage_store=None if args.no_usage else UsageStore()
+    )
+    print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    main()
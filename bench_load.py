@@ -0,0 +1,444 @@
+"""Load and latency benchmark for the Streamlit app
+
+Starts the local mock OpenAI server and ``streamlit run app.py`` against
+it, then drives real websocket sessions (the same protocol the browser
+speaks) at increasing concurrency. Each session loads the page, submits
+the profile form with a unique weight so the plan cache never hits, and
+clicks an action button once the plan is shown.
+
+Per concurrency level it reports rerun latency, submit-to-first-token,
+submit-to-complete, server RSS per connected session and plan throughput,
+writes everything to a JSON file, and fails (exit code 1) when results
+break the absolute thresholds or regress against a baseline run. Needs the
+``websockets`` package.
+
+    python bench_load.py --concurrency 1,10,50 --output bench_results.json
+    python bench_load.py --baseline bench_results.json --max-regression 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from typing import Any, Dict, List, Optional
+
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+from mock_openai_server import start_mock_server
+
+WEIGHT_LABEL = "Current Weight (kg or lbs)"
+HEIGHT_LABEL = "Height (e.g., 5'8\" or 175cm)"
+SUBMIT_LABEL = "🚀 Generate My Fitness Plan"
+ACTION_LABEL = "💡 Get Tips"
+# Text that marks the first streamed token (the mock's filler) and a finished plan
+FIRST_TOKEN_MARKER = "Focus on compound"
+PLAN_READY_MARKER = "Fitness Plan is Ready"
+# Failed generations and requests turned away by admission control
+ERROR_MARKERS = ("Error generating", "at capacity")
+
+FINISHED_EARLY_FOR_RERUN = ForwardMsg.ScriptFinishedStatus.Value('FINISHED_EARLY_FOR_RERUN')
+# Longest a single interaction may take before the session gives up
+INTERACTION_TIMEOUT = 120.0
+DEFAULT_THRESHOLDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_thresholds.json")
+
+# Lower is better for every compared metric except these
+HIGHER_IS_BETTER = ('plans_per_min',)
+COMPARED_METRICS = (
+    'load_ms.p95', 'interaction_ms.p95', 'interaction_kb.p50', 'first_token_ms.p50', 'first_token_ms.p95',
+    'complete_ms.p50', 'complete_ms.p95', 'rss_per_session_mb', 'plans_per_min'
+)
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile; None for no values"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        'count': len(values),
+        'p50': _round(percentile(values, 50)),
+        'p95': _round(percentile(values, 95)),
+        'max': _round(max(values) if values else None)
+    }
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 1) if value is not None else None
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def read_rss_mb(pid: int) -> float:
+    """Resident set size of a process in MB (Linux ``/proc``; 0 elsewhere)"""
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+class StreamlitSession:
+    """One browser tab talking to the app over the Streamlit websocket"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.conn = None
+        self.widgets: Dict[str, str] = {}
+        # Fragment each widget was rendered in ("" for the main script)
+        self.widget_fragments: Dict[str, str] = {}
+        # Fragments the app asked to rerun on a timer, as fragment_id -> interval
+        self.auto_reruns: Dict[str, float] = {}
+
+    async def connect(self):
+        self.conn = await websockets.connect(self.url, subprotocols=["streamlit"], max_size=None)
+
+    async def close(self):
+        if self.conn is not None:
+            await self.conn.close()
+
+    async def _send_rerun(self, states: List[WidgetState] = (), fragment_id: str = "",
+                          is_auto_rerun: bool = True):
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        msg.rerun_script.page_script_hash = ""
+        msg.rerun_script.widget_states.widgets.extend(states)
+        if fragment_id:
+            msg.rerun_script.fragment_id = fragment_id
+            msg.rerun_script.is_auto_rerun = is_auto_rerun
+        await self.conn.send(msg.SerializeToString())
+
+    async def click(self, label: str) -> Dict[str, Any]:
+        """Press a button, rerunning only its fragment when it lives in one"""
+        return await self.rerun([self.widget(label, trigger_value=True)],
+                                fragment_id=self.widget_fragments.get(self.widgets[label], ""))
+
+    async def rerun(self, states: List[WidgetState] = (), until_ready: bool = False,
+                    fragment_id: str = "") -> Dict[str, Any]:
+        """Trigger a script run and wait for it to finish
+
+        With ``until_ready`` it keeps polling auto-rerunning fragments, as the
+        browser does, until the finished plan (or an error) is shown. Returns
+        the elapsed milliseconds to the first rendered element, to the first
+        streamed token, to the finished plan and to the end of the last run,
+        the bytes received, and whether an error was shown.
+        """
+        started = time.perf_counter()
+        await self._send_rerun(states, fragment_id, is_auto_rerun=False)
+        running = True
+
+        result = {'first_paint_ms': None, 'first_token_ms': None, 'ready_ms': None, 'finished_ms': None,
+                  'bytes': 0, 'error': False}
+        while True:
+            if time.perf_counter() - started > INTERACTION_TIMEOUT:
+                raise TimeoutError("interaction did not finish in time")
+            timeout = None
+            if not running:
+                if not self.auto_reruns:
+                    return result
+                fragment_id, timeout = next(iter(self.auto_reruns.items()))
+            try:
+                raw = await asyncio.wait_for(self.conn.recv(), timeout)
+            except asyncio.TimeoutError:
+                await self._send_rerun(fragment_id=fragment_id)
+                running = True
+                continue
+            elapsed = (time.perf_counter() - started) * 1000
+            result['bytes'] += len(raw)
+            fmsg = ForwardMsg()
+            fmsg.ParseFromString(raw)
+            kind = fmsg.WhichOneof("type")
+            if kind == "delta" and fmsg.delta.WhichOneof("type") == "new_element":
+                if result['first_paint_ms'] is None:
+                    result['first_paint_ms'] = elapsed
+                self._scan_element(fmsg.delta.new_element, elapsed, result, fmsg.delta.fragment_id)
+            elif kind == "new_session" and not fmsg.new_session.fragment_ids_this_run:
+                # A full script run starts; its fragments re-register their timers
+                self.auto_reruns.clear()
+            elif kind == "auto_rerun":
+                self.auto_reruns[fmsg.auto_rerun.fragment_id] = fmsg.auto_rerun.interval
+            elif kind == "stop_auto_rerun":
+                self.auto_reruns.clear()
+            elif kind == "script_finished" and fmsg.script_finished != FINISHED_EARLY_FOR_RERUN:
+                result['finished_ms'] = elapsed
+                running = False
+                if not until_ready or result['ready_ms'] is not None or result['error']:
+                    return result
+
+    def _scan_element(self, element, elapsed: float, result: Dict[str, Any], fragment_id: str):
+        element_type = element.WhichOneof("type")
+        proto = getattr(element, element_type)
+        widget_id = getattr(proto, "id", "")
+        if widget_id:
+            self.widgets[getattr(proto, "label", "")] = widget_id
+            self.widget_fragments[widget_id] = fragment_id
+        if element_type == "markdown":
+            body = element.markdown.body
+            if result['first_token_ms'] is None and FIRST_TOKEN_MARKER in body:
+                result['first_token_ms'] = elapsed
+            if result['ready_ms'] is None and PLAN_READY_MARKER in body:
+                result['ready_ms'] = elapsed
+            if any(marker in body for marker in ERROR_MARKERS):
+                result['error'] = True
+        elif element_type == "alert" and any(marker in element.alert.body for marker in ERROR_MARKERS):
+            result['error'] = True
+
+    def widget(self, label: str, **value) -> WidgetState:
+        state = WidgetState(id=self.widgets[label])
+        for field, field_value in value.items():
+            setattr(state, field, field_value)
+        return state
+
+async def run_session(url: str, index: int, results: List[Dict[str, Any]],
+                      finished: asyncio.Event, hold: asyncio.Event):
+    """Load, submit and interact once, then stay connected until released"""
+    record: Dict[str, Any] = {'session': index, 'error': None}
+    session = StreamlitSession(url)
+    try:
+        await session.connect()
+        record['load_ms'] = (await session.rerun())['finished_ms']
+
+        # 0.5 kg apart so every session lands in its own plan-cache bucket
+        weight = f"{40 + index * 0.5:.1f}kg"
+        submit = await session.rerun([
+            session.widget(WEIGHT_LABEL, string_value=weight),
+            session.widget(HEIGHT_LABEL, string_value="175cm"),
+            session.widget(SUBMIT_LABEL, trigger_value=True)
+        ], until_ready=True)
+        record['first_token_ms'] = submit['first_token_ms']
+        record['complete_ms'] = submit['ready_ms']
+        if submit['error'] or submit['ready_ms'] is None:
+            record['error'] = "plan generation failed"
+        elif ACTION_LABEL in session.widgets:
+            interaction = await session.click(ACTION_LABEL)
+            record['interaction_ms'] = interaction['finished_ms']
+            record['interaction_kb'] = interaction['bytes'] / 1024
+    except Exception as e:
+        record['error'] = f"{type(e).__name__}: {e}"
+    results.append(record)
+    finished.set()
+    await hold.wait()
+    await session.close()
+
+async def run_level(url: str, concurrency: int, first_index: int, server_pid: int,
+                    idle_rss_mb: float) -> Dict[str, Any]:
+    """Run one concurrency level and summarize it"""
+    results: List[Dict[str, Any]] = []
+    hold = asyncio.Event()
+    events = [asyncio.Event() for _ in range(concurrency)]
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(run_session(url, first_index + i, results, events[i], hold))
+             for i in range(concurrency)]
+    for event in events:
+        await event.wait()
+    wall_s = time.perf_counter() - started
+
+    # Every session is still connected here, so RSS includes all session state
+    loaded_rss_mb = read_rss_mb(server_pid)
+    hold.set()
+    await asyncio.gather(*tasks)
+
+    def values(key: str) -> List[float]:
+        return [r[key] for r in results if r.get(key) is not None and not r['error']]
+
+    completed = len(values('complete_ms'))
+    errors = [r['error'] for r in results if r['error']]
+    return {
+        'concurrency': concurrency,
+        'wall_s': round(wall_s, 2),
+        'completed': completed,
+        'errors': len(errors),
+        'error_rate': round(len(errors) / concurrency, 3),
+        'error_samples': sorted(set(errors))[:5],
+        'plans_per_min': round(completed / wall_s * 60, 1) if wall_s else 0.0,
+        'load_ms': summarize(values('load_ms')),
+        'first_token_ms': summarize(values('first_token_ms')),
+        'complete_ms': summarize(values('complete_ms')),
+        'interaction_ms': summarize(values('interaction_ms')),
+        'interaction_kb': summarize(values('interaction_kb')),
+        'server_rss_mb': round(loaded_rss_mb, 1),
+        'rss_per_session_mb': round(max(loaded_rss_mb - idle_rss_mb, 0.0) / concurrency, 2)
+    }
+
+def metric_value(level: Dict[str, Any], dotted: str) -> Optional[float]:
+    """Look up ``complete_ms.p95``-style keys in a level summary"""
+    value: Any = level
+    for part in dotted.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+def check_thresholds(levels: List[Dict[str, Any]], thresholds: Dict[str, Any]) -> List[str]:
+    """Violations of absolute limits, applied to every level"""
+    violations = []
+    for level in levels:
+        for metric, limit in thresholds.get('limits', {}).items():
+            value = metric_value(level, metric)
+            if value is None:
+                continue
+            too_low = metric in HIGHER_IS_BETTER or metric.split(".")[0] in HIGHER_IS_BETTER
+            if (value < limit) if too_low else (value > limit):
+                violations.append(f"c={level['concurrency']}: {metric} = {value} (limit {limit})")
+    return violations
+
+def compare_baseline(levels: List[Dict[str, Any]], baseline: Dict[str, Any], max_regression_pct: float) -> List[str]:
+    """Regressions of more than ``max_regression_pct`` against a previous run"""
+    previous = {level['concurrency']: level for level in baseline.get('levels', [])}
+    regressions = []
+    for level in levels:
+        old = previous.get(level['concurrency'])
+        if old is None:
+            continue
+        for metric in COMPARED_METRICS:
+            new_value, old_value = metric_value(level, metric), metric_value(old, metric)
+            if not new_value or not old_value:
+                continue
+            change = (new_value - old_value) / old_value * 100
+            if metric in HIGHER_IS_BETTER:
+                change = -change
+            if change > max_regression_pct:
+                regressions.append(
+                    f"c={level['concurrency']}: {metric} {old_value} -> {new_value} ({change:+.0f}% worse)"
+                )
+    return regressions
+
+def start_app(port: int, base_url: str, data_dir: str, mode: str) -> subprocess.Popen:
+    """Launch ``streamlit run app.py`` headless against the mock server"""
+    root = os.path.dirname(os.path.abspath(__file__))
+    env = dict(
+        os.environ,
+        OPENAI_BASE_URL=base_url,
+        OPENAI_API_KEY="mock",
+        FITBOT_DATA_DIR=data_dir,
+        FITBOT_GENERATION_MODE=mode
+    )
+    env.pop("FITBOT_PROFILE", None)
+    return subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", os.path.join(root, "app.py"),
+         "--server.port", str(port), "--server.address", "127.0.0.1", "--server.headless", "true",
+         "--server.enableCORS", "false", "--server.enableXsrfProtection", "false",
+         "--server.fileWatcherType", "none", "--browser.gatherUsageStats", "false"],
+        cwd=root, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+
+def wait_for_health(port: int, process: subprocess.Popen, timeout: float = 60.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"streamlit exited early: {process.stderr.read().decode(errors='replace')}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError("streamlit did not become healthy in time")
+
+async def run_benchmark(url: str, server_pid: int, levels: List[int]) -> List[Dict[str, Any]]:
+    # One warm-up session pays for imports and cache_resource initialisation
+    await run_level(url, 1, 0, server_pid, 0.0)
+    idle_rss_mb = read_rss_mb(server_pid)
+
+    summaries = []
+    next_index = 1
+    for concurrency in levels:
+        summary = await run_level(url, concurrency, next_index, server_pid, idle_rss_mb)
+        next_index += concurrency
+        summaries.append(summary)
+        print(f"c={concurrency:<4} plans/min={summary['plans_per_min']:<7} "
+              f"first_token p50/p95={summary['first_token_ms']['p50']}/{summary['first_token_ms']['p95']}ms "
+              f"complete p50/p95={summary['complete_ms']['p50']}/{summary['complete_ms']['p95']}ms "
+              f"rerun p95={summary['interaction_ms']['p95']}ms ({summary['interaction_kb']['p50']}KB) "
+              f"rss/session={summary['rss_per_session_mb']}MB errors={summary['errors']}")
+    return summaries
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the app under concurrent websocket sessions")
+    parser.add_argument("--concurrency", default="1,5,10,25,50", help="Comma-separated session counts")
+    parser.add_argument("--mode", default="full", choices=["full", "sections", "skeleton", "structured"],
+                        help="Generation mode the app runs with")
+    parser.add_argument("--latency", type=float, default=0.3, help="Mock seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="Mock generation speed")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Mock fraction of failing requests")
+    parser.add_argument("--completion-tokens", type=int, default=600, help="Mock tokens per completion")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--thresholds", default=DEFAULT_THRESHOLDS_PATH, help="JSON file of absolute limits")
+    parser.add_argument("--baseline", help="Previous results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=None,
+                        help="Allowed %% regression against the baseline (default from the thresholds file)")
+    args = parser.parse_args()
+
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    thresholds: Dict[str, Any] = {}
+    if args.thresholds and os.path.exists(args.thresholds):
+        with open(args.thresholds, encoding="utf-8") as f:
+            thresholds = json.load(f)
+
+    mock, base_url = start_mock_server(
+        latency=args.latency, tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate, completion_tokens=args.completion_tokens
+    )
+    port = free_port()
+    with tempfile.TemporaryDirectory(prefix="fitbot-bench-") as data_dir:
+        if args.mode == "skeleton":
+            from plan_skeletons import build_library
+            build_library(os.path.join(data_dir, "plan_skeletons.v1.json.gz"))
+        app = start_app(port, base_url, data_dir, args.mode)
+        try:
+            wait_for_health(port, app)
+            summaries = asyncio.run(run_benchmark(f"ws://127.0.0.1:{port}/_stcore/stream", app.pid, levels))
+        finally:
+            app.terminate()
+            app.wait(timeout=10)
+            mock.shutdown()
+
+    report = {
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'config': {
+            'mode': args.mode,
+            'mock': {
+                'latency': args.latency,
+                'tokens_per_second': args.tokens_per_second,
+                'error_rate': args.error_rate,
+                'completion_tokens': args.completion_tokens
+            },
+            'python': sys.version.split()[0]
+        },
+        'levels': summaries
+    }
+
+    failures = check_thresholds(summaries, thresholds)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        max_regression = args.max_regression
+        if max_regression is None:
+            max_regression = thresholds.get('max_regression_pct', 20)
+        failures += compare_baseline(summaries, baseline, max_regression)
+    report['failures'] = failures
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if failures:
+        print("Performance check failed:")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""Cold-start benchmark for the Streamlit app
+
+Measures what a freshly scaled-up container costs its first user. Each run
+starts a new ``streamlit run app.py`` process against the local mock
+OpenAI server and records:
+
+- import time of the modules ``app.py`` imports, in a fresh interpreter,
+  and whether the OpenAI SDK is among them
+- server start: process launch until the health endpoint answers
+- first paint: the first session's first rendered element, and the end of
+  that script run (which pays for imports and resource initialisation)
+- first generation: submit to first streamed token and to the finished
+  plan, in the same cold process, after a pause for filling in the form
+
+Results are summarized over ``--runs`` cold processes, written to a JSON
+file, and checked against the ``startup_limits`` of the thresholds file
+(exit code 1 on a violation). Needs the ``websockets`` package.
+
+    python bench_startup.py --runs 5 --output bench_startup.json
+    python bench_startup.py --no-warmup
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from bench_load import (
+    DEFAULT_THRESHOLDS_PATH, HEIGHT_LABEL, SUBMIT_LABEL, WEIGHT_LABEL, StreamlitSession, free_port,
+    metric_value, start_app, summarize, wait_for_health
+)
+from mock_openai_server import start_mock_server
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Imports every top-level module of app.py in a fresh interpreter
+IMPORT_PROBE = """
+import ast, json, sys, time
+tree = ast.parse(open("app.py", encoding="utf-8").read())
+modules = [alias.name for node in tree.body if isinstance(node, ast.Import) for alias in node.names]
+modules += [node.module for node in tree.body if isinstance(node, ast.ImportFrom) and node.module]
+started = time.perf_counter()
+for name in modules:
+    __import__(name)
+print(json.dumps({'import_ms': (time.perf_counter() - started) * 1000, 'openai_loaded': 'openai' in sys.modules}))
+"""
+
+def measure_imports() -> Dict[str, Any]:
+    """Import time of app.py's dependencies in a cold interpreter"""
+    output = subprocess.run([sys.executable, "-c", IMPORT_PROBE], cwd=ROOT, capture_output=True,
+                            text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+async def first_session(url: str, think_time: float) -> Dict[str, Any]:
+    """Load the page and generate one plan, as the first user of a new process"""
+    session = StreamlitSession(url)
+    record: Dict[str, Any] = {'error': None}
+    try:
+        await session.connect()
+        load = await session.rerun()
+        record['first_paint_ms'] = load['first_paint_ms']
+        record['first_load_ms'] = load['finished_ms']
+        # Nobody submits the form the instant it appears
+        await asyncio.sleep(think_time)
+        submit = await session.rerun([
+            session.widget(WEIGHT_LABEL, string_value="70kg"),
+            session.widget(HEIGHT_LABEL, string_value="175cm"),
+            session.widget(SUBMIT_LABEL, trigger_value=True)
+        ], until_ready=True)
+        record['first_token_ms'] = submit['first_token_ms']
+        record['first_plan_ms'] = submit['ready_ms']
+        if submit['error'] or submit['ready_ms'] is None:
+            record['error'] = "plan generation failed"
+    except Exception as e:
+        record['error'] = f"{type(e).__name__}: {e}"
+    finally:
+        await session.close()
+    return record
+
+def cold_run(base_url: str, mode: str, think_time: float) -> Dict[str, Any]:
+    """Start a new app process and time its first page load and first plan"""
+    port = free_port()
+    with tempfile.TemporaryDirectory(prefix="fitbot-startup-") as data_dir:
+        started = time.perf_counter()
+        app = start_app(port, base_url, data_dir, mode)
+        try:
+            wait_for_health(port, app)
+            server_start_ms = (time.perf_counter() - started) * 1000
+            record = asyncio.run(first_session(f"ws://127.0.0.1:{port}/_stcore/stream", think_time))
+        finally:
+            app.terminate()
+            app.wait(timeout=10)
+    record['server_start_ms'] = server_start_ms
+    return record
+
+def check_limits(summary: Dict[str, Any], limits: Dict[str, float]) -> List[str]:
+    violations = []
+    for metric, limit in limits.items():
+        value = metric_value(summary, metric)
+        if value is not None and value > limit:
+            violations.append(f"{metric} = {value} (limit {limit})")
+    return violations
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the app's cold start and first generation")
+    parser.add_argument("--runs", type=int, default=3, help="Cold processes to start")
+    parser.add_argument("--mode", default="full", choices=["full", "sections", "structured"],
+                        help="Generation mode the app runs with")
+    parser.add_argument("--think-time", type=float, default=3.0,
+                        help="Seconds between first paint and submitting the form")
+    parser.add_argument("--no-warmup", action="store_true", help="Disable the background OpenAI warm-up")
+    parser.add_argument("--latency", type=float, default=0.3, help="Mock seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="Mock generation speed")
+    parser.add_argument("--output", default="bench_startup.json")
+    parser.add_argument("--thresholds", default=DEFAULT_THRESHOLDS_PATH, help="JSON file with startup_limits")
+    args = parser.parse_args()
+
+    thresholds: Dict[str, Any] = {}
+    if args.thresholds and os.path.exists(args.thresholds):
+        with open(args.thresholds, encoding="utf-8") as f:
+            thresholds = json.load(f)
+    if args.no_warmup:
+        os.environ["FITBOT_WARMUP"] = "0"
+
+    imports = [measure_imports() for _ in range(args.runs)]
+    mock, base_url = start_mock_server(latency=args.latency, tokens_per_second=args.tokens_per_second)
+    runs = []
+    try:
+        for number in range(1, args.runs + 1):
+            run = cold_run(base_url, args.mode, args.think_time)
+            runs.append(run)
+            print(f"run {number}: server_start={run['server_start_ms']:.0f}ms "
+                  f"first_paint={run.get('first_paint_ms') or 0:.0f}ms first_load={run.get('first_load_ms') or 0:.0f}ms "
+                  f"first_token={run.get('first_token_ms') or 0:.0f}ms first_plan={run.get('first_plan_ms') or 0:.0f}ms"
+                  f"{' error=' + run['error'] if run['error'] else ''}")
+    finally:
+        mock.shutdown()
+
+    def values(key: str) -> List[float]:
+        return [run[key] for run in runs if run.get(key) is not None and not run['error']]
+
+    summary = {
+        'import_ms': summarize([probe['import_ms'] for probe in imports]),
+        'openai_imported_eagerly': any(probe['openai_loaded'] for probe in imports),
+        'server_start_ms': summarize(values('server_start_ms')),
+        'first_paint_ms': summarize(values('first_paint_ms')),
+        'first_load_ms': summarize(values('first_load_ms')),
+        'first_token_ms': summarize(values('first_token_ms')),
+        'first_plan_ms': summarize(values('first_plan_ms')),
+        'errors': sum(1 for run in runs if run['error'])
+    }
+    print(f"import p50={summary['import_ms']['p50']}ms (openai eager: {summary['openai_imported_eagerly']}) "
+          f"first_paint p50={summary['first_paint_ms']['p50']}ms first_token p50={summary['first_token_ms']['p50']}ms "
+          f"first_plan p50={summary['first_plan_ms']['p50']}ms errors={summary['errors']}")
+
+    failures = check_limits(summary, thresholds.get('startup_limits', {}))
+    if summary['errors']:
+        failures.append(f"{summary['errors']} of {len(runs)} cold runs failed")
+    report = {
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'config': {
+            'mode': args.mode,
+            'runs': args.runs,
+            'think_time': args.think_time,
+            'warmup': not args.no_warmup,
+            'mock': {'latency': args.latency, 'tokens_per_second': args.tokens_per_second},
+            'python': sys.version.split()[0]
+        },
+        'summary': summary,
+        'runs': runs,
+        'failures': failures
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if failures:
+        print("Startup check failed:")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
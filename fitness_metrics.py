@@ -0,0 +1,162 @@
+"""Deterministic body metrics computed locally instead of by the model
+
+Parses the free-text weight/height answers, then computes BMI, BMR
+(Mifflin-St Jeor), TDEE from the activity level and a goal-adjusted
+calorie target with a macronutrient split. The array API works on whole
+batches at once so bulk jobs can score thousands of profiles cheaply.
+"""
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from units import parse_height_cm, parse_weight_kg
+
+ACTIVITY_MULTIPLIERS = {
+    'Sedentary': 1.2,
+    'Lightly active': 1.375,
+    'Moderately active': 1.55,
+    'Very active': 1.725,
+    'Extremely active': 1.9
+}
+
+# Mifflin-St Jeor constant term; "Other" uses the midpoint
+GENDER_OFFSETS = {'Male': 5.0, 'Female': -161.0, 'Other': -78.0}
+
+# goal -> (calorie factor applied to TDEE, protein g per kg, fat share of calories)
+GOAL_TARGETS = {
+    'Lose weight': (0.80, 2.0, 0.25),
+    'Gain muscle': (1.10, 1.8, 0.25),
+    'Maintain weight': (1.00, 1.6, 0.30),
+    'Improve endurance': (1.05, 1.4, 0.25),
+    'General fitness': (1.00, 1.6, 0.30)
+}
+
+# Lowest calorie target we will suggest without medical supervision
+CALORIE_FLOORS = {'Male': 1500.0, 'Female': 1200.0, 'Other': 1350.0}
+
+BMI_THRESHOLDS = np.array([18.5, 25.0, 30.0])
+BMI_CATEGORIES = np.array(['Underweight', 'Normal weight', 'Overweight', 'Obesity'])
+# BMI category names in the other plan languages
+BMI_CATEGORY_NAMES = {
+    'spanish': {
+        'Underweight': "Bajo peso", 'Normal weight': "Peso normal", 'Overweight': "Sobrepeso", 'Obesity': "Obesidad"
+    }
+}
+
+def _lookup(values: Sequence[str], table: Dict[str, float], default: float) -> np.ndarray:
+    # Map the few distinct labels once, then broadcast back to every row
+    labels, inverse = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+    return np.array([table.get(label, default) for label in labels], dtype=float)[inverse]
+
+def compute_metrics_arrays(weight_kg: Sequence[float], height_cm: Sequence[float], age: Sequence[float],
+                           gender: Sequence[str], activity_level: Sequence[str],
+                           goal: Sequence[str]) -> Dict[str, np.ndarray]:
+    """Vectorized metrics for a batch of profiles
+    
+    Numeric inputs may contain NaN for unparseable answers; those rows come
+    back as NaN. Unknown categorical labels fall back to sedentary,
+    general fitness and the "Other" gender constants.
+    """
+    weight = np.asarray(weight_kg, dtype=float)
+    height = np.asarray(height_cm, dtype=float)
+    age = np.asarray(age, dtype=float)
+    
+    bmi = weight / (height / 100.0) ** 2
+    bmr = 10.0 * weight + 6.25 * height - 5.0 * age + _lookup(gender, GENDER_OFFSETS, GENDER_OFFSETS['Other'])
+    tdee = bmr * _lookup(activity_level, ACTIVITY_MULTIPLIERS, ACTIVITY_MULTIPLIERS['Sedentary'])
+    
+    default_target = GOAL_TARGETS['General fitness']
+    calorie_factor = _lookup(goal, {k: v[0] for k, v in GOAL_TARGETS.items()}, default_target[0])
+    protein_per_kg = _lookup(goal, {k: v[1] for k, v in GOAL_TARGETS.items()}, default_target[1])
+    fat_share = _lookup(goal, {k: v[2] for k, v in GOAL_TARGETS.items()}, default_target[2])
+    
+    calorie_target = np.maximum(tdee * calorie_factor, _lookup(gender, CALORIE_FLOORS, CALORIE_FLOORS['Other']))
+    calorie_target = np.where(np.isnan(tdee), np.nan, calorie_target)
+    protein_g = weight * protein_per_kg
+    fat_g = calorie_target * fat_share / 9.0
+    carbs_g = np.maximum(calorie_target - protein_g * 4.0 - fat_g * 9.0, 0.0) / 4.0
+    carbs_g = np.where(np.isnan(calorie_target), np.nan, carbs_g)
+    
+    category = BMI_CATEGORIES[np.searchsorted(BMI_THRESHOLDS, np.nan_to_num(bmi), side='right')]
+    
+    return {
+        'weight_kg': weight,
+        'height_cm': height,
+        'bmi': bmi,
+        'bmi_category': np.where(np.isnan(bmi), '', category),
+        'bmr': bmr,
+        'tdee': tdee,
+        'calorie_target': calorie_target,
+        'protein_g': protein_g,
+        'carbs_g': carbs_g,
+        'fat_g': fat_g
+    }
+
+def _parsed(value: Optional[float]) -> float:
+    return np.nan if value is None else value
+
+def _number(value: Any) -> float:
+    """A numeric field as a float, NaN when it is missing, zero, infinite or not a number"""
+    if value in (None, ''):
+        return np.nan
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return np.nan
+    if number == 0 or not np.isfinite(number):
+        return np.nan
+    return number
+
+def compute_profile_metrics(profiles: Sequence[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+    """Metrics for a list of form-style profiles, one dict (or None) per profile
+    
+    Profiles whose weight or height cannot be parsed get None.
+    """
+    if not profiles:
+        return []
+    arrays = compute_metrics_arrays(
+        weight_kg=[_parsed(parse_weight_kg(p.get('weight'))) for p in profiles],
+        height_cm=[_parsed(parse_height_cm(p.get('height'))) for p in profiles],
+        age=[_number(p.get('age')) for p in profiles],
+        gender=[str(p.get('gender', 'Other')) for p in profiles],
+        activity_level=[str(p.get('activity_level', 'Sedentary')) for p in profiles],
+        goal=[str(p.get('goal', 'General fitness')) for p in profiles]
+    )
+    
+    # Round in bulk and convert to plain Python lists before building dicts;
+    # per-element NumPy scalar access would dominate the batch cost
+    columns = {
+        'weight_kg': np.round(arrays['weight_kg'], 1).tolist(),
+        'height_cm': np.round(arrays['height_cm']).tolist(),
+        'bmi': np.round(arrays['bmi'], 1).tolist(),
+        'bmi_category': arrays['bmi_category'].tolist(),
+        'bmr': np.round(arrays['bmr'], -1).tolist(),
+        'tdee': np.round(arrays['tdee'], -1).tolist(),
+        'calorie_target': np.round(arrays['calorie_target'], -1).tolist(),
+        'protein_g': np.round(arrays['protein_g']).tolist(),
+        'carbs_g': np.round(arrays['carbs_g']).tolist(),
+        'fat_g': np.round(arrays['fat_g']).tolist()
+    }
+    passthrough_fields = ('weight_kg', 'bmi', 'bmi_category')
+    
+    results = []
+    for i, bmr in enumerate(columns['bmr']):
+        if bmr != bmr:  # NaN: weight, height or age could not be parsed
+            results.append(None)
+            continue
+        results.append({
+            field: values[i] if field in passthrough_fields else int(values[i])
+            for field, values in columns.items()
+        })
+    return results
+
+def compute_metrics(user_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Metrics for a single profile, or None if weight/height cannot be parsed"""
+    return compute_profile_metrics([user_data])[0]
+
+def localize_metrics(metrics: Optional[Dict[str, Any]], language: str) -> Optional[Dict[str, Any]]:
+    """A copy of the metrics with the BMI category named in the plan language"""
+    if not metrics:
+        return metrics
+    names = BMI_CATEGORY_NAMES.get(language, {})
+    return {**metrics, 'bmi_category': names.get(metrics['bmi_category'], metrics['bmi_category'])}
@@ -0,0 +1,231 @@
+"""Hot-path timing, metrics export and optional profiling for script reruns
+
+Every Streamlit rerun is wrapped in a trace that times its stages (CSS
+injection, prompt build, API latency, render, ...). Timings feed
+process-wide histograms that can be scraped in Prometheus text format and,
+optionally, one structured JSON log line per rerun.
+
+Configuration (environment variables):
+
+- ``FITBOT_METRICS_PORT``: serve ``/metrics`` on this port
+- ``FITBOT_METRICS_LOG``: append one JSON line per rerun to this file
+- ``FITBOT_PROFILE``: ``cprofile`` or ``pyinstrument`` to profile reruns;
+  ``FITBOT_PROFILE_SESSIONS`` limits it to a comma-separated list of
+  session IDs, and profiles are written to ``FITBOT_PROFILE_DIR``
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RATE_BUCKETS = (5, 10, 20, 40, 80, 160, 320, 640)
+SIZE_BUCKETS = (256, 512, 1024, 2048, 4096, 8192, 16384, 65536, 262144)
+
+METRIC_HELP = {
+    'fitbot_stage_seconds': ("histogram", "Wall time of each script rerun stage"),
+    'fitbot_time_to_first_token_seconds': ("histogram", "Time from request to first streamed token"),
+    'fitbot_generation_tokens_per_second': ("histogram", "Completion tokens per second after the first token"),
+    'fitbot_reruns_total': ("counter", "Script reruns"),
+    'fitbot_generations_total': ("counter", "Plan generations by mode and outcome"),
+    'fitbot_translations_total': ("counter", "Plan translations by outcome"),
+    'fitbot_exports_total': ("counter", "Plan downloads rendered by format and whether it ran in the background"),
+    'fitbot_upstream_attempts_total': ("counter", "OpenAI request attempts by model and outcome"),
+    'fitbot_upstream_retries_total': ("counter", "OpenAI requests retried after a transient failure"),
+    'fitbot_upstream_hedges_total': ("counter", "Hedged duplicate OpenAI requests by whether they won"),
+    'fitbot_upstream_fallbacks_total': ("counter", "Requests routed to the fallback model by reason"),
+    'fitbot_circuit_opened_total': ("counter", "Times a model's circuit breaker opened"),
+    'fitbot_warmup_seconds': ("histogram", "Time to import the OpenAI SDK and open a first connection, by outcome"),
+    'fitbot_admission_total': ("counter", "Jobs admitted or rejected by the rate-limit admission queue"),
+    'fitbot_admission_wait_seconds': ("histogram", "Time jobs waited in the admission queue"),
+    'fitbot_session_state_bytes': ("histogram", "Approximate size of a session's state at the end of each rerun")
+}
+METRIC_BUCKETS = {'fitbot_generation_tokens_per_second': RATE_BUCKETS, 'fitbot_session_state_bytes': SIZE_BUCKETS}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+class MetricsRegistry:
+    """Thread-safe process-wide histograms and counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Dict[LabelKey, _Histogram]] = {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+
+    def observe(self, name: str, value: float, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = _Histogram(METRIC_BUCKETS.get(name, DEFAULT_BUCKETS))
+            series[key].observe(value)
+
+    def inc(self, name: str, amount: float = 1.0, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + amount
+
+    def render_prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        def fmt(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+            pairs = key + extra
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}" if pairs else ""
+
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._histograms.items()):
+                lines += [f"# HELP {name} {METRIC_HELP.get(name, ('', name))[1]}", f"# TYPE {name} histogram"]
+                for key, hist in sorted(series.items()):
+                    for bound, count in zip(hist.buckets, hist.counts):
+                        lines.append(f"{name}_bucket{fmt(key, (('le', repr(float(bound))),))} {count}")
+                    lines.append(f"{name}_bucket{fmt(key, (('le', '+Inf'),))} {hist.count}")
+                    lines.append(f"{name}_sum{fmt(key)} {hist.sum:.6f}")
+                    lines.append(f"{name}_count{fmt(key)} {hist.count}")
+            for name, series in sorted(self._counters.items()):
+                lines += [f"# HELP {name} {METRIC_HELP.get(name, ('', name))[1]}", f"# TYPE {name} counter"]
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{fmt(key)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+class RerunTrace:
+    """Stage timings collected during one script rerun"""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.values: Dict[str, float] = {}
+        self.profiler = None
+
+_log_lock = threading.Lock()
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("fitbot_rerun_trace", default=None)
+
+def _start_profiler(session_id: str):
+    mode = os.getenv("FITBOT_PROFILE", "").lower()
+    sessions = [s for s in os.getenv("FITBOT_PROFILE_SESSIONS", "").split(",") if s]
+    if not mode or (sessions and session_id not in sessions):
+        return None
+    if mode == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            return None
+        profiler = Profiler()
+        profiler.start()
+        return profiler
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+def _save_profile(trace: RerunTrace):
+    profile_dir = os.getenv("FITBOT_PROFILE_DIR", os.path.join(os.getenv("FITBOT_DATA_DIR", ".fitbot"), "profiles"))
+    os.makedirs(profile_dir, exist_ok=True)
+    stem = os.path.join(profile_dir, f"{trace.session_id}-{int(time.time() * 1000)}")
+    profiler = trace.profiler
+    if hasattr(profiler, "output_html"):
+        profiler.stop()
+        with open(stem + ".html", "w", encoding="utf-8") as f:
+            f.write(profiler.output_html())
+    else:
+        profiler.disable()
+        profiler.dump_stats(stem + ".prof")
+
+def begin_rerun(session_id: str = "unknown") -> RerunTrace:
+    """Start timing a script rerun (and profiling it, when enabled)"""
+    trace = RerunTrace(session_id)
+    trace.profiler = _start_profiler(session_id)
+    _current_trace.set(trace)
+    return trace
+
+def end_rerun(trace: RerunTrace):
+    """Finish a rerun: record its total, emit the log line, save any profile"""
+    total = time.perf_counter() - trace.started
+    trace.stages['rerun'] = total
+    REGISTRY.observe('fitbot_stage_seconds', total, stage='rerun')
+    REGISTRY.inc('fitbot_reruns_total')
+    _current_trace.set(None)
+
+    if trace.profiler is not None:
+        _save_profile(trace)
+
+    log_path = os.getenv("FITBOT_METRICS_LOG")
+    if log_path:
+        record = {
+            'ts': time.time(),
+            'session': trace.session_id,
+            'stages_ms': {name: round(seconds * 1000, 3) for name, seconds in trace.stages.items()},
+            **trace.values
+        }
+        with _log_lock, open(log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a stage of the current rerun"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        REGISTRY.observe('fitbot_stage_seconds', elapsed, stage=name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.stages[name] = trace.stages.get(name, 0.0) + elapsed
+
+def observe(name: str, value: float, **labels: str):
+    """Record a non-stage measurement, also attaching it to the current rerun"""
+    REGISTRY.observe(name, value, **labels)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.values[name] = value
+
+def count(name: str, **labels: str):
+    """Increment a counter"""
+    REGISTRY.inc(name, **labels)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> Optional[ThreadingHTTPServer]:
+    """Serve ``/metrics`` on a background thread; None if the port is taken"""
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError:
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
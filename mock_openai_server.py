@@ -0,0 +1,236 @@
+"""Local stand-in for the OpenAI chat completions API
+
+Serves /v1/chat/completions (streaming and non-streaming) and /v1/models with
+configurable latency, token rate and error rate so the app, the batch CLI
+and benchmarks can be exercised without spending real tokens. Faults can be
+injected to exercise the resilient transport: error status codes (429s
+come with ``Retry-After``), occasional slow responses, streams that stall
+mid-answer and per-model latency.
+
+    python mock_openai_server.py --port 8765 --latency 0.3 --tokens-per-second 80
+    python mock_openai_server.py --error-rate 0.3 --error-status 429 --slow-rate 0.1 --slow-latency 20
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=mock streamlit run app.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+_FILLER = (
+    "💪 Focus on compound movements with controlled tempo and full range of motion, "
+    "rest 60-90 seconds between sets, keep protein high and stay consistent every week."
+).split()
+
+class MockSettings:
+    """Behaviour knobs shared by every request the mock server handles"""
+    
+    def __init__(self, latency: float = 0.0, tokens_per_second: float = 0.0,
+                 error_rate: float = 0.0, completion_tokens: int = 600, error_status: int = 500,
+                 slow_rate: float = 0.0, slow_latency: float = 0.0, stall_rate: float = 0.0,
+                 stall_seconds: float = 30.0, model_latency: Optional[Dict[str, float]] = None):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.completion_tokens = completion_tokens
+        self.error_status = error_status
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.model_latency = model_latency or {}
+        self.requests = 0
+        self._lock = threading.Lock()
+    
+    def count_request(self) -> int:
+        with self._lock:
+            self.requests += 1
+            return self.requests
+
+# Reply for requests that ask for a JSON object (structured plans)
+_JSON_PLAN = {
+    "assessment": "💪 Focus on compound movements and steady progress; your targets below are realistic.",
+    "days": [
+        {"day": day, "focus": "Full Body", "exercises": [
+            {"name": "Squat", "sets": 3, "reps": "8-10", "rest_seconds": 90, "notes": ""},
+            {"name": "Push-ups", "sets": 3, "reps": 12, "rest_seconds": 60},
+            {"name": "Dumbbell row", "sets": 3, "reps": "10", "rest_seconds": 60}
+        ]}
+        for day in ("Monday", "Wednesday", "Friday")
+    ],
+    "nutrition": {"calories": 2200, "protein_g": 150, "carbs_g": 230, "fat_g": 70,
+                  "meal_timing": "Three meals and one snack", "sample_meals": ["Oats with yogurt", "Chicken and rice"]},
+    "milestones": [{"week": 4, "target": "Add 5 kg to the squat"}, {"week": 8, "target": "Lose 2-3 kg"}],
+    "tips": ["Sleep 7-9 hours", "Prep meals ahead"]
+}
+
+def _mock_tokens(count: int) -> list:
+    return [("\n\n" if i and i % 40 == 0 else " ") + _FILLER[i % len(_FILLER)] for i in range(count)]
+
+def _mock_json_tokens() -> list:
+    text = json.dumps(_JSON_PLAN, ensure_ascii=False)
+    return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+class MockCompletionsHandler(BaseHTTPRequestHandler):
+    settings = MockSettings()
+    protocol_version = "HTTP/1.1"
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_GET(self):
+        # The app's connection warm-up lists models
+        if not self.path.rstrip('/').endswith("/models"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+            return
+        self._send_json(200, {"object": "list", "data": [
+            {"id": model, "object": "model", "created": 0, "owned_by": "mock"} for model in ("gpt-3.5-turbo", "gpt-4o-mini")
+        ]})
+    
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip('/').endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+            return
+        
+        settings = self.settings
+        settings.count_request()
+        latency = settings.model_latency.get(request.get("model"), settings.latency)
+        if random.random() < settings.slow_rate:
+            latency += settings.slow_latency
+        if latency:
+            time.sleep(latency)
+        if random.random() < settings.error_rate:
+            status = settings.error_status
+            self._send_json(
+                status,
+                {"error": {"message": "Injected mock failure", "type": "rate_limit_error" if status == 429 else "server_error"}},
+                {"Retry-After": "1"} if status in (429, 503) else None
+            )
+            return
+        
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in request.get("messages", []))
+        if (request.get("response_format") or {}).get("type") == "json_object":
+            tokens = _mock_json_tokens()
+            count = len(tokens)
+        else:
+            count = min(int(request.get("max_tokens") or settings.completion_tokens), settings.completion_tokens)
+            tokens = _mock_tokens(count)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": count, "total_tokens": prompt_tokens + count}
+        finish_reason = "length" if count == request.get("max_tokens") else "stop"
+        completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+        model = request.get("model", "mock")
+        
+        if request.get("stream"):
+            self._stream(completion_id, model, tokens, usage, finish_reason,
+                         (request.get("stream_options") or {}).get("include_usage", False))
+            return
+        
+        if settings.tokens_per_second:
+            time.sleep(count / settings.tokens_per_second)
+        self._send_json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(tokens).strip()},
+                "finish_reason": finish_reason
+            }],
+            "usage": usage
+        })
+    
+    def _stream(self, completion_id: str, model: str, tokens: list, usage: Dict[str, int],
+                finish_reason: str, include_usage: bool):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        
+        def event(choices: list, extra: Dict[str, Any] = None):
+            chunk = {"id": completion_id, "object": "chat.completion.chunk",
+                     "created": int(time.time()), "model": model, "choices": choices}
+            chunk.update(extra or {})
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+        
+        delay = 1.0 / self.settings.tokens_per_second if self.settings.tokens_per_second else 0.0
+        stall_at = 5 if random.random() < self.settings.stall_rate else -1
+        try:
+            event([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+            for i, token in enumerate(tokens):
+                if i == stall_at:
+                    time.sleep(self.settings.stall_seconds)
+                if delay:
+                    time.sleep(delay)
+                event([{"index": 0, "delta": {"content": token}, "finish_reason": None}])
+            event([{"index": 0, "delta": {}, "finish_reason": finish_reason}])
+            if include_usage:
+                event([], {"usage": usage})
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        self.close_connection = True
+
+def start_mock_server(host: str = "127.0.0.1", port: int = 0, **settings) -> Tuple[ThreadingHTTPServer, str]:
+    """Start the mock server on a background thread
+    
+    Returns the server (call ``shutdown()`` when done) and its base URL,
+    suitable for ``OPENAI_BASE_URL``.
+    """
+    handler = type("ConfiguredMockHandler", (MockCompletionsHandler,), {"settings": MockSettings(**settings)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local mock OpenAI chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Generation speed (0 = instant)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with an error")
+    parser.add_argument("--error-status", type=int, default=500, help="HTTP status of injected errors")
+    parser.add_argument("--completion-tokens", type=int, default=600, help="Tokens per completion")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Fraction of requests delayed by --slow-latency")
+    parser.add_argument("--slow-latency", type=float, default=0.0, help="Extra seconds before the first token of slow requests")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="Fraction of streams that stall mid-answer")
+    parser.add_argument("--stall-seconds", type=float, default=30.0, help="How long a stalled stream hangs")
+    parser.add_argument("--model-latency", action="append", default=[], metavar="MODEL=SECONDS",
+                        help="Latency override for one model (repeatable)")
+    args = parser.parse_args()
+    
+    model_latency = {name: float(seconds) for name, seconds in (item.split("=", 1) for item in args.model_latency)}
+    handler = type("ConfiguredMockHandler", (MockCompletionsHandler,), {"settings": MockSettings(
+        latency=args.latency, tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate, completion_tokens=args.completion_tokens,
+        error_status=args.error_status, slow_rate=args.slow_rate, slow_latency=args.slow_latency,
+        stall_rate=args.stall_rate, stall_seconds=args.stall_seconds, model_latency=model_latency
+    )})
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    print(f"🤖 Mock OpenAI server listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
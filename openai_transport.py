@@ -0,0 +1,543 @@
+"""Pooled, resilient transport for OpenAI chat completions
+
+Wraps the OpenAI SDK so that a slow or failing upstream cannot tie up a
+session for minutes:
+
+- one shared, explicitly sized keep-alive connection pool
+- a per-attempt time-to-first-token limit and a total deadline per request
+- jittered exponential retries on 408/409/429/5xx and connection errors,
+  honouring ``Retry-After``
+- a circuit breaker per model that fails fast while upstream is down
+- optional hedged requests once an attempt runs past the recent p95
+  time to first token
+- automatic fallback to a faster/cheaper model while the primary model is
+  breaching the latency SLO or its circuit is open
+
+Retries, hedging and fallback only happen before the first token arrives;
+once text is streaming to the user a failure is reported instead of
+silently restarting the answer.
+
+The SDK itself is imported when the first client is built, not when this
+module is, so a cold process can render its first page without it;
+``start_warm_up`` loads it and opens a connection in the background.
+
+Configuration (environment variables, defaults in ``TransportConfig``):
+``FITBOT_HTTP_POOL_SIZE``, ``FITBOT_HTTP_KEEPALIVE``,
+``FITBOT_CONNECT_TIMEOUT_S``, ``FITBOT_READ_TIMEOUT_S``,
+``FITBOT_ATTEMPT_TIMEOUT_S``, ``FITBOT_TOTAL_DEADLINE_S``,
+``FITBOT_MAX_RETRIES``, ``FITBOT_BREAKER_FAILURES``,
+``FITBOT_BREAKER_COOLDOWN_S``, ``FITBOT_HEDGE``, ``FITBOT_FALLBACK_MODEL``
+and ``FITBOT_TTFT_SLO_S``.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, List, Optional, Tuple
+
+from instrumentation import count, observe
+
+# The OpenAI SDK and its HTTP stack, set by ``load_sdk``
+openai: Any = None
+httpx: Any = None
+
+# Time-to-first-token samples older than this no longer count towards p95
+LATENCY_WINDOW_SECONDS = 300
+LATENCY_MIN_SAMPLES = 20
+
+def load_sdk():
+    """Import the OpenAI SDK and its HTTP stack on first use
+
+    They take longer to import than the rest of the app put together.
+    """
+    global openai, httpx
+    if openai is not None:
+        return
+    try:
+        import httpx as http
+    except ImportError:  # newer openai releases ship their HTTP stack as httpx2
+        import httpx2 as http
+    import openai as sdk
+    httpx = http
+    openai = sdk
+
+class TransportConfig:
+    """Pool, deadline, retry, breaker, hedging and fallback settings"""
+
+    def __init__(self, pool_size: int = 20, keepalive: int = 10, keepalive_expiry: float = 30.0,
+                 connect_timeout: float = 5.0, read_timeout: float = 20.0, attempt_timeout: float = 15.0,
+                 total_deadline: float = 90.0, max_retries: int = 3, retry_base: float = 0.5,
+                 retry_max: float = 8.0, breaker_failures: int = 5, breaker_cooldown: float = 30.0,
+                 hedge: bool = False, hedge_min_delay: float = 1.0,
+                 fallback_model: Optional[str] = "gpt-4o-mini", ttft_slo: float = 6.0):
+        self.pool_size = pool_size
+        self.keepalive = keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.attempt_timeout = attempt_timeout
+        self.total_deadline = total_deadline
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.breaker_failures = breaker_failures
+        self.breaker_cooldown = breaker_cooldown
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.fallback_model = fallback_model
+        self.ttft_slo = ttft_slo
+
+    @classmethod
+    def from_env(cls) -> "TransportConfig":
+        env = os.getenv
+        return cls(
+            pool_size=int(env("FITBOT_HTTP_POOL_SIZE", "20")),
+            keepalive=int(env("FITBOT_HTTP_KEEPALIVE", "10")),
+            connect_timeout=float(env("FITBOT_CONNECT_TIMEOUT_S", "5")),
+            read_timeout=float(env("FITBOT_READ_TIMEOUT_S", "20")),
+            attempt_timeout=float(env("FITBOT_ATTEMPT_TIMEOUT_S", "15")),
+            total_deadline=float(env("FITBOT_TOTAL_DEADLINE_S", "90")),
+            max_retries=int(env("FITBOT_MAX_RETRIES", "3")),
+            breaker_failures=int(env("FITBOT_BREAKER_FAILURES", "5")),
+            breaker_cooldown=float(env("FITBOT_BREAKER_COOLDOWN_S", "30")),
+            hedge=env("FITBOT_HEDGE", "0").lower() in ("1", "true", "yes"),
+            fallback_model=env("FITBOT_FALLBACK_MODEL", "gpt-4o-mini") or None,
+            ttft_slo=float(env("FITBOT_TTFT_SLO_S", "6"))
+        )
+
+class TransportError(Exception):
+    """Upstream failure with a message that is safe to show to users"""
+
+class AttemptTimeout(TransportError):
+    """No first token within the per-attempt limit"""
+
+class DeadlineExceeded(TransportError):
+    """The request ran past its total deadline"""
+
+class UpstreamUnavailable(TransportError):
+    """Every attempt and fallback failed, or the circuits are open"""
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether a failed attempt is worth retrying"""
+    if isinstance(error, (AttemptTimeout, openai.APIConnectionError, httpx.TransportError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+class CircuitBreaker:
+    """Opens after consecutive failures; lets one trial through after a cooldown"""
+
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == 'open' and time.monotonic() - self.opened_at < self.cooldown
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = 'half_open'
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+
+    def record_failure(self) -> bool:
+        """Count a failure; True when it (re)opened the circuit"""
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                reopened = self.state != 'open'
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                return reopened
+            return False
+
+    def release_trial(self):
+        """End a half-open trial that got no verdict, so the next request can try again"""
+        with self._lock:
+            if self.state == 'half_open':
+                self.state = 'open'
+
+class LatencyTracker:
+    """Recent time-to-first-token samples per model"""
+
+    def __init__(self, window_seconds: float = LATENCY_WINDOW_SECONDS):
+        self.window_seconds = window_seconds
+        self._samples: Dict[str, Deque[Tuple[float, float]]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(model, deque(maxlen=500)).append((time.monotonic(), seconds))
+
+    def p95(self, model: str) -> Optional[float]:
+        """95th percentile over the window; None without enough samples"""
+        cutoff = time.monotonic() - self.window_seconds
+        with self._lock:
+            values = sorted(v for ts, v in self._samples.get(model, ()) if ts >= cutoff)
+        if len(values) < LATENCY_MIN_SAMPLES:
+            return None
+        return values[min(len(values) - 1, int(len(values) * 0.95))]
+
+def _starts_answer(chunk: Any) -> bool:
+    """True once a chunk carries text, a finish reason or the usage totals"""
+    if getattr(chunk, "usage", None):
+        return True
+    return any(choice.delta.content or choice.finish_reason for choice in chunk.choices)
+
+class ResilientTransport:
+    """Chat completion streaming with pooling, deadlines, retries, breaker, hedging and fallback"""
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 config: Optional[TransportConfig] = None):
+        self.config = config or TransportConfig.from_env()
+        self.api_key = api_key
+        self.base_url = base_url
+        self._client = None
+        # First-token phases run here so they can be timed out and hedged
+        self._executor = ThreadPoolExecutor(max_workers=self.config.pool_size, thread_name_prefix="fitbot-upstream")
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+        self.latency = LatencyTracker()
+
+    def _limits(self) -> "httpx.Limits":
+        return httpx.Limits(
+            max_connections=self.config.pool_size,
+            max_keepalive_connections=self.config.keepalive,
+            keepalive_expiry=self.config.keepalive_expiry
+        )
+
+    def _timeout(self) -> "openai.Timeout":
+        # The read timeout bounds each wait for the next streamed chunk
+        return openai.Timeout(self.config.read_timeout, connect=self.config.connect_timeout)
+
+    @property
+    def client(self) -> "openai.OpenAI":
+        """The pooled sync client, built (and the SDK imported) on first use"""
+        if self._client is None:
+            load_sdk()
+            with self._lock:
+                if self._client is None:
+                    self._client = openai.OpenAI(
+                        api_key=self.api_key,
+                        base_url=self.base_url,
+                        http_client=openai.DefaultHttpxClient(limits=self._limits(), timeout=self._timeout()),
+                        max_retries=0
+                    )
+        return self._client
+
+    def async_client(self) -> "openai.AsyncOpenAI":
+        """A pooled async client for one event loop (use as ``async with``)"""
+        load_sdk()
+        return openai.AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            http_client=openai.DefaultAsyncHttpxClient(limits=self._limits(), timeout=self._timeout()),
+            max_retries=0
+        )
+
+    def warm_up(self):
+        """Import the SDK, build the client and open a pooled connection to the API
+
+        Takes the imports, DNS lookup and TLS handshake off the first
+        generation. A failure only means that request pays for them itself.
+        """
+        started = time.monotonic()
+        try:
+            self.client.with_options(timeout=self.config.connect_timeout).models.list()
+            outcome = 'ok'
+        except Exception as e:
+            outcome = type(e).__name__
+        observe('fitbot_warmup_seconds', time.monotonic() - started, outcome=outcome)
+
+    def start_warm_up(self) -> threading.Thread:
+        """Run ``warm_up`` on a daemon thread"""
+        thread = threading.Thread(target=self.warm_up, name="fitbot-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        with self._lock:
+            if model not in self._breakers:
+                self._breakers[model] = CircuitBreaker(self.config.breaker_failures, self.config.breaker_cooldown)
+            return self._breakers[model]
+
+    def route(self, model: str) -> List[str]:
+        """Models to try in order, putting the fallback first while the primary is degraded"""
+        fallback = self.config.fallback_model
+        if not fallback or fallback == model:
+            return [model]
+        p95 = self.latency.p95(model)
+        if self.breaker(model).is_open:
+            count('fitbot_upstream_fallbacks_total', reason='circuit_open')
+            return [fallback, model]
+        if p95 is not None and p95 > self.config.ttft_slo:
+            count('fitbot_upstream_fallbacks_total', reason='slo')
+            return [fallback, model]
+        return [model, fallback]
+
+    def degraded(self) -> bool:
+        """Whether requests are currently being routed away from some model"""
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return any(breaker.is_open for breaker in breakers)
+
+    def _hedge_delay(self, model: str) -> Optional[float]:
+        if not self.config.hedge:
+            return None
+        p95 = self.latency.p95(model)
+        return max(self.config.hedge_min_delay, p95) if p95 is not None else None
+
+    def _backoff(self, attempt: int, error: BaseException, deadline: float) -> float:
+        """Full-jitter exponential backoff, at least ``Retry-After``, within the deadline"""
+        delay = random.uniform(0, min(self.config.retry_max, self.config.retry_base * 2 ** attempt))
+        delay = max(delay, _retry_after(error) or 0.0)
+        return min(delay, max(deadline - time.monotonic(), 0.0))
+
+    def _failed(self, model: str, error: BaseException):
+        """An upstream failure (5xx, 429, timeout, dropped connection); counts towards the breaker"""
+        count('fitbot_upstream_attempts_total', model=model, outcome=type(error).__name__)
+        if self.breaker(model).record_failure():
+            count('fitbot_circuit_opened_total', model=model)
+
+    def _rejected(self, model: str, error: BaseException):
+        """A request upstream refused (bad prompt, bad key); says nothing about its health"""
+        count('fitbot_upstream_attempts_total', model=model, outcome=type(error).__name__)
+        self.breaker(model).release_trial()
+
+    def _succeeded(self, model: str, ttft: float):
+        count('fitbot_upstream_attempts_total', model=model, outcome='ok')
+        self.breaker(model).record_success()
+        self.latency.record(model, ttft)
+
+    # Synchronous streaming
+
+    def _open(self, model: str, params: Dict[str, Any]) -> Tuple[Any, List[Any], float]:
+        """Start a stream and read up to its first meaningful chunk"""
+        started = time.monotonic()
+        stream = self.client.chat.completions.create(model=model, stream=True, **params)
+        head = []
+        try:
+            for chunk in stream:
+                head.append(chunk)
+                if _starts_answer(chunk):
+                    break
+        except BaseException:
+            stream.close()
+            raise
+        return stream, head, time.monotonic() - started
+
+    @staticmethod
+    def _discard(future: Future):
+        # A losing or abandoned attempt: close its stream once it opens
+        if not future.cancelled() and future.exception() is None:
+            future.result()[0].close()
+
+    def _first_chunk(self, model: str, params: Dict[str, Any], timeout: float) -> Tuple[Any, List[Any], float]:
+        """One attempt's first-token phase, hedged with a duplicate request when slow"""
+        started = time.monotonic()
+        hedge_at = self._hedge_delay(model)
+        first = self._executor.submit(self._open, model, params)
+        pending = {first}
+        hedged = False
+        error: Optional[BaseException] = None
+        while pending:
+            now = time.monotonic()
+            wait_for = started + timeout - now
+            if hedge_at is not None and not hedged:
+                wait_for = min(wait_for, started + hedge_at - now)
+            done, pending = wait(pending, timeout=max(wait_for, 0.0), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # Both attempts can finish in the same pass; only one is read
+                    for other in (done | pending) - {future}:
+                        other.add_done_callback(self._discard)
+                    if hedged:
+                        count('fitbot_upstream_hedges_total', outcome='won' if future is not first else 'lost')
+                    return future.result()
+                error = future.exception()
+            if done or not pending:
+                continue
+            if hedge_at is not None and not hedged and time.monotonic() >= started + hedge_at:
+                pending.add(self._executor.submit(self._open, model, params))
+                hedged = True
+            elif time.monotonic() >= started + timeout:
+                for future in pending:
+                    future.add_done_callback(self._discard)
+                raise AttemptTimeout(f"no response from {model} within {timeout:.0f}s")
+        raise error
+
+    def stream_chat(self, model: str, **params) -> Iterator[Any]:
+        """Stream chat completion chunks like ``chat.completions.create(stream=True)``
+
+        Raises TransportError subclasses (or the SDK's error for requests
+        that would never succeed, such as a bad request).
+        """
+        deadline = time.monotonic() + self.config.total_deadline
+        last_error: Optional[BaseException] = None
+        for model_name in self.route(model):
+            breaker = self.breaker(model_name)
+            for attempt in range(self.config.max_retries + 1):
+                if not breaker.allow():
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise DeadlineExceeded("The AI service took too long to answer. Please try again.")
+                try:
+                    stream, head, ttft = self._first_chunk(model_name, params, min(self.config.attempt_timeout, remaining))
+                except Exception as e:
+                    if not is_retryable(e):
+                        self._rejected(model_name, e)
+                        raise
+                    self._failed(model_name, e)
+                    last_error = e
+                    if attempt < self.config.max_retries:
+                        count('fitbot_upstream_retries_total', model=model_name)
+                        time.sleep(self._backoff(attempt, e, deadline))
+                    continue
+                self._succeeded(model_name, ttft)
+                yield from self._rest(model_name, stream, head, deadline)
+                return
+        raise UpstreamUnavailable(
+            "The AI service is unavailable right now. Please try again in a minute."
+        ) from last_error
+
+    def _rest(self, model: str, stream: Any, head: List[Any], deadline: float) -> Iterator[Any]:
+        try:
+            yield from head
+            for chunk in stream:
+                if time.monotonic() > deadline:
+                    raise DeadlineExceeded("The AI service took too long to finish the answer.")
+                yield chunk
+        except (openai.APIError, httpx.HTTPError) as e:
+            if is_retryable(e):
+                self._failed(model, e)
+            else:
+                self._rejected(model, e)
+            raise TransportError("The connection to the AI service dropped mid-answer. Please try again.") from e
+        finally:
+            stream.close()
+
+    # Asynchronous streaming (for concurrent section requests)
+
+    async def _aopen(self, client: "openai.AsyncOpenAI", model: str, params: Dict[str, Any]) -> Tuple[Any, List[Any], float]:
+        started = time.monotonic()
+        stream = await client.chat.completions.create(model=model, stream=True, **params)
+        head = []
+        try:
+            async for chunk in stream:
+                head.append(chunk)
+                if _starts_answer(chunk):
+                    break
+        except BaseException:
+            await stream.close()
+            raise
+        return stream, head, time.monotonic() - started
+
+    async def _afirst_chunk(self, client: "openai.AsyncOpenAI", model: str, params: Dict[str, Any],
+                            timeout: float) -> Tuple[Any, List[Any], float]:
+        started = time.monotonic()
+        hedge_at = self._hedge_delay(model)
+        first = asyncio.ensure_future(self._aopen(client, model, params))
+        pending = {first}
+        hedged = False
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                now = time.monotonic()
+                wait_for = started + timeout - now
+                if hedge_at is not None and not hedged:
+                    wait_for = min(wait_for, started + hedge_at - now)
+                done, pending = await asyncio.wait(pending, timeout=max(wait_for, 0.0), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        # Both attempts can finish in the same pass; only one is read
+                        for other in done - {task}:
+                            if other.exception() is None:
+                                await other.result()[0].close()
+                        if hedged:
+                            count('fitbot_upstream_hedges_total', outcome='won' if task is not first else 'lost')
+                        return task.result()
+                    error = task.exception()
+                if done or not pending:
+                    continue
+                if hedge_at is not None and not hedged and time.monotonic() >= started + hedge_at:
+                    pending.add(asyncio.ensure_future(self._aopen(client, model, params)))
+                    hedged = True
+                elif time.monotonic() >= started + timeout:
+                    raise AttemptTimeout(f"no response from {model} within {timeout:.0f}s")
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def astream_chat(self, client: "openai.AsyncOpenAI", model: str, **params) -> AsyncIterator[Any]:
+        """Async counterpart of ``stream_chat`` using a client from ``async_client``"""
+        deadline = time.monotonic() + self.config.total_deadline
+        last_error: Optional[BaseException] = None
+        for model_name in self.route(model):
+            breaker = self.breaker(model_name)
+            for attempt in range(self.config.max_retries + 1):
+                if not breaker.allow():
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise DeadlineExceeded("The AI service took too long to answer. Please try again.")
+                try:
+                    stream, head, ttft = await self._afirst_chunk(
+                        client, model_name, params, min(self.config.attempt_timeout, remaining)
+                    )
+                except Exception as e:
+                    if not is_retryable(e):
+                        self._rejected(model_name, e)
+                        raise
+                    self._failed(model_name, e)
+                    last_error = e
+                    if attempt < self.config.max_retries:
+                        count('fitbot_upstream_retries_total', model=model_name)
+                        await asyncio.sleep(self._backoff(attempt, e, deadline))
+                    continue
+                self._succeeded(model_name, ttft)
+                try:
+                    for chunk in head:
+                        yield chunk
+                    async for chunk in stream:
+                        if time.monotonic() > deadline:
+                            raise DeadlineExceeded("The AI service took too long to finish the answer.")
+                        yield chunk
+                except (openai.APIError, httpx.HTTPError) as e:
+                    if is_retryable(e):
+                        self._failed(model_name, e)
+                    else:
+                        self._rejected(model_name, e)
+                    raise TransportError("The connection to the AI service dropped mid-answer. Please try again.") from e
+                finally:
+                    await stream.close()
+                return
+        raise UpstreamUnavailable(
+            "The AI service is unavailable right now. Please try again in a minute."
+        ) from last_error
@@ -0,0 +1,145 @@
+"""Persistent, content-addressed cache for generated fitness plans
+
+Plans are stored in a local SQLite database keyed on a hash of the
+normalized profile, the plan language, the model name and the prompt
+template version, so identical profiles are answered without an API call
+and the cache survives process restarts.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from units import parse_height_cm, parse_weight_kg
+
+DATA_DIR = os.getenv("FITBOT_DATA_DIR", ".fitbot")
+DEFAULT_DB_PATH = os.path.join(DATA_DIR, "plan_cache.sqlite3")
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 30 * 24 * 3600
+
+# Free-text answers that all mean "nothing to report"
+_EMPTY_ANSWERS = {'', 'none', 'no', 'n/a', 'na', 'nothing', 'ninguna', 'ninguno', 'nada'}
+
+def _normalize_text(value: Any) -> str:
+    text = re.sub(r"\s+", " ", str(value or '')).strip().lower().rstrip('.')
+    return 'none' if text in _EMPTY_ANSWERS else text
+
+def normalize_profile(user_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Canonical form of a profile so equivalent inputs share a cache key
+
+    Weight is rounded to the nearest 0.5 kg and height to the nearest cm, so
+    "154lbs" and "70kg" normalize to the same value.
+    """
+    normalized = {}
+    for field, value in user_data.items():
+        if field == 'weight':
+            kg = parse_weight_kg(value)
+            normalized[field] = round(kg * 2) / 2 if kg else _normalize_text(value)
+        elif field == 'height':
+            cm = parse_height_cm(value)
+            normalized[field] = round(cm) if cm else _normalize_text(value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            normalized[field] = int(value) if float(value).is_integer() else value
+        else:
+            normalized[field] = _normalize_text(value)
+    return normalized
+
+def plan_cache_key(user_data: Dict[str, Any], language: str, model: str, prompt_version: str) -> str:
+    """Content address for a plan request"""
+    payload = {
+        'profile': normalize_profile(user_data),
+        'language': language,
+        'model': model,
+        'prompt_version': prompt_version
+    }
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+class PlanCache:
+    """SQLite-backed plan cache with LRU + TTL eviction and a size cap"""
+    
+    def __init__(self, path: str = DEFAULT_DB_PATH, max_bytes: int = DEFAULT_MAX_BYTES,
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS plans (
+                    key TEXT PRIMARY KEY,
+                    plan TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS plans_accessed ON plans (accessed_at)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+    
+    def _count(self, name: str):
+        self._conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,)
+        )
+    
+    def get(self, key: str) -> Optional[str]:
+        """Cached plan for a key, or None on a miss or an expired entry"""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT plan, created_at FROM plans WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                if row is not None:
+                    self._conn.execute("DELETE FROM plans WHERE key = ?", (key,))
+                self._count('misses')
+                return None
+            self._conn.execute("UPDATE plans SET accessed_at = ? WHERE key = ?", (now, key))
+            self._count('hits')
+            return row[0]
+    
+    def put(self, key: str, plan: str):
+        """Store a plan and evict expired and least recently used entries"""
+        now = time.time()
+        size = len(plan.encode('utf-8'))
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO plans (key, plan, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, plan, size, now, now)
+            )
+            self._evict(now)
+    
+    def _evict(self, now: float):
+        self._conn.execute("DELETE FROM plans WHERE created_at < ?", (now - self.ttl_seconds,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM plans").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute("SELECT key, size FROM plans ORDER BY accessed_at").fetchall():
+            self._conn.execute("DELETE FROM plans WHERE key = ?", (key,))
+            self._count('evictions')
+            total -= size
+            if total <= self.max_bytes:
+                break
+    
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss/eviction counters plus current entry count and size"""
+        with self._lock:
+            counters = dict(self._conn.execute("SELECT name, value FROM counters").fetchall())
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM plans").fetchone()
+        return {
+            'hits': counters.get('hits', 0),
+            'misses': counters.get('misses', 0),
+            'evictions': counters.get('evictions', 0),
+            'entries': entries,
+            'bytes': size
+        }
@@ -0,0 +1,384 @@
+"""Downloadable plan exports: Markdown, PDF and an ICS calendar of workout days
+
+Artifacts are rendered from the plan the user is looking at and cached in
+SQLite by plan hash and format, so each one is built once and every later
+download, from any session, is a lookup. Rendering only needs the
+standard library: the PDF writer lays plain text out in the built-in
+Helvetica fonts (emojis are dropped), and the calendar repeats each
+workout day weekly for the length of the program.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from plan_history import split_plan
+
+DATA_DIR = os.getenv("FITBOT_DATA_DIR", ".fitbot")
+DEFAULT_DB_PATH = os.path.join(DATA_DIR, "exports.sqlite3")
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024
+# Download buttons read artifacts on every rerun; access times are only
+# written back this often
+TOUCH_SECONDS = 60
+# Bump whenever rendering changes so cached artifacts are rebuilt
+EXPORT_VERSION = "3"
+
+# format -> (file extension, MIME type)
+EXPORT_FORMATS = {
+    'markdown': ("md", "text/markdown"),
+    'pdf': ("pdf", "application/pdf"),
+    'ics': ("ics", "text/calendar")
+}
+
+CALENDAR_WEEKS = 12
+WORKOUT_HOUR = 7
+WORKOUT_MINUTES = 60
+WORKOUT_LABELS = {'english': "Workout", 'spanish': "Entrenamiento"}
+
+WEEKDAY_NAMES = (
+    ('monday', 'lunes'),
+    ('tuesday', 'martes'),
+    ('wednesday', 'miércoles', 'miercoles'),
+    ('thursday', 'jueves'),
+    ('friday', 'viernes'),
+    ('saturday', 'sábado', 'sabado'),
+    ('sunday', 'domingo')
+)
+# Schedule entries that are days off, not workouts
+REST_DAY = re.compile(r"\b(rest|off|descanso|libre)\b", re.IGNORECASE)
+# Weekdays used when a plan only says how many days a week to train
+TRAINING_PATTERNS = {
+    1: (0,),
+    2: (0, 3),
+    3: (0, 2, 4),
+    4: (0, 1, 3, 4),
+    5: (0, 1, 2, 3, 4),
+    6: (0, 1, 2, 3, 4, 5),
+    7: (0, 1, 2, 3, 4, 5, 6)
+}
+
+def export_key(source: str, fmt: str, language: str, week_start: Optional[date] = None) -> str:
+    """Cache key of an artifact: the exported plan's content reference, its format and, for calendars, the first week"""
+    payload = "\0".join([EXPORT_VERSION, fmt, language, week_start.isoformat() if week_start else "", source])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def export_file_name(fmt: str) -> str:
+    return f"fitbot-plan.{EXPORT_FORMATS[fmt][0]}"
+
+def next_week_start(today: date) -> date:
+    """Monday of the coming week, when an exported calendar starts"""
+    return today + timedelta(days=7 - today.weekday())
+
+class ExportCache:
+    """SQLite-backed artifact cache with least recently used eviction past a size cap"""
+
+    def __init__(self, path: str = DEFAULT_DB_PATH, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS exports (
+                    key TEXT PRIMARY KEY,
+                    format TEXT NOT NULL,
+                    data BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS exports_accessed ON exports (accessed_at)")
+
+    def has(self, key: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM exports WHERE key = ?", (key,)).fetchone() is not None
+
+    def get(self, key: str) -> Optional[bytes]:
+        """A cached artifact, or None if it has not been rendered yet"""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT data, accessed_at FROM exports WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if now - row[1] > TOUCH_SECONDS:
+                self._conn.execute("UPDATE exports SET accessed_at = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def put(self, key: str, fmt: str, data: bytes):
+        """Store an artifact and evict the least recently downloaded ones past the size cap"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO exports (key, format, data, size, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, fmt, data, len(data), time.time())
+            )
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM exports").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for old_key, size in self._conn.execute("SELECT key, size FROM exports ORDER BY accessed_at").fetchall():
+                self._conn.execute("DELETE FROM exports WHERE key = ?", (old_key,))
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+    def stats(self) -> Dict[str, int]:
+        """Artifact count and total size"""
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM exports").fetchone()
+        return {'entries': entries, 'bytes': size}
+
+def render_markdown(plan: str, title: str) -> bytes:
+    return f"# {title}\n\n{plan.strip()}\n".encode('utf-8')
+
+# --- PDF ---------------------------------------------------------------
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842  # A4 in points
+MARGIN = 56
+# style -> (font resource, size, indent)
+PDF_STYLES = {
+    'title': ("F2", 18.0, 0),
+    'h1': ("F2", 15.0, 0),
+    'h2': ("F2", 13.0, 0),
+    'h3': ("F2", 11.5, 0),
+    'body': ("F1", 10.5, 0),
+    'bullet': ("F1", 10.5, 14)
+}
+
+def _char_width(char: str) -> float:
+    """Approximate Helvetica advance width in em"""
+    if char in " il.,;:'!|jtf()[]-":
+        return 0.3
+    if char in "mwMW":
+        return 0.86
+    if char.isupper():
+        return 0.7
+    return 0.56
+
+def _wrap(text: str, width: float, size: float, bold: bool) -> List[str]:
+    scale = size * (1.06 if bold else 1.0)
+    lines, line, line_width = [], "", 0.0
+    for word in text.split(" "):
+        word_width = sum(_char_width(char) for char in word) * scale
+        space = _char_width(" ") * scale if line else 0.0
+        if line and line_width + space + word_width > width:
+            lines.append(line)
+            line, line_width = word, word_width
+        else:
+            line = f"{line} {word}" if line else word
+            line_width += space + word_width
+    lines.append(line)
+    return lines
+
+def _pdf_text(text: str) -> str:
+    """Inline markdown stripped and reduced to what the standard fonts can show"""
+    text = re.sub(r"\[([^\]]+)\]\(([^)]+)\)", r"\1 (\2)", text)
+    text = re.sub(r"(\*\*|__|\*|`)", "", text)
+    text = text.encode('cp1252', errors='ignore').decode('cp1252')
+    return re.sub(r"\s+", " ", text).strip()
+
+def _pdf_blocks(plan: str, title: str) -> List[Tuple[str, str]]:
+    blocks = [('title', _pdf_text(title))]
+    for raw in plan.splitlines():
+        line = raw.strip()
+        if not line or re.fullmatch(r"[-*_]{3,}|\|?[\s:|-]+\|?", line):
+            blocks.append(('gap', ""))
+            continue
+        heading = re.match(r"(#{1,6})\s*(.*)", line)
+        if heading:
+            style = ('h1', 'h2', 'h3')[min(len(heading.group(1)), 3) - 1]
+            blocks.append((style, _pdf_text(heading.group(2))))
+        elif re.match(r"[-*+]\s+", line):
+            blocks.append(('bullet', "\u2022 " + _pdf_text(line[1:])))
+        elif line.startswith("|"):
+            blocks.append(('body', "   ".join(_pdf_text(cell) for cell in line.strip("|").split("|"))))
+        else:
+            blocks.append(('body', _pdf_text(line)))
+    return [(style, text) for style, text in blocks if text or style == 'gap']
+
+def _pdf_escape(text: str) -> bytes:
+    encoded = text.encode('cp1252', errors='ignore')
+    return encoded.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+def _pdf_pages(blocks: List[Tuple[str, str]]) -> List[bytes]:
+    pages, ops = [], []
+    y = PAGE_HEIGHT - MARGIN
+    for style, text in blocks:
+        if style == 'gap':
+            y -= 6
+            continue
+        font, size, indent = PDF_STYLES[style]
+        leading = size * 1.35
+        if style in ('title', 'h1', 'h2', 'h3'):
+            y -= size * 0.6
+        for number, line in enumerate(_wrap(text, PAGE_WIDTH - 2 * MARGIN - indent, size, font == "F2")):
+            if y - leading < MARGIN:
+                pages.append(b"\n".join(ops))
+                ops, y = [], PAGE_HEIGHT - MARGIN
+            y -= leading
+            # Continuation lines of a bullet align with its text, not the bullet
+            x = MARGIN + indent + (8 if style == 'bullet' and number else 0)
+            ops.append(b"BT /%s %.1f Tf %.1f %.1f Td (%s) Tj ET" % (font.encode(), size, x, y, _pdf_escape(line)))
+    pages.append(b"\n".join(ops))
+    return [
+        page + b"\nBT /F1 8 Tf %d %d Td (%s) Tj ET" % (MARGIN, MARGIN // 2, _pdf_escape(f"FitBot \xb7 {number}/{len(pages)}"))
+        for number, page in enumerate(pages, start=1)
+    ]
+
+def _pdf_document(pages: List[bytes], title: str) -> bytes:
+    font = b"<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>"
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"",  # page tree, filled in once the page object numbers are known
+        font % b"Helvetica",
+        font % b"Helvetica-Bold",
+        b"<< /Title (%s) /Producer (FitBot) >>" % _pdf_escape(title)
+    ]
+    kids = []
+    for content in pages:
+        stream = zlib.compress(content)
+        objects.append(b"<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> >>" % (PAGE_WIDTH, PAGE_HEIGHT, len(objects))
+        )
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), len(kids))
+
+    out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R /Info 5 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+def render_pdf(plan: str, title: str) -> bytes:
+    """A4 PDF of a markdown plan"""
+    return _pdf_document(_pdf_pages(_pdf_blocks(plan, title)), _pdf_text(title))
+
+# --- ICS ---------------------------------------------------------------
+
+def _weekday(text: str) -> Optional[int]:
+    """Weekday a line starts with, ignoring markdown, emojis and "Day 1 -" prefixes"""
+    words = re.sub(r"^[\W\d_]*(?:(?:day|día|dia)\s*\d+\W*)?", "", text.lower())
+    for index, names in enumerate(WEEKDAY_NAMES):
+        if any(re.match(rf"{name}\b", words) for name in names):
+            return index
+    return None
+
+def _day_focus(line: str, weekday: int) -> str:
+    cleaned = _pdf_text(line).lstrip("#-*+ ").strip()
+    for name in WEEKDAY_NAMES[weekday]:
+        cleaned = re.sub(rf"^.*?\b{name}\b", "", cleaned, count=1, flags=re.IGNORECASE)
+    return cleaned.strip(" :-\u2013\u2014()").strip()
+
+def workout_days(plan: str, language: str, structured: Any = None,
+                 training_days: Optional[int] = None) -> List[Tuple[int, str, str]]:
+    """(weekday, focus, details) for each training day of a plan
+
+    Structured plans list their days; markdown plans are scanned for lines
+    starting with a weekday, followed by that day's exercises. Rest days and
+    days without exercises are left out. Days without a recognisable weekday
+    are spread over the week, and a plan with no day-by-day schedule falls
+    back to the profile's number of training days.
+    """
+    label = WORKOUT_LABELS.get(language, WORKOUT_LABELS['english'])
+    found: List[Tuple[Optional[int], str, str]] = []
+    if structured is not None and structured.days:
+        for day in structured.days:
+            details = "\n".join(f"{exercise.name}: {exercise.sets} x {exercise.reps}" for exercise in day.exercises)
+            found.append((_weekday(day.day), day.focus or day.day, details))
+        found = [day for day in found if day[2] and not REST_DAY.search(day[1])]
+    else:
+        sections = split_plan(plan)
+        lines = (sections['workout'] if sections else plan).splitlines()
+        current = None
+        for line in lines:
+            weekday = _weekday(line) if line.strip() else None
+            if weekday is not None:
+                current = [weekday, _day_focus(line, weekday), []]
+                found.append(current)
+            elif line.lstrip().startswith("#"):
+                current = None
+            elif current is not None and line.strip() and len(current[2]) < 12:
+                current[2].append(_pdf_text(line).lstrip("-*+ "))
+        found = [(weekday, focus, "\n".join(details)) for weekday, focus, details in found
+                 if details and not REST_DAY.search(focus)]
+
+    if not found:
+        count = min(max(int(training_days or 3), 1), 7)
+        return [(weekday, label, "") for weekday in TRAINING_PATTERNS[count]]
+    spread = iter(TRAINING_PATTERNS.get(len(found), TRAINING_PATTERNS[7]))
+    days, used = [], set()
+    for weekday, focus, details in found:
+        fallback = next(spread, None)
+        weekday = weekday if weekday is not None else fallback
+        if weekday is None or weekday in used:
+            continue
+        used.add(weekday)
+        days.append((weekday, f"{label}: {focus}" if focus else label, details))
+    return sorted(days)
+
+def _ics_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+def _ics_fold(line: str) -> str:
+    """Fold a content line at 75 octets without splitting a UTF-8 character"""
+    parts, current = [], ""
+    for char in line:
+        if len((current + char).encode('utf-8')) > (75 if not parts else 74):
+            parts.append(current)
+            current = ""
+        current += char
+    parts.append(current)
+    return "\r\n ".join(parts)
+
+def render_ics(days: List[Tuple[int, str, str]], week_start: date, title: str) -> bytes:
+    """Weekly repeating calendar events for each workout day, starting the week of ``week_start``"""
+    # DTSTAMP is when the calendar was created, in UTC (RFC 5545)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//FitBot//Fitness Plan//EN",
+        "CALSCALE:GREGORIAN",
+        f"X-WR-CALNAME:{_ics_escape(title)}"
+    ]
+    for weekday, summary, details in days:
+        start = datetime.combine(week_start + timedelta(days=weekday), datetime.min.time()).replace(hour=WORKOUT_HOUR)
+        # Stable across re-exports of the same week, so calendar apps update events in place
+        uid = hashlib.sha256(f"{week_start}|{weekday}|{summary}".encode('utf-8')).hexdigest()[:24]
+        lines += [
+            "BEGIN:VEVENT",
+            f"UID:{uid}@fitbot",
+            f"DTSTAMP:{stamp}",
+            f"DTSTART:{start:%Y%m%dT%H%M%S}",
+            f"DURATION:PT{WORKOUT_MINUTES}M",
+            f"RRULE:FREQ=WEEKLY;COUNT={CALENDAR_WEEKS}",
+            f"SUMMARY:{_ics_escape('💪 ' + summary)}",
+            f"DESCRIPTION:{_ics_escape(details)}",
+            "END:VEVENT"
+        ]
+    lines.append("END:VCALENDAR")
+    return ("\r\n".join(_ics_fold(line) for line in lines) + "\r\n").encode('utf-8')
+
+def render_export(fmt: str, plan: str, title: str, language: str, structured: Any = None,
+                  training_days: Optional[int] = None, week_start: Optional[date] = None) -> bytes:
+    """Render a plan in one of ``EXPORT_FORMATS``"""
+    if fmt == 'markdown':
+        return render_markdown(plan, title)
+    if fmt == 'pdf':
+        return render_pdf(plan, title)
+    if fmt == 'ics':
+        return render_ics(workout_days(plan, language, structured, training_days), week_start, title)
+    raise ValueError(f"unknown export format: {fmt}")
@@ -0,0 +1,185 @@
+"""Persisted plan history and incremental regeneration after profile edits
+
+Every generated plan is recorded in a local SQLite database with the
+profile it was written for, indexed by owner and by profile hash. When a
+user edits their profile, the fields that changed are mapped to the plan
+sections that depend on them and only those sections are regenerated; the
+rest of the previous plan is reused as is.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from plan_cache import normalize_profile
+from plan_labels import SECTION_TITLES
+from plan_prompts import PLAN_SECTIONS
+
+DATA_DIR = os.getenv("FITBOT_DATA_DIR", ".fitbot")
+DEFAULT_DB_PATH = os.path.join(DATA_DIR, "plan_history.sqlite3")
+DEFAULT_MAX_ENTRIES = 20
+
+ALL_SECTIONS = tuple(section['key'] for section in PLAN_SECTIONS)
+
+# Plan sections whose content depends on each profile field. Body
+# measurements feed the calculated metrics (BMI, calories, macros) quoted by
+# the assessment, nutrition and progress sections. Experience level and
+# injuries are not part of the generation prompts (only the quick-plan
+# personalization pass reads them), so editing them reuses every section.
+# Fields missing from the map regenerate the whole plan.
+FIELD_SECTIONS = {
+    'weight': ('assessment', 'nutrition', 'progress'),
+    'height': ('assessment', 'nutrition', 'progress'),
+    'age': ('assessment', 'nutrition', 'progress'),
+    'gender': ('assessment', 'nutrition', 'progress'),
+    'activity_level': ('assessment', 'nutrition', 'progress'),
+    'goal': ALL_SECTIONS,
+    'diet_restrictions': ('nutrition',),
+    'training_days': ('workout',),
+    'workout_pref': ('workout',),
+    'experience_level': (),
+    'injuries': ()
+}
+
+def profile_hash(user_data: Dict[str, Any]) -> str:
+    """Hash of the normalized profile, so equivalent answers match"""
+    encoded = json.dumps(normalize_profile(user_data), sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+def changed_fields(old: Dict[str, Any], new: Dict[str, Any]) -> List[str]:
+    """Profile fields whose normalized value differs between two profiles"""
+    old_normalized, new_normalized = normalize_profile(old), normalize_profile(new)
+    return sorted(field for field in set(old_normalized) | set(new_normalized)
+                  if old_normalized.get(field) != new_normalized.get(field))
+
+def affected_sections(old: Dict[str, Any], new: Dict[str, Any]) -> List[str]:
+    """Keys of the plan sections to regenerate after a profile edit, in plan order"""
+    affected = set()
+    for field in changed_fields(old, new):
+        affected.update(FIELD_SECTIONS.get(field, ALL_SECTIONS))
+    return [key for key in ALL_SECTIONS if key in affected]
+
+# Start of a heading line: markdown heading, bold text or a numbered item
+HEADING_PREFIX = r"\s*(?:(?:#{1,6}|\d+[.)]|\*\*|__)\s*)+"
+
+def split_plan(plan: str) -> Optional[Dict[str, str]]:
+    """Section texts of a markdown plan, or None if its headings cannot all be found
+
+    Works on assembled section plans (``## TITLE``) and on single-request
+    plans that kept the section titles in their headings, in any of the
+    plan languages (sections may even mix them). Only
+    heading-shaped lines count (``#``, bold or numbered, with nothing but
+    punctuation after the title), so prose naming a section is not taken
+    for its heading. A split that leaves a section other than the last
+    empty is rejected as well.
+    """
+    lines = plan.splitlines()
+    starts, position = [], 0
+    for section in PLAN_SECTIONS:
+        # Match on the words of the title; models often drop or swap the emoji
+        titles = [
+            r"\W+".join(map(re.escape, re.sub(r"[^\w\s]", " ", localized[section['key']]).split()))
+            for localized in SECTION_TITLES.values()
+        ]
+        pattern = re.compile(HEADING_PREFIX + r"\W*?(?:" + "|".join(titles) + r")\W*$", re.IGNORECASE)
+        index = next((i for i in range(position, len(lines)) if pattern.match(lines[i])), None)
+        if index is None:
+            return None
+        starts.append(index)
+        position = index + 1
+    sections = {}
+    for number, section in enumerate(PLAN_SECTIONS):
+        end = starts[number + 1] if number + 1 < len(starts) else len(lines)
+        sections[section['key']] = "\n".join(lines[starts[number] + 1:end]).strip()
+    if not all(sections[section['key']] for section in PLAN_SECTIONS[:-1]):
+        return None
+    return sections
+
+class PlanHistory:
+    """SQLite log of generated plans per owner, trimmed to the most recent entries"""
+
+    def __init__(self, path: str = DEFAULT_DB_PATH, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    owner TEXT NOT NULL,
+                    profile_hash TEXT NOT NULL,
+                    profile TEXT NOT NULL,
+                    language TEXT NOT NULL,
+                    mode TEXT NOT NULL,
+                    plan TEXT NOT NULL,
+                    plan_sha256 TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS history_owner ON history (owner, created_at)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS history_profile ON history (profile_hash)")
+
+    @staticmethod
+    def _entry(row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        entry = dict(row)
+        entry['profile'] = json.loads(entry['profile'])
+        return entry
+
+    def record(self, owner: str, user_data: Dict[str, Any], language: str, mode: str, plan: str) -> int:
+        """Add a plan to an owner's history and return its entry ID
+
+        Recording the same profile and plan the owner already has at the
+        top of their history returns that entry instead of adding a duplicate.
+        """
+        digest = hashlib.sha256(plan.encode('utf-8')).hexdigest()
+        profile_digest = profile_hash(user_data)
+        with self._lock, self._conn:
+            latest = self._conn.execute(
+                "SELECT id, profile_hash, plan_sha256, language FROM history WHERE owner = ? "
+                "ORDER BY created_at DESC LIMIT 1", (owner,)
+            ).fetchone()
+            if latest is not None and (latest['profile_hash'], latest['plan_sha256'], latest['language']) == (profile_digest, digest, language):
+                return latest['id']
+            cursor = self._conn.execute(
+                "INSERT INTO history (owner, profile_hash, profile, language, mode, plan, plan_sha256, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (owner, profile_digest, json.dumps(user_data, ensure_ascii=False), language, mode, plan,
+                 digest, time.time())
+            )
+            self._conn.execute(
+                "DELETE FROM history WHERE owner = ? AND id NOT IN "
+                "(SELECT id FROM history WHERE owner = ? ORDER BY created_at DESC LIMIT ?)",
+                (owner, owner, self.max_entries)
+            )
+            return cursor.lastrowid
+
+    def get(self, entry_id: Optional[int]) -> Optional[Dict[str, Any]]:
+        """A history entry by ID, with its profile decoded"""
+        if entry_id is None:
+            return None
+        with self._lock:
+            return self._entry(self._conn.execute("SELECT * FROM history WHERE id = ?", (entry_id,)).fetchone())
+
+    def latest(self, owner: str) -> Optional[Dict[str, Any]]:
+        """An owner's most recent plan"""
+        with self._lock:
+            return self._entry(self._conn.execute(
+                "SELECT * FROM history WHERE owner = ? ORDER BY created_at DESC LIMIT 1", (owner,)
+            ).fetchone())
+
+    def stats(self) -> Dict[str, int]:
+        """Entry and owner counts"""
+        with self._lock:
+            entries, owners = self._conn.execute("SELECT COUNT(*), COUNT(DISTINCT owner) FROM history").fetchone()
+        return {'entries': entries, 'owners': owners}
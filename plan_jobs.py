@@ -0,0 +1,172 @@
+"""Process-wide background job queue for plan generation
+
+Plans are generated on a shared thread pool instead of the Streamlit
+script thread, so a rerun while a plan is being written (changing the
+language, clicking a sidebar button) no longer abandons the request.
+Sessions keep only the job ID and poll it for progress. Identical
+submissions that arrive while a job is still running join that job
+(single-flight), so a burst of the same request costs one upstream call.
+With an admission controller, new jobs also reserve their API cost on
+submission and wait their turn against the rate limits before they are
+handed to a worker, so jobs that make no API call (exports) are never
+stuck behind them. A queued job is cancelled, and its reservation
+returned, when every session waiting for it gives up.
+"""
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from admission import AdmissionController, Ticket
+
+# Finished jobs stay readable this long so every waiting session sees the result
+JOB_RETENTION_SECONDS = 600
+
+class Job:
+    """One background generation and the progress its worker has reported"""
+
+    def __init__(self, job_id: str, key: str):
+        self.id = job_id
+        self.key = key
+        self.status = 'queued'
+        self.text = ""
+        self.progress = 0.0
+        self.result: Optional[str] = None
+        self.error: Optional[str] = None
+        self.subscribers = 1
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.ticket: Optional[Ticket] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ('done', 'failed')
+
+    def update(self, text: str, progress: Optional[float] = None):
+        """Publish the text generated so far (and progress from 0 to 1)"""
+        self.text = text
+        if progress is not None:
+            self.progress = progress
+
+class JobQueue:
+    """Thread pool of generation jobs with single-flight deduplication by key"""
+
+    def __init__(self, max_workers: int = 8, retention_seconds: float = JOB_RETENTION_SECONDS,
+                 admission: Optional[AdmissionController] = None):
+        self.retention_seconds = retention_seconds
+        self.admission = admission
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fitbot-job")
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Job] = {}
+        self._in_flight: Dict[str, Job] = {}
+        self.deduplicated = 0
+        # Jobs with a reservation, in ticket order, until they are admitted
+        self._admitting: "queue.Queue[Tuple[Job, Callable[[Job], str]]]" = queue.Queue()
+        if admission:
+            threading.Thread(target=self._dispatch, name="fitbot-admission", daemon=True).start()
+
+    def submit(self, key: str, work: Callable[[Job], str], cost: Optional[Tuple[int, int]] = None) -> Job:
+        """Run ``work(job)`` in the background, or join the running job for ``key``
+
+        ``work`` reports progress through ``job.update`` and returns the
+        finished text; an exception marks the job failed. ``cost`` is the
+        (requests, tokens) a new job reserves with the admission controller,
+        which raises ``Overloaded`` when its queue is full.
+        """
+        with self._lock:
+            self._prune()
+            job = self._in_flight.get(key)
+            if job is not None:
+                job.subscribers += 1
+                self.deduplicated += 1
+                return job
+            job = Job(uuid.uuid4().hex, key)
+            if self.admission and cost:
+                job.ticket = self.admission.reserve(*cost)
+            self._jobs[job.id] = job
+            self._in_flight[key] = job
+            if job.ticket:
+                # Queued under the lock so the dispatcher sees jobs in ticket order
+                self._admitting.put((job, work))
+            else:
+                self._executor.submit(self._run, job, work)
+        return job
+
+    def _dispatch(self):
+        # Waits out the rate limits for one job at a time, then hands it to
+        # the pool; cancelled jobs are dropped without taking a worker
+        while True:
+            job, work = self._admitting.get()
+            if self.admission.wait(job.ticket):
+                self._executor.submit(self._run, job, work)
+
+    def cancel(self, job_id: Optional[str]):
+        """Stop waiting for a job; the last subscriber out cancels it if it has not started
+
+        A cancelled job gives back its admission reservation and is marked
+        failed, so anyone still polling it sees it end.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id) if job_id else None
+            if job is None or job.done:
+                return
+            job.subscribers -= 1
+            if job.subscribers > 0 or job.status != 'queued':
+                return
+            if job.ticket:
+                self.admission.cancel(job.ticket)
+            job.error = "cancelled"
+            job.status = 'failed'
+            job.finished = time.time()
+            job.progress = 1.0
+            if self._in_flight.get(job.key) is job:
+                del self._in_flight[job.key]
+
+    def _run(self, job: Job, work: Callable[[Job], str]):
+        with self._lock:
+            if job.done:
+                # Cancelled while waiting for a worker
+                return
+            job.status = 'running'
+        try:
+            job.result = work(job)
+            job.status = 'done'
+        except Exception as e:
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.finished = time.time()
+            job.progress = 1.0
+            with self._lock:
+                if self._in_flight.get(job.key) is job:
+                    del self._in_flight[job.key]
+
+    def get(self, job_id: Optional[str]) -> Optional[Job]:
+        """A job by ID; None once it has expired or if it never existed"""
+        with self._lock:
+            return self._jobs.get(job_id) if job_id else None
+
+    def queue_position(self, job: Job) -> Optional[Tuple[int, float]]:
+        """Position and ETA of a job still waiting for admission"""
+        return self.admission.position(job.ticket) if job.ticket and not job.ticket.admitted else None
+
+    def _prune(self):
+        cutoff = time.time() - self.retention_seconds
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished and job.finished < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def stats(self) -> Dict[str, Any]:
+        """Queued and running job counts and how many submissions were joined"""
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        stats = {
+            'queued': statuses.count('queued'),
+            'running': statuses.count('running'),
+            'deduplicated': self.deduplicated
+        }
+        if self.admission:
+            stats['rejected'] = self.admission.stats()['rejected']
+        return stats
@@ -0,0 +1,28 @@
+"""Localized labels shared by the plan generators and renderers
+
+Kept free of other imports so the offline skeleton build, the prompts and
+the structured plan renderer all use the same section headings.
+"""
+from typing import Dict
+
+# Plan section headings per language, keyed like ``PLAN_SECTIONS``
+SECTION_TITLES = {
+    'english': {
+        'assessment': "📊 PERSONAL ASSESSMENT",
+        'workout': "🏋️‍♂️ WEEKLY WORKOUT SCHEDULE",
+        'nutrition': "🥗 NUTRITION PLAN",
+        'progress': "📈 PROGRESS TRACKING",
+        'tips': "💡 SUCCESS TIPS"
+    },
+    'spanish': {
+        'assessment': "📊 EVALUACIÓN PERSONAL",
+        'workout': "🏋️‍♂️ PLAN SEMANAL DE ENTRENAMIENTO",
+        'nutrition': "🥗 PLAN DE NUTRICIÓN",
+        'progress': "📈 SEGUIMIENTO DEL PROGRESO",
+        'tips': "💡 CONSEJOS PARA EL ÉXITO"
+    }
+}
+
+def section_titles(language: str) -> Dict[str, str]:
+    """Localized section headings (English for unknown languages)"""
+    return SECTION_TITLES.get(language, SECTION_TITLES['english'])
@@ -0,0 +1,212 @@
+"""Prompt construction for fitness plan generation
+
+Kept free of Streamlit so the app, the section generator and headless
+tooling all build identical prompts.
+"""
+from typing import Any, Dict, List, Optional
+
+from fitness_metrics import compute_metrics
+from plan_labels import SECTION_TITLES
+
+PLAN_MODEL = "gpt-3.5-turbo"
+PLAN_MAX_TOKENS = 3000
+# Bump whenever the prompt template changes so cached plans are not reused
+PROMPT_VERSION = "2"
+SYSTEM_PROMPT = "You are a professional fitness and nutrition coach with expertise in creating personalized, safe, and effective fitness plans. Always prioritize user safety and encourage professional consultation when needed."
+
+# The five independent plan sections, in display order, with the token
+# budget each gets when generated as its own request. Their headings are in
+# plan_labels; prompts always name them in English
+PLAN_SECTIONS = [
+    {
+        'key': 'assessment',
+        'points': [
+            "BMI calculation and assessment",
+            "Fitness level evaluation",
+            "Goal feasibility and timeline"
+        ],
+        'max_tokens': 450
+    },
+    {
+        'key': 'workout',
+        'points': [
+            "Detailed day-by-day workout plan",
+            "Specific exercises with sets and reps",
+            "Progressive difficulty recommendations"
+        ],
+        'max_tokens': 1100
+    },
+    {
+        'key': 'nutrition',
+        'points': [
+            "Daily calorie target",
+            "Macronutrient breakdown",
+            "Meal timing suggestions",
+            "Sample meal ideas"
+        ],
+        'max_tokens': 800
+    },
+    {
+        'key': 'progress',
+        'points': [
+            "Key metrics to monitor",
+            "Timeline for expected results",
+            "Milestone checkpoints"
+        ],
+        'max_tokens': 400
+    },
+    {
+        'key': 'tips',
+        'points': [
+            "Motivation strategies",
+            "Common pitfalls to avoid",
+            "Lifestyle integration tips"
+        ],
+        'max_tokens': 350
+    }
+]
+
+SECTIONS_BY_KEY = {section['key']: section for section in PLAN_SECTIONS}
+
+# Budget for the short personalization pass over a precomputed skeleton
+PERSONALIZATION_MAX_TOKENS = 400
+PERSONALIZATION_TITLES = {
+    'english': "🎯 PERSONALIZED NOTES",
+    'spanish': "🎯 NOTAS PERSONALIZADAS"
+}
+
+# Longest profile answer quoted in a prompt. Free-text answers (injuries,
+# diet) beyond this are shortened here, so an essay in one field cannot
+# push the prompt over its token budget and cost the closing instructions.
+ANSWER_MAX_CHARS = 500
+
+def language_name(language: str) -> str:
+    """Language name used in prompt instructions"""
+    return "English" if language == 'english' else "Spanish"
+
+def answer(user_data: Dict[str, Any], field: str, default: str = 'Not specified') -> str:
+    """A profile answer as quoted in prompts, shortened to ``ANSWER_MAX_CHARS``"""
+    value = str(user_data.get(field, default))
+    return value if len(value) <= ANSWER_MAX_CHARS else value[:ANSWER_MAX_CHARS - 1].rstrip() + "…"
+
+def profile_block(user_data: Dict[str, Any]) -> str:
+    """The "Personal Information" lines shared by every plan prompt"""
+    return f"""    Personal Information:
+    - Weight: {answer(user_data, 'weight')}
+    - Height: {answer(user_data, 'height')}
+    - Age: {answer(user_data, 'age')}
+    - Gender: {answer(user_data, 'gender')}
+    - Activity Level: {answer(user_data, 'activity_level')}
+    - Primary Goal: {answer(user_data, 'goal')}
+    - Dietary Restrictions: {answer(user_data, 'diet_restrictions', 'None')}
+    - Available Training Days: {answer(user_data, 'training_days')} days per week
+    - Workout Preference: {answer(user_data, 'workout_pref')}"""
+
+def metrics_block(metrics: Optional[Dict[str, Any]]) -> str:
+    """Locally calculated metrics the model should quote rather than recompute"""
+    if not metrics:
+        return ""
+    return f"""
+    
+    Calculated Metrics (already computed, use these exact values and only comment on them; do not recalculate):
+    - BMI: {metrics['bmi']} ({metrics['bmi_category']})
+    - BMR (Mifflin-St Jeor): {metrics['bmr']} kcal/day
+    - Maintenance calories (TDEE): {metrics['tdee']} kcal/day
+    - Daily calorie target: {metrics['calorie_target']} kcal/day
+    - Macronutrients: {metrics['protein_g']} g protein, {metrics['carbs_g']} g carbohydrates, {metrics['fat_g']} g fat"""
+
+def _section_outline(section: Dict[str, Any], number: int) -> str:
+    points = "\n".join(f"    - {point}" for point in section['points'])
+    return f"    {number}. {SECTION_TITLES['english'][section['key']]}\n{points}"
+
+def build_plan_prompt(user_data: Dict[str, Any], language: str, metrics: Optional[Dict[str, Any]] = None) -> str:
+    """Build the plan generation prompt for a user profile"""
+    
+    outline = "\n    \n".join(
+        _section_outline(section, number) for number, section in enumerate(PLAN_SECTIONS, start=1)
+    )
+    
+    return f"""
+    Create a comprehensive, personalized fitness and nutrition plan in {language_name(language)} for someone with these characteristics:
+    
+{profile_block(user_data)}{metrics_block(metrics)}
+    
+    Please provide a comprehensive plan with the following sections:
+    
+{outline}
+    
+    Make it practical, motivating, and achievable. Use emojis and clear formatting.
+    Ensure the advice is safe and encourages consulting healthcare professionals when appropriate.
+    """
+
+def build_section_prompt(section_key: str, user_data: Dict[str, Any], language: str,
+                         metrics: Optional[Dict[str, Any]] = None) -> str:
+    """Build the prompt for a single plan section generated on its own"""
+    section = SECTIONS_BY_KEY[section_key]
+    points = "\n".join(f"    - {point}" for point in section['points'])
+    
+    return f"""
+    You are writing ONE section of a personalized fitness and nutrition plan in {language_name(language)} for someone with these characteristics:
+    
+{profile_block(user_data)}{metrics_block(metrics)}
+    
+    Write only the "{SECTION_TITLES['english'][section_key]}" section, covering:
+{points}
+    
+    Do not repeat the section heading and do not write any other section.
+    Make it practical, motivating, and achievable. Use emojis and clear formatting.
+    Ensure the advice is safe and encourages consulting healthcare professionals when appropriate.
+    """
+
+def build_personalization_prompt(skeleton: str, user_data: Dict[str, Any], language: str,
+                                 metrics: Optional[Dict[str, Any]] = None) -> str:
+    """Build the prompt asking only for notes on top of a precomputed skeleton"""
+    return f"""
+    A standard fitness and nutrition plan has already been prepared for someone with these characteristics:
+    
+{profile_block(user_data)}
+    - Experience Level: {answer(user_data, 'experience_level')}
+    - Injuries or Limitations: {answer(user_data, 'injuries', 'None')}{metrics_block(metrics)}
+    
+    The prepared plan:
+    
+{skeleton}
+    
+    Write ONLY a short "{PERSONALIZATION_TITLES.get(language, PERSONALIZATION_TITLES['english'])}" section in {language_name(language)} (under 250 words), covering:
+    - Exercise substitutions or precautions for the listed injuries or limitations
+    - Meal swaps for the listed dietary restrictions
+    - A brief, encouraging comment on the BMI and calorie target above
+    
+    Do not repeat the heading or the plan, and do not change any numbers.
+    Ensure the advice is safe and encourages consulting healthcare professionals when appropriate.
+    """
+
+def plan_messages(user_data: Dict[str, Any], language: str,
+                  metrics: Optional[Dict[str, Any]] = None) -> List[Dict[str, str]]:
+    """Chat messages for a plan generation request
+    
+    Metrics are computed from the profile unless precomputed ones are passed.
+    """
+    metrics = metrics or compute_metrics(user_data)
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": build_plan_prompt(user_data, language, metrics)}
+    ]
+
+def section_messages(section_key: str, user_data: Dict[str, Any], language: str,
+                     metrics: Optional[Dict[str, Any]] = None) -> List[Dict[str, str]]:
+    """Chat messages for a single-section generation request"""
+    metrics = metrics or compute_metrics(user_data)
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": build_section_prompt(section_key, user_data, language, metrics)}
+    ]
+
+def personalization_messages(skeleton: str, user_data: Dict[str, Any], language: str,
+                             metrics: Optional[Dict[str, Any]] = None) -> List[Dict[str, str]]:
+    """Chat messages for the personalization pass over a skeleton"""
+    metrics = metrics or compute_metrics(user_data)
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": build_personalization_prompt(skeleton, user_data, language, metrics)}
+    ]
@@ -0,0 +1,115 @@
+"""Concurrent per-section plan generation with AsyncOpenAI
+
+Each of the five plan sections is requested separately, with its own token
+budget, so wall-clock latency tracks the slowest section instead of the sum
+of all of them. A failing section degrades to a short notice while the
+other sections are kept.
+"""
+import asyncio
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    # Only for annotations; the transport imports the SDK when it is first needed
+    from openai import AsyncOpenAI
+
+from openai_transport import ResilientTransport
+
+from fitness_metrics import compute_metrics
+from plan_labels import section_titles
+from plan_prompts import PLAN_MODEL, PLAN_SECTIONS, section_messages
+from token_budget import count_message_tokens, fit_messages
+
+SECTION_ERROR = "⚠️ This section could not be generated right now: {error}"
+
+# Called with (section_key, text_so_far) as each section streams in
+DeltaCallback = Callable[[str, str], None]
+# Called with (section_key, usage) when a section finishes; usage holds
+# prompt/completion tokens, max_tokens, finish_reason and latency_s
+UsageCallback = Callable[[str, Dict[str, Any]], None]
+
+async def generate_section(client: "AsyncOpenAI", section_key: str, user_data: Dict[str, Any],
+                           language: str, max_tokens: int, semaphore: asyncio.Semaphore,
+                           on_delta: Optional[DeltaCallback] = None,
+                           metrics: Optional[Dict[str, Any]] = None,
+                           on_usage: Optional[UsageCallback] = None,
+                           transport: Optional[ResilientTransport] = None) -> str:
+    """Stream a single section, reporting the accumulated text as it grows
+    
+    With a ``transport`` the request gets its retries, deadline and model
+    fallback; otherwise ``client`` is called directly.
+    """
+    messages = fit_messages(section_messages(section_key, user_data, language, metrics))
+    params = {
+        'messages': messages,
+        'max_tokens': max_tokens,
+        'temperature': 0.7,
+        'stream_options': {"include_usage": True}
+    }
+    async with semaphore:
+        started = time.perf_counter()
+        if transport:
+            stream = transport.astream_chat(client, model=PLAN_MODEL, **params)
+        else:
+            stream = await client.chat.completions.create(model=PLAN_MODEL, stream=True, **params)
+        parts, usage, finish_reason, model = [], None, None, PLAN_MODEL
+        async for chunk in stream:
+            model = chunk.model or model
+            if chunk.usage:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            finish_reason = chunk.choices[0].finish_reason or finish_reason
+            if chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                if on_delta:
+                    on_delta(section_key, "".join(parts))
+        if on_usage:
+            on_usage(section_key, {
+                'prompt_tokens': usage.prompt_tokens if usage else count_message_tokens(messages),
+                'completion_tokens': usage.completion_tokens if usage else len(parts),
+                'max_tokens': max_tokens,
+                'finish_reason': finish_reason,
+                'latency_s': time.perf_counter() - started,
+                'model': model
+            })
+        return "".join(parts).strip()
+
+async def generate_sections(client: "AsyncOpenAI", user_data: Dict[str, Any], language: str,
+                            max_concurrency: int = 5, on_delta: Optional[DeltaCallback] = None,
+                            sections: Optional[List[str]] = None, budgets: Optional[Dict[str, int]] = None,
+                            on_usage: Optional[UsageCallback] = None,
+                            transport: Optional[ResilientTransport] = None) -> Tuple[Dict[str, str], List[str]]:
+    """Generate plan sections concurrently with bounded concurrency
+    
+    ``budgets`` overrides the default per-section ``max_tokens``. Returns
+    the section texts keyed by section key, in plan order, and the keys of
+    sections that failed (their text is replaced by a notice).
+    """
+    keys = sections or [section['key'] for section in PLAN_SECTIONS]
+    budgets = {**{section['key']: section['max_tokens'] for section in PLAN_SECTIONS}, **(budgets or {})}
+    semaphore = asyncio.Semaphore(max_concurrency)
+    metrics = compute_metrics(user_data)
+    
+    results = await asyncio.gather(
+        *(generate_section(client, key, user_data, language, budgets[key], semaphore, on_delta, metrics, on_usage, transport)
+          for key in keys),
+        return_exceptions=True
+    )
+    
+    texts, failed = {}, []
+    for key, result in zip(keys, results):
+        if isinstance(result, BaseException):
+            texts[key] = SECTION_ERROR.format(error=result)
+            failed.append(key)
+        else:
+            texts[key] = result
+    return texts, failed
+
+def assemble_plan(sections: Dict[str, str], language: str) -> str:
+    """Join section texts into a single markdown plan in plan order, under localized headings"""
+    titles = section_titles(language)
+    return "\n\n".join(
+        f"## {titles[section['key']]}\n\n{sections[section['key']]}"
+        for section in PLAN_SECTIONS if section['key'] in sections
+    )
@@ -0,0 +1,422 @@
+"""Precomputed plan skeletons bucketed by the categorical profile fields
+
+Goal, activity level, training days, workout preference, experience level
+and language span only a few thousand combinations. Each bucket gets a
+workout/nutrition skeleton built offline from deterministic templates and
+stored in a versioned, gzipped JSON library. At request time the matching
+skeleton is an O(1) dict lookup; exact numbers are filled in from the
+locally computed metrics and the model only writes a short personalization
+pass for injuries, diet restrictions and commentary.
+
+    python plan_skeletons.py build
+    python plan_skeletons.py show "Lose weight|Sedentary|3|Both|Beginner|english"
+"""
+import argparse
+import gzip
+import hashlib
+import itertools
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from fitness_metrics import BMI_CATEGORY_NAMES, localize_metrics
+from plan_labels import SECTION_TITLES
+
+# Bump when the on-disk layout changes; older files are rejected on load
+FORMAT_VERSION = 1
+# Bump when the build code (_day_types, _exercises, build_skeleton) changes
+# what it renders; libraries built by older code are then stale
+BUILD_VERSION = 1
+DATA_DIR = os.getenv("FITBOT_DATA_DIR", ".fitbot")
+DEFAULT_LIBRARY_PATH = os.path.join(DATA_DIR, f"plan_skeletons.v{FORMAT_VERSION}.json.gz")
+
+GOALS = ['Lose weight', 'Gain muscle', 'Maintain weight', 'Improve endurance', 'General fitness']
+ACTIVITY_LEVELS = ['Sedentary', 'Lightly active', 'Moderately active', 'Very active', 'Extremely active']
+TRAINING_DAYS = [1, 2, 3, 4, 5, 6, 7]
+WORKOUT_PREFS = ['Gym access', 'Home workouts only', 'Both']
+EXPERIENCE_LEVELS = ['Beginner', 'Intermediate', 'Advanced']
+PLAN_LANGUAGES = ['english', 'spanish']
+
+BUCKET_FIELDS = ('goal', 'activity_level', 'training_days', 'workout_pref', 'experience_level')
+
+# Localized template text. Exercise entries are (gym, home) pairs.
+TEXT = {
+    'english': {
+        'weekdays': ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'],
+        'rest': "Rest or light walk",
+        'bmi_line': "- **BMI:** {bmi} ({bmi_category})",
+        'tdee_line': "- **Maintenance calories:** {tdee} kcal/day",
+        'level_line': "- **Starting point:** {experience} lifter, currently {activity}",
+        'steps_line': "- **Daily step target:** {steps} steps",
+        'day_types': {
+            'full': "Full Body", 'push': "Push (chest, shoulders, triceps)", 'pull': "Pull (back, biceps)",
+            'legs': "Legs & Core", 'upper': "Upper Body", 'lower': "Lower Body & Core",
+            'intervals': "Interval Conditioning", 'long_cardio': "Long Steady Cardio",
+            'recovery': "Active Recovery"
+        },
+        'exercises': {
+            'push': [("Bench press", "Push-ups"), ("Overhead press", "Pike push-ups"),
+                     ("Incline dumbbell press", "Chair dips"), ("Triceps pushdown", "Diamond push-ups")],
+            'pull': [("Lat pulldown", "Inverted rows under a sturdy table"), ("Seated cable row", "Backpack rows"),
+                     ("Face pulls", "Superman holds"), ("Barbell curl", "Towel curls")],
+            'legs': [("Back squat", "Bodyweight squats"), ("Romanian deadlift", "Reverse lunges"),
+                     ("Leg press", "Glute bridges"), ("Standing calf raises", "Single-leg calf raises")],
+            'core': [("Plank", "Plank"), ("Cable crunch", "Dead bug")]
+        },
+        'intervals': ("Bike intervals: 8 × 30 s hard / 90 s easy", "High knees or jump rope: 8 × 30 s hard / 90 s easy"),
+        'long_cardio': ("Steady cardio (treadmill, bike or rower) 30-45 min at conversational pace",
+                        "Brisk walk, jog or cycle 30-45 min at conversational pace"),
+        'recovery': "20-30 min easy walk + 10 min mobility (hips, thoracic spine, ankles)",
+        'finisher': "Finisher: 8-10 min of intervals (30 s hard / 30 s easy)",
+        'sets_reps': "{sets} × {reps} reps",
+        'hold': "{sets} × 30-45 s",
+        'rest_between': "Rest {rest} between sets.",
+        'progression': {
+            'Beginner': "Weeks 1-2: learn the movements and stop 3 reps before failure. Add reps first, then load.",
+            'Intermediate': "Add a small amount of weight or 1-2 reps each week; deload every 5th week.",
+            'Advanced': "Alternate heavy and volume weeks; deload every 4th week and track top sets."
+        },
+        'calorie_line': "- **Daily calorie target:** {calorie_target} kcal",
+        'macro_line': "- **Macronutrients:** {protein_g} g protein · {carbs_g} g carbohydrates · {fat_g} g fat",
+        'timing': [
+            "Spread protein across 3-4 meals (roughly a palm-sized portion each).",
+            "Eat a carb + protein meal 1-3 h before training and a protein-rich meal within 2 h after.",
+            "Drink 2-3 L of water daily, more on training days."
+        ],
+        'meals': {
+            'Lose weight': ["Breakfast: Greek yogurt with berries and oats", "Lunch: Grilled chicken salad with quinoa",
+                            "Dinner: Baked fish, roasted vegetables and a small portion of rice",
+                            "Snack: Apple with a handful of almonds"],
+            'Gain muscle': ["Breakfast: Eggs, whole-grain toast and a banana", "Lunch: Beef or tofu rice bowl with vegetables",
+                            "Dinner: Salmon, sweet potato and greens", "Snack: Protein shake with milk and peanut butter"],
+            'Maintain weight': ["Breakfast: Oatmeal with nuts and fruit", "Lunch: Turkey and avocado wholegrain wrap",
+                                "Dinner: Chicken stir-fry with vegetables and noodles", "Snack: Cottage cheese with fruit"],
+            'Improve endurance': ["Breakfast: Oats with banana and honey", "Lunch: Pasta with chicken and tomato sauce",
+                                  "Dinner: Rice, beans, vegetables and lean meat or tofu",
+                                  "Snack: Whole-grain toast with jam before long sessions"],
+            'General fitness': ["Breakfast: Whole-grain cereal with milk and fruit", "Lunch: Lentil soup with bread and salad",
+                                "Dinner: Grilled chicken or tofu, potatoes and vegetables", "Snack: Yogurt with granola"]
+        },
+        'tracking': {
+            'Lose weight': ["Weekly average morning weight", "Waist measurement every 2 weeks", "Progress photos monthly"],
+            'Gain muscle': ["Top-set weights and reps per exercise", "Body weight weekly (aim +0.25-0.5%/week)", "Arm, chest and thigh measurements monthly"],
+            'Maintain weight': ["Weekly average weight (stay within ±1 kg)", "Workout consistency", "Energy and sleep quality"],
+            'Improve endurance': ["Resting heart rate weekly", "Time or distance for a benchmark session", "Perceived effort at a fixed pace"],
+            'General fitness': ["Workouts completed per week", "Push-up and plank benchmarks monthly", "Daily steps"]
+        },
+        'milestones': {
+            'Lose weight': ["Week 4: 1.5-3 kg down, habits established", "Week 8: 3-5 kg down, clothes fit looser", "Week 12: 5-7 kg down, reassess targets"],
+            'Gain muscle': ["Week 4: technique solid, lifts up 10-15%", "Week 8: visible changes, +1-2 kg body weight", "Week 12: reassess calories and training split"],
+            'Maintain weight': ["Week 4: routine is automatic", "Week 8: strength and fitness improving at stable weight", "Week 12: set a new performance goal"],
+            'Improve endurance': ["Week 4: benchmark session feels easier", "Week 8: 10% faster or longer benchmark", "Week 12: complete a longer event or test"],
+            'General fitness': ["Week 4: 3+ workouts/week consistently", "Week 8: benchmarks improved", "Week 12: pick a specific next goal"]
+        },
+        'tips': {
+            'Lose weight': ["Keep protein high to protect muscle while in a deficit", "Plan meals ahead so hunger does not decide for you", "Expect weekly fluctuations; judge trends over 2-3 weeks"],
+            'Gain muscle': ["Progressive overload matters more than exercise variety", "Sleep 7-9 hours; muscle is built during recovery", "Eat consistently, even on rest days"],
+            'Maintain weight': ["Anchor workouts to fixed times in your week", "Use the scale as a guide, not a judge", "Rotate activities you enjoy to stay engaged"],
+            'Improve endurance': ["Keep most cardio easy; make hard days truly hard", "Fuel longer sessions with carbohydrates", "Increase weekly volume by no more than ~10%"],
+            'General fitness': ["Consistency beats intensity", "Move a little every day, not just on workout days", "Celebrate small wins to build momentum"]
+        },
+        'experience': {'Beginner': "beginner", 'Intermediate': "intermediate", 'Advanced': "advanced"},
+        'activity': {
+            'Sedentary': "sedentary", 'Lightly active': "lightly active", 'Moderately active': "moderately active",
+            'Very active': "very active", 'Extremely active': "extremely active"
+        }
+    },
+    'spanish': {
+        'weekdays': ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo'],
+        'rest': "Descanso o caminata ligera",
+        'bmi_line': "- **IMC:** {bmi} ({bmi_category})",
+        'tdee_line': "- **Calorías de mantenimiento:** {tdee} kcal/día",
+        'level_line': "- **Punto de partida:** nivel {experience}, actualmente {activity}",
+        'steps_line': "- **Meta diaria de pasos:** {steps} pasos",
+        'day_types': {
+            'full': "Cuerpo Completo", 'push': "Empuje (pecho, hombros, tríceps)", 'pull': "Tirón (espalda, bíceps)",
+            'legs': "Piernas y Core", 'upper': "Tren Superior", 'lower': "Tren Inferior y Core",
+            'intervals': "Intervalos", 'long_cardio': "Cardio Continuo Largo",
+            'recovery': "Recuperación Activa"
+        },
+        'exercises': {
+            'push': [("Press de banca", "Flexiones"), ("Press militar", "Flexiones pica"),
+                     ("Press inclinado con mancuernas", "Fondos en silla"), ("Extensión de tríceps en polea", "Flexiones diamante")],
+            'pull': [("Jalón al pecho", "Remo invertido bajo una mesa firme"), ("Remo sentado en polea", "Remo con mochila"),
+                     ("Face pulls", "Supermán isométrico"), ("Curl con barra", "Curl con toalla")],
+            'legs': [("Sentadilla con barra", "Sentadillas con peso corporal"), ("Peso muerto rumano", "Zancadas hacia atrás"),
+                     ("Prensa de piernas", "Puente de glúteos"), ("Elevación de talones de pie", "Elevación de talones a una pierna")],
+            'core': [("Plancha", "Plancha"), ("Crunch en polea", "Dead bug")]
+        },
+        'intervals': ("Intervalos en bicicleta: 8 × 30 s fuerte / 90 s suave", "Rodillas altas o comba: 8 × 30 s fuerte / 90 s suave"),
+        'long_cardio': ("Cardio continuo (cinta, bici o remo) 30-45 min a ritmo conversacional",
+                        "Caminata rápida, trote o bici 30-45 min a ritmo conversacional"),
+        'recovery': "Caminata suave de 20-30 min + 10 min de movilidad (cadera, columna torácica, tobillos)",
+        'finisher': "Final: 8-10 min de intervalos (30 s fuerte / 30 s suave)",
+        'sets_reps': "{sets} × {reps} repeticiones",
+        'hold': "{sets} × 30-45 s",
+        'rest_between': "Descansa {rest} entre series.",
+        'progression': {
+            'Beginner': "Semanas 1-2: aprende los movimientos y detente 3 repeticiones antes del fallo. Aumenta primero repeticiones, luego peso.",
+            'Intermediate': "Añade un poco de peso o 1-2 repeticiones cada semana; descarga cada 5ª semana.",
+            'Advanced': "Alterna semanas pesadas y de volumen; descarga cada 4ª semana y registra tus series principales."
+        },
+        'calorie_line': "- **Meta calórica diaria:** {calorie_target} kcal",
+        'macro_line': "- **Macronutrientes:** {protein_g} g proteína · {carbs_g} g carbohidratos · {fat_g} g grasa",
+        'timing': [
+            "Reparte la proteína en 3-4 comidas (aproximadamente una palma por comida).",
+            "Come carbohidratos + proteína 1-3 h antes de entrenar y una comida rica en proteína en las 2 h siguientes.",
+            "Bebe 2-3 L de agua al día, más en días de entrenamiento."
+        ],
+        'meals': {
+            'Lose weight': ["Desayuno: Yogur griego con frutos rojos y avena", "Almuerzo: Ensalada de pollo a la plancha con quinoa",
+                            "Cena: Pescado al horno, verduras asadas y una porción pequeña de arroz",
+                            "Merienda: Manzana con un puñado de almendras"],
+            'Gain muscle': ["Desayuno: Huevos, pan integral y un plátano", "Almuerzo: Bowl de arroz con ternera o tofu y verduras",
+                            "Cena: Salmón, batata y verduras de hoja", "Merienda: Batido de proteína con leche y crema de cacahuete"],
+            'Maintain weight': ["Desayuno: Avena con frutos secos y fruta", "Almuerzo: Wrap integral de pavo y aguacate",
+                                "Cena: Salteado de pollo con verduras y fideos", "Merienda: Requesón con fruta"],
+            'Improve endurance': ["Desayuno: Avena con plátano y miel", "Almuerzo: Pasta con pollo y salsa de tomate",
+                                  "Cena: Arroz, frijoles, verduras y carne magra o tofu",
+                                  "Merienda: Pan integral con mermelada antes de sesiones largas"],
+            'General fitness': ["Desayuno: Cereal integral con leche y fruta", "Almuerzo: Sopa de lentejas con pan y ensalada",
+                                "Cena: Pollo o tofu a la plancha, papas y verduras", "Merienda: Yogur con granola"]
+        },
+        'tracking': {
+            'Lose weight': ["Promedio semanal del peso en ayunas", "Medida de cintura cada 2 semanas", "Fotos de progreso mensuales"],
+            'Gain muscle': ["Peso y repeticiones de la serie principal por ejercicio", "Peso corporal semanal (objetivo +0,25-0,5 %/semana)", "Medidas de brazo, pecho y muslo mensuales"],
+            'Maintain weight': ["Peso promedio semanal (dentro de ±1 kg)", "Constancia en los entrenamientos", "Energía y calidad del sueño"],
+            'Improve endurance': ["Frecuencia cardíaca en reposo semanal", "Tiempo o distancia en una sesión de referencia", "Esfuerzo percibido a un ritmo fijo"],
+            'General fitness': ["Entrenamientos completados por semana", "Pruebas mensuales de flexiones y plancha", "Pasos diarios"]
+        },
+        'milestones': {
+            'Lose weight': ["Semana 4: 1,5-3 kg menos, hábitos establecidos", "Semana 8: 3-5 kg menos, la ropa queda más holgada", "Semana 12: 5-7 kg menos, reevalúa objetivos"],
+            'Gain muscle': ["Semana 4: técnica sólida, cargas 10-15 % mayores", "Semana 8: cambios visibles, +1-2 kg de peso", "Semana 12: reevalúa calorías y división de entrenamiento"],
+            'Maintain weight': ["Semana 4: la rutina es automática", "Semana 8: más fuerza y condición con peso estable", "Semana 12: fija un nuevo objetivo de rendimiento"],
+            'Improve endurance': ["Semana 4: la sesión de referencia se siente más fácil", "Semana 8: referencia 10 % más rápida o larga", "Semana 12: completa una prueba o evento más largo"],
+            'General fitness': ["Semana 4: 3+ entrenamientos por semana de forma constante", "Semana 8: mejores marcas de referencia", "Semana 12: elige un siguiente objetivo concreto"]
+        },
+        'tips': {
+            'Lose weight': ["Mantén la proteína alta para proteger el músculo en déficit", "Planifica tus comidas para que el hambre no decida por ti", "Espera fluctuaciones semanales; evalúa tendencias de 2-3 semanas"],
+            'Gain muscle': ["La sobrecarga progresiva importa más que la variedad de ejercicios", "Duerme 7-9 horas; el músculo se construye en la recuperación", "Come de forma constante, también en días de descanso"],
+            'Maintain weight': ["Fija tus entrenamientos en horarios concretos de la semana", "Usa la báscula como guía, no como juez", "Alterna actividades que disfrutes para mantener la motivación"],
+            'Improve endurance': ["Haz la mayor parte del cardio suave; que los días duros sean realmente duros", "Aporta carbohidratos en las sesiones largas", "No aumentes el volumen semanal más de ~10 %"],
+            'General fitness': ["La constancia vence a la intensidad", "Muévete un poco cada día, no solo al entrenar", "Celebra los pequeños logros para ganar impulso"]
+        },
+        'experience': {'Beginner': "principiante", 'Intermediate': "intermedio", 'Advanced': "avanzado"},
+        'activity': {
+            'Sedentary': "sedentario", 'Lightly active': "ligeramente activo", 'Moderately active': "moderadamente activo",
+            'Very active': "muy activo", 'Extremely active': "extremadamente activo"
+        }
+    }
+}
+
+# Which weekdays (0 = Monday) to train on for each weekly frequency
+TRAINING_WEEKDAYS = {
+    1: [0], 2: [0, 3], 3: [0, 2, 4], 4: [0, 1, 3, 4], 5: [0, 1, 2, 4, 5], 6: [0, 1, 2, 3, 4, 5], 7: [0, 1, 2, 3, 4, 5, 6]
+}
+
+# goal -> (sets, rep range, rest between sets)
+GOAL_LOADING = {
+    'Lose weight': (3, "12-15", "45-60 s"),
+    'Gain muscle': (4, "8-12", "90-120 s"),
+    'Maintain weight': (3, "10-12", "60-90 s"),
+    'Improve endurance': (3, "15-20", "30-45 s"),
+    'General fitness': (3, "10-12", "60-90 s")
+}
+EXPERIENCE_SET_ADJUSTMENT = {'Beginner': -1, 'Intermediate': 0, 'Advanced': 1}
+DAILY_STEPS = {
+    'Sedentary': 6000, 'Lightly active': 7500, 'Moderately active': 8500,
+    'Very active': 10000, 'Extremely active': 10000
+}
+
+def bucket_key(user_data: Dict[str, Any], language: str) -> str:
+    """Library key for a profile: its categorical fields plus the language"""
+    values = [str(user_data.get(field, '')) for field in BUCKET_FIELDS]
+    if not user_data.get('experience_level'):
+        values[BUCKET_FIELDS.index('experience_level')] = 'Beginner'
+    return "|".join(values + [language])
+
+def all_buckets() -> List[Tuple[str, str, int, str, str, str]]:
+    """Every (goal, activity, days, preference, experience, language) combination"""
+    return list(itertools.product(GOALS, ACTIVITY_LEVELS, TRAINING_DAYS, WORKOUT_PREFS, EXPERIENCE_LEVELS, PLAN_LANGUAGES))
+
+def _day_types(days: int, goal: str, experience: str) -> List[str]:
+    if days == 3 and experience == 'Beginner':
+        types = ['full', 'full', 'full']
+    else:
+        types = {
+            1: ['full'], 2: ['full', 'full'], 3: ['push', 'pull', 'legs'],
+            4: ['upper', 'lower', 'upper', 'lower'], 5: ['push', 'pull', 'legs', 'upper', 'lower'],
+            6: ['push', 'pull', 'legs', 'push', 'pull', 'legs'],
+            7: ['push', 'pull', 'legs', 'push', 'pull', 'legs', 'recovery']
+        }[days]
+    if goal == 'Improve endurance' and days >= 2:
+        types[-1] = 'long_cardio'
+        if days >= 4:
+            types[len(types) // 2] = 'intervals'
+    return types
+
+def _exercises(day_type: str, text: Dict[str, Any], home: bool) -> List[Tuple[str, bool]]:
+    """(exercise name, is_timed_hold) pairs for a strength day"""
+    pick = 1 if home else 0
+    ex = {group: [pair[pick] for pair in pairs] for group, pairs in text['exercises'].items()}
+    chosen = {
+        'full': ex['legs'][:2] + ex['push'][:1] + ex['pull'][:1],
+        'push': ex['push'],
+        'pull': ex['pull'],
+        'legs': ex['legs'][:3],
+        'upper': ex['push'][:2] + ex['pull'][:2],
+        'lower': ex['legs'][:3]
+    }[day_type]
+    core = [] if day_type in ('push', 'pull', 'upper') else [ex['core'][0]]
+    return [(name, False) for name in chosen] + [(name, True) for name in core]
+
+def build_skeleton(goal: str, activity: str, days: int, preference: str, experience: str, language: str) -> str:
+    """Render the markdown skeleton for one bucket
+
+    Number placeholders such as ``{calorie_target}`` are left in place and
+    filled per request by ``fill_skeleton``.
+    """
+    text = TEXT[language]
+    titles = SECTION_TITLES[language]
+    sets, reps, rest = GOAL_LOADING[goal]
+    sets = max(2, sets + EXPERIENCE_SET_ADJUSTMENT[experience])
+
+    lines = [
+        f"## {titles['assessment']}",
+        text['bmi_line'],
+        text['tdee_line'],
+        text['level_line'].format(experience=text['experience'][experience], activity=text['activity'][activity]),
+        text['steps_line'].format(steps=f"{DAILY_STEPS[activity]:,}"),
+        "",
+        f"## {titles['workout']}",
+        text['progression'][experience] + " " + text['rest_between'].format(rest=rest),
+        ""
+    ]
+
+    day_types = iter(_day_types(days, goal, experience))
+    training_days = TRAINING_WEEKDAYS[days]
+    strength_count = 0
+    for weekday, weekday_name in enumerate(text['weekdays']):
+        if weekday not in training_days:
+            lines.append(f"**{weekday_name}:** {text['rest']}")
+            continue
+        day_type = next(day_types)
+        lines.append(f"**{weekday_name} – {text['day_types'][day_type]}**")
+        home = preference == 'Home workouts only' or (preference == 'Both' and strength_count % 2 == 1)
+        if day_type in ('intervals', 'long_cardio'):
+            lines.append(f"- {text[day_type][1 if home else 0]}")
+        elif day_type == 'recovery':
+            lines.append(f"- {text['recovery']}")
+        else:
+            strength_count += 1
+            for name, timed in _exercises(day_type, text, home):
+                volume = text['hold' if timed else 'sets_reps'].format(sets=sets, reps=reps)
+                lines.append(f"- {name}: {volume}")
+            if goal == 'Lose weight':
+                lines.append(f"- {text['finisher']}")
+        lines.append("")
+
+    if lines[-1]:
+        lines.append("")
+    lines += [f"## {titles['nutrition']}", text['calorie_line'], text['macro_line'], ""]
+    lines += [f"- {item}" for item in text['timing']] + [""]
+    lines += [f"- {meal}" for meal in text['meals'][goal]] + [""]
+    lines += [f"## {titles['progress']}"] + [f"- {item}" for item in text['tracking'][goal]] + [""]
+    lines += [f"- 🎯 {item}" for item in text['milestones'][goal]] + [""]
+    lines += [f"## {titles['tips']}"] + [f"- {item}" for item in text['tips'][goal]]
+    return "\n".join(lines)
+
+class _MissingMetric(dict):
+    def __missing__(self, key):
+        return "—"
+
+def fill_skeleton(skeleton: str, metrics: Optional[Dict[str, Any]], language: str) -> str:
+    """Substitute the locally computed metrics into a skeleton's placeholders"""
+    return skeleton.format_map(_MissingMetric(localize_metrics(metrics, language) or {}))
+
+def _template_digest() -> str:
+    # Changes whenever the build code, template text or loading tables
+    # change, so a library built from older templates is detectably stale
+    payload = json.dumps([BUILD_VERSION, TEXT, SECTION_TITLES, BMI_CATEGORY_NAMES, TRAINING_WEEKDAYS,
+                          GOAL_LOADING, EXPERIENCE_SET_ADJUSTMENT, DAILY_STEPS], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+def build_library(path: str = DEFAULT_LIBRARY_PATH) -> Dict[str, Any]:
+    """Build every bucket's skeleton and write the versioned library file"""
+    started = time.perf_counter()
+    skeletons = {
+        "|".join([goal, activity, str(days), preference, experience, language]):
+            build_skeleton(goal, activity, days, preference, experience, language)
+        for goal, activity, days, preference, experience, language in all_buckets()
+    }
+    library = {
+        'format_version': FORMAT_VERSION,
+        'library_version': _template_digest(),
+        'built_at': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        'skeletons': skeletons
+    }
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+        json.dump(library, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return {
+        'path': path,
+        'buckets': len(skeletons),
+        'library_version': library['library_version'],
+        'bytes': os.path.getsize(path),
+        'elapsed_s': round(time.perf_counter() - started, 3)
+    }
+
+class SkeletonLibrary:
+    """In-memory index over a built skeleton library file"""
+
+    def __init__(self, skeletons: Dict[str, str], library_version: str):
+        self.skeletons = skeletons
+        self.library_version = library_version
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_LIBRARY_PATH) -> Optional['SkeletonLibrary']:
+        """Load the library, or None if it is missing or in an older format"""
+        if not os.path.exists(path):
+            return None
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            library = json.load(f)
+        if library.get('format_version') != FORMAT_VERSION:
+            return None
+        return cls(library['skeletons'], library['library_version'])
+
+    @property
+    def is_stale(self) -> bool:
+        """Whether the library was built from templates other than the current ones"""
+        return self.library_version != _template_digest()
+
+    def lookup(self, user_data: Dict[str, Any], language: str) -> Optional[str]:
+        """Skeleton for a profile's bucket, or None if the bucket is unknown"""
+        return self.skeletons.get(bucket_key(user_data, language))
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or inspect the plan skeleton library")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Rebuild the library from the templates")
+    build.add_argument("--output", default=DEFAULT_LIBRARY_PATH)
+    show = sub.add_parser("show", help="Print one bucket's skeleton")
+    show.add_argument("key", help='e.g. "Lose weight|Sedentary|3|Both|Beginner|english"')
+    show.add_argument("--library", default=DEFAULT_LIBRARY_PATH)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        print(json.dumps(build_library(args.output), indent=2))
+        return
+    library = SkeletonLibrary.load(args.library)
+    if library is None:
+        parser.error(f"No skeleton library at {args.library}; run `python plan_skeletons.py build` first")
+    skeleton = library.skeletons.get(args.key)
+    if skeleton is None:
+        parser.error(f"Unknown bucket {args.key!r}")
+    print(skeleton)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Translation of finished plans into the other UI language
+
+Switching the sidebar language after a plan was generated produces the
+other version with one translation request instead of a new generation.
+Translations are stored in the plan cache under a key derived from the
+source plan's content, so every later switch for the same plan is an
+instant cache hit.
+"""
+import hashlib
+import json
+from typing import Dict, List
+
+from plan_prompts import language_name
+from token_budget import MAX_COMPLETION_TOKENS, count_tokens
+
+# Bump whenever the translation prompt changes so cached variants are not reused
+TRANSLATION_VERSION = "1"
+# Spanish runs somewhat longer than English; leave room for either direction
+TRANSLATION_TOKEN_RATIO = 1.3
+TRANSLATION_SYSTEM_PROMPT = "You are a professional translator of fitness and nutrition content. You translate faithfully and never add, drop or change advice."
+
+def translation_cache_key(source: str, source_language: str, target_language: str, model: str) -> str:
+    """Content address for a translated variant of a plan"""
+    payload = {
+        'source_sha256': hashlib.sha256(source.encode('utf-8')).hexdigest(),
+        'source_language': source_language,
+        'target_language': target_language,
+        'model': model,
+        'translation_version': TRANSLATION_VERSION
+    }
+    encoded = json.dumps(payload, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+def translation_max_tokens(source: str) -> int:
+    """Completion budget for translating a plan"""
+    return min(int(count_tokens(source) * TRANSLATION_TOKEN_RATIO) + 100, MAX_COMPLETION_TOKENS)
+
+def build_translation_prompt(source: str, target_language: str, structured: bool = False) -> str:
+    """Build the prompt translating a markdown plan, or the text values of a JSON plan"""
+    if structured:
+        instructions = f"""Translate every human-readable string value in this JSON fitness plan into {language_name(target_language)}.
+    Keep the keys, the structure, the number of entries and every number exactly as they are.
+    Reply with ONLY the translated JSON object."""
+    else:
+        instructions = f"""Translate this markdown fitness plan into {language_name(target_language)}.
+    Keep the markdown formatting, headings, emojis and every number exactly as they are.
+    Reply with ONLY the translated plan."""
+    return f"""
+    {instructions}
+    
+{source}
+    """
+
+def translation_messages(source: str, target_language: str, structured: bool = False) -> List[Dict[str, str]]:
+    """Chat messages for a plan translation request"""
+    return [
+        {"role": "system", "content": TRANSLATION_SYSTEM_PROMPT},
+        {"role": "user", "content": build_translation_prompt(source, target_language, structured)}
+    ]
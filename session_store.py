@@ -0,0 +1,197 @@
+"""Compact session state backed by a compressed, deduplicated blob store
+
+Sessions keep only short content references in ``st.session_state``; plan
+bodies and profiles live once in a zlib-compressed SQLite store keyed on
+their content hash, so a thousand tabs showing the same plan share one
+copy. A byte-bounded in-memory LRU in front of the store holds hot
+payloads and decoded views of them (parsed structured plans, profile
+dicts). Sessions that have been idle longer than the TTL are forgotten and
+their payloads dropped from memory; they are reloaded from disk if the
+session comes back.
+"""
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Set, Tuple
+
+DATA_DIR = os.getenv("FITBOT_DATA_DIR", ".fitbot")
+DEFAULT_DB_PATH = os.path.join(DATA_DIR, "session_store.sqlite3")
+DEFAULT_MEMORY_BYTES = 16 * 1024 * 1024
+DEFAULT_IDLE_SECONDS = 30 * 60
+DEFAULT_RETENTION_SECONDS = 7 * 24 * 3600
+
+def deep_size(value: Any, seen: Optional[Set[int]] = None) -> int:
+    """Approximate memory held by a value, following containers and object attributes"""
+    seen = set() if seen is None else seen
+    # Singletons are shared by every session and cost nothing extra
+    if id(value) in seen or value is None or isinstance(value, bool):
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, (str, bytes, int, float, bool)) or value is None:
+        return size
+    if isinstance(value, dict):
+        return size + sum(deep_size(k, seen) + deep_size(v, seen) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return size + sum(deep_size(item, seen) for item in value)
+    if hasattr(value, '__dict__'):
+        size += deep_size(vars(value), seen)
+    for slot in getattr(type(value), '__slots__', ()):
+        if hasattr(value, slot):
+            size += deep_size(getattr(value, slot), seen)
+    return size
+
+def content_ref(text: str) -> str:
+    """Content address of a payload; 128 bits keep references short"""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+class SessionStore:
+    """Content-addressed payload store with an in-memory LRU and per-session accounting"""
+
+    def __init__(self, path: str = DEFAULT_DB_PATH, memory_bytes: int = DEFAULT_MEMORY_BYTES,
+                 idle_seconds: float = DEFAULT_IDLE_SECONDS, retention_seconds: float = DEFAULT_RETENTION_SECONDS):
+        self.path = path
+        self.memory_bytes = memory_bytes
+        self.idle_seconds = idle_seconds
+        self.retention_seconds = retention_seconds
+        self._lock = threading.Lock()
+        # (ref, view) -> (value, size); view is None for the raw text
+        self._memory: "OrderedDict[Tuple[str, Optional[str]], Tuple[Any, int]]" = OrderedDict()
+        self._memory_used = 0
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evicted_sessions = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS blobs (
+                    ref TEXT PRIMARY KEY,
+                    data BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    raw_size INTEGER NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS blobs_accessed ON blobs (accessed_at)")
+
+    def _remember(self, key: Tuple[str, Optional[str]], value: Any, size: int):
+        if key in self._memory:
+            self._memory_used -= self._memory.pop(key)[1]
+        self._memory[key] = (value, size)
+        self._memory_used += size
+        while self._memory_used > self.memory_bytes and len(self._memory) > 1:
+            self._memory_used -= self._memory.popitem(last=False)[1][1]
+
+    def put(self, text: str) -> str:
+        """Store a payload once and return its reference"""
+        ref = content_ref(text)
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                data = zlib.compress(text.encode('utf-8'), 6)
+                self._conn.execute(
+                    "INSERT INTO blobs (ref, data, size, raw_size, accessed_at) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(ref) DO UPDATE SET accessed_at = excluded.accessed_at",
+                    (ref, data, len(data), len(text.encode('utf-8')), now)
+                )
+                self._conn.execute("DELETE FROM blobs WHERE accessed_at < ?", (now - self.retention_seconds,))
+            self._remember((ref, None), text, sys.getsizeof(text))
+        return ref
+
+    def get(self, ref: Optional[str]) -> Optional[str]:
+        """Payload for a reference, or None if it never existed or has expired"""
+        if not ref:
+            return None
+        with self._lock:
+            cached = self._memory.get((ref, None))
+            if cached is not None:
+                self._memory.move_to_end((ref, None))
+                self.hits += 1
+                return cached[0]
+            self.misses += 1
+            with self._conn:
+                row = self._conn.execute("SELECT data FROM blobs WHERE ref = ?", (ref,)).fetchone()
+                if row is None:
+                    return None
+                self._conn.execute("UPDATE blobs SET accessed_at = ? WHERE ref = ?", (time.time(), ref))
+            text = zlib.decompress(row[0]).decode('utf-8')
+            self._remember((ref, None), text, sys.getsizeof(text))
+            return text
+
+    def load(self, ref: Optional[str], decode: Callable[[str], Any]) -> Any:
+        """Decoded view of a payload, decoded once and kept in the LRU next to it
+
+        ``decode`` is identified by its qualified name, so pass a named
+        function. Callers must treat the returned object as read-only; it is
+        shared by every session holding the same reference.
+        """
+        key = (ref, decode.__qualname__)
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None:
+                self._memory.move_to_end(key)
+                return cached[0]
+        text = self.get(ref)
+        if text is None:
+            return None
+        value = decode(text)
+        with self._lock:
+            self._remember(key, value, deep_size(value))
+        return value
+
+    def touch(self, session_id: str, refs: Iterable[str], state_bytes: int):
+        """Record a session's activity, the references it holds and its state size"""
+        now = time.time()
+        with self._lock:
+            self._sessions[session_id] = {'seen': now, 'refs': {ref for ref in refs if ref}, 'state_bytes': state_bytes}
+            self._evict_idle(now)
+
+    def _evict_idle(self, now: float):
+        idle = [session_id for session_id, session in self._sessions.items() if now - session['seen'] > self.idle_seconds]
+        if not idle:
+            return
+        released = set()
+        for session_id in idle:
+            released |= self._sessions.pop(session_id)['refs']
+        self.evicted_sessions += len(idle)
+        # Payloads still shown by an active session stay in memory
+        for session in self._sessions.values():
+            released -= session['refs']
+        for key in [key for key in self._memory if key[0] in released]:
+            self._memory_used -= self._memory.pop(key)[1]
+
+    def usage(self, session_id: str) -> Dict[str, int]:
+        """A session's own state size and the in-memory bytes of the payloads it references"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return {'state_bytes': 0, 'cached_bytes': 0}
+            cached = sum(size for (ref, _), (_, size) in self._memory.items() if ref in session['refs'])
+            return {'state_bytes': session['state_bytes'], 'cached_bytes': cached}
+
+    def stats(self) -> Dict[str, int]:
+        """Session, memory and disk totals plus LRU hit/miss counters"""
+        with self._lock:
+            blobs, size, raw_size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(raw_size), 0) FROM blobs"
+            ).fetchone()
+            return {
+                'sessions': len(self._sessions),
+                'state_bytes': sum(session['state_bytes'] for session in self._sessions.values()),
+                'memory_bytes': self._memory_used,
+                'blobs': blobs,
+                'disk_bytes': size,
+                'raw_bytes': raw_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evicted_sessions': self.evicted_sessions
+            }
@@ -0,0 +1,299 @@
+"""Structured (JSON) fitness plans
+
+In structured mode the model returns the plan as a JSON object matching
+``PLAN_JSON_SCHEMA`` instead of free-form markdown. The reply is validated
+and parsed into compact ``__slots__`` dataclasses, so each section can be
+rendered on its own when the user opens it.
+"""
+import json
+import re
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+from fitness_metrics import compute_metrics
+from plan_prompts import SYSTEM_PROMPT, language_name, metrics_block, profile_block
+from plan_labels import section_titles
+
+# Bump when the schema changes so cached structured plans are not reused
+SCHEMA_VERSION = "1"
+STRUCTURED_MAX_TOKENS = 2500
+
+# Plan sections in display order; keys match the markdown plan sections
+STRUCTURED_SECTIONS = ('assessment', 'workout', 'nutrition', 'progress', 'tips')
+
+_STRING = {"type": "string"}
+_INTEGER = {"type": "integer"}
+
+PLAN_JSON_SCHEMA = {
+    "type": "object",
+    "required": ["assessment", "days", "nutrition", "milestones", "tips"],
+    "properties": {
+        "assessment": _STRING,
+        "days": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "required": ["day", "focus", "exercises"],
+                "properties": {
+                    "day": _STRING,
+                    "focus": _STRING,
+                    "exercises": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "required": ["name", "sets", "reps"],
+                            "properties": {
+                                "name": _STRING,
+                                "sets": _INTEGER,
+                                "reps": {"type": ["string", "integer"]},
+                                "rest_seconds": _INTEGER,
+                                "notes": _STRING
+                            }
+                        }
+                    }
+                }
+            }
+        },
+        "nutrition": {
+            "type": "object",
+            "required": ["calories", "protein_g", "carbs_g", "fat_g"],
+            "properties": {
+                "calories": _INTEGER,
+                "protein_g": _INTEGER,
+                "carbs_g": _INTEGER,
+                "fat_g": _INTEGER,
+                "meal_timing": _STRING,
+                "sample_meals": {"type": "array", "items": _STRING}
+            }
+        },
+        "milestones": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "required": ["week", "target"],
+                "properties": {"week": _INTEGER, "target": _STRING}
+            }
+        },
+        "tips": {"type": "array", "items": _STRING}
+    }
+}
+
+# Labels used when rendering sections, per language
+LABELS = {
+    'english': {
+        'sets_reps': "{sets} × {reps}", 'rest': "rest {seconds} s", 'exercise': "Exercise", 'prescription': "Sets × reps",
+        'calories': "Daily calories", 'macros': "Protein / carbs / fat", 'meal_timing': "Meal timing",
+        'sample_meals': "Sample meals", 'week': "Week {week}"
+    },
+    'spanish': {
+        'sets_reps': "{sets} × {reps}", 'rest': "descanso {seconds} s", 'exercise': "Ejercicio",
+        'prescription': "Series × reps", 'calories': "Calorías diarias", 'macros': "Proteína / carbohidratos / grasa",
+        'meal_timing': "Horario de comidas", 'sample_meals': "Comidas de ejemplo", 'week': "Semana {week}"
+    }
+}
+
+class PlanFormatError(ValueError):
+    """The model's reply is not a plan matching the schema"""
+
+@dataclass(slots=True)
+class Exercise:
+    name: str
+    sets: int
+    reps: str
+    rest_seconds: Optional[int] = None
+    notes: str = ""
+
+@dataclass(slots=True)
+class WorkoutDay:
+    day: str
+    focus: str
+    exercises: List[Exercise]
+
+@dataclass(slots=True)
+class NutritionTargets:
+    calories: int
+    protein_g: int
+    carbs_g: int
+    fat_g: int
+    meal_timing: str = ""
+    sample_meals: List[str] = field(default_factory=list)
+
+@dataclass(slots=True)
+class Milestone:
+    week: int
+    target: str
+
+@dataclass(slots=True)
+class StructuredPlan:
+    assessment: str
+    days: List[WorkoutDay]
+    nutrition: NutritionTargets
+    milestones: List[Milestone]
+    tips: List[str]
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "StructuredPlan":
+        """Build a plan from JSON data that has passed ``validate``"""
+        nutrition = data['nutrition']
+        return cls(
+            assessment=data['assessment'].strip(),
+            days=[
+                WorkoutDay(
+                    day=day['day'],
+                    focus=day['focus'],
+                    exercises=[
+                        Exercise(
+                            name=exercise['name'],
+                            sets=exercise['sets'],
+                            reps=str(exercise['reps']),
+                            rest_seconds=exercise.get('rest_seconds'),
+                            notes=exercise.get('notes') or ""
+                        )
+                        for exercise in day['exercises']
+                    ]
+                )
+                for day in data['days']
+            ],
+            nutrition=NutritionTargets(
+                calories=nutrition['calories'],
+                protein_g=nutrition['protein_g'],
+                carbs_g=nutrition['carbs_g'],
+                fat_g=nutrition['fat_g'],
+                meal_timing=nutrition.get('meal_timing') or "",
+                sample_meals=list(nutrition.get('sample_meals') or [])
+            ),
+            milestones=[Milestone(week=m['week'], target=m['target']) for m in data['milestones']],
+            tips=list(data['tips'])
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    def to_json(self) -> str:
+        """Compact canonical JSON, as stored in the plan cache"""
+        return json.dumps(self.to_dict(), ensure_ascii=False, separators=(",", ":"))
+
+_TYPE_CHECKS = {
+    "object": lambda v: isinstance(v, dict),
+    "array": lambda v: isinstance(v, list),
+    "string": lambda v: isinstance(v, str),
+    "integer": lambda v: isinstance(v, int) and not isinstance(v, bool)
+}
+
+def validate(value: Any, schema: Dict[str, Any] = PLAN_JSON_SCHEMA, path: str = "plan"):
+    """Check JSON data against the (small) subset of JSON Schema used here
+
+    Raises PlanFormatError naming the first offending field.
+    """
+    types = schema["type"] if isinstance(schema["type"], list) else [schema["type"]]
+    if not any(_TYPE_CHECKS[t](value) for t in types):
+        raise PlanFormatError(f"{path}: expected {' or '.join(types)}, got {type(value).__name__}")
+    if isinstance(value, dict):
+        for name in schema.get("required", []):
+            if name not in value:
+                raise PlanFormatError(f"{path}: missing '{name}'")
+        for name, subschema in schema.get("properties", {}).items():
+            if name in value and not (value[name] is None and name not in schema.get("required", [])):
+                validate(value[name], subschema, f"{path}.{name}")
+    elif isinstance(value, list):
+        for i, item in enumerate(value):
+            validate(item, schema["items"], f"{path}[{i}]")
+
+def parse_plan(text: str) -> StructuredPlan:
+    """Parse and validate a JSON plan reply (tolerating a markdown code fence)"""
+    text = re.sub(r"^\s*```(?:json)?\s*|\s*```\s*$", "", text)
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise PlanFormatError(f"plan is not valid JSON: {e}") from None
+    validate(data)
+    return StructuredPlan.from_dict(data)
+
+def render_section(plan: StructuredPlan, key: str, language: str) -> str:
+    """Markdown for a single plan section"""
+    labels = LABELS.get(language, LABELS['english'])
+    if key == 'assessment':
+        return plan.assessment
+    if key == 'workout':
+        blocks = []
+        for day in plan.days:
+            rows = [f"| {labels['exercise']} | {labels['prescription']} |", "|---|---|"]
+            for exercise in day.exercises:
+                prescription = labels['sets_reps'].format(sets=exercise.sets, reps=exercise.reps)
+                if exercise.rest_seconds:
+                    prescription += f", {labels['rest'].format(seconds=exercise.rest_seconds)}"
+                name = f"{exercise.name} ({exercise.notes})" if exercise.notes else exercise.name
+                rows.append(f"| {name} | {prescription} |")
+            blocks.append(f"**{day.day}: {day.focus}**\n\n" + "\n".join(rows))
+        return "\n\n".join(blocks)
+    if key == 'nutrition':
+        n = plan.nutrition
+        lines = [
+            f"- **{labels['calories']}:** {n.calories} kcal",
+            f"- **{labels['macros']}:** {n.protein_g} g / {n.carbs_g} g / {n.fat_g} g"
+        ]
+        if n.meal_timing:
+            lines.append(f"- **{labels['meal_timing']}:** {n.meal_timing}")
+        if n.sample_meals:
+            lines.append(f"\n**{labels['sample_meals']}:**\n")
+            lines += [f"- {meal}" for meal in n.sample_meals]
+        return "\n".join(lines)
+    if key == 'progress':
+        return "\n".join(f"- **{labels['week'].format(week=m.week)}:** {m.target}" for m in plan.milestones)
+    if key == 'tips':
+        return "\n".join(f"- {tip}" for tip in plan.tips)
+    raise KeyError(key)
+
+def plan_markdown(plan: StructuredPlan, language: str) -> str:
+    """The whole plan as markdown, for copying and exports"""
+    titles = section_titles(language)
+    return "\n\n".join(f"## {titles[key]}\n\n{render_section(plan, key, language)}" for key in STRUCTURED_SECTIONS)
+
+def restore_numbers(translated: StructuredPlan, source: StructuredPlan) -> StructuredPlan:
+    """Copy every number from the source plan into its translation
+
+    Raises PlanFormatError when the translation changed the plan's shape.
+    """
+    def shape(plan: StructuredPlan):
+        return [len(day.exercises) for day in plan.days], len(plan.milestones)
+
+    if shape(translated) != shape(source):
+        raise PlanFormatError("translated plan does not match the original's structure")
+    for day, source_day in zip(translated.days, source.days):
+        for exercise, source_exercise in zip(day.exercises, source_day.exercises):
+            exercise.sets, exercise.rest_seconds = source_exercise.sets, source_exercise.rest_seconds
+    for name in ('calories', 'protein_g', 'carbs_g', 'fat_g'):
+        setattr(translated.nutrition, name, getattr(source.nutrition, name))
+    for milestone, source_milestone in zip(translated.milestones, source.milestones):
+        milestone.week = source_milestone.week
+    return translated
+
+def build_structured_plan_prompt(user_data: Dict[str, Any], language: str,
+                                 metrics: Optional[Dict[str, Any]] = None) -> str:
+    """Build the prompt asking for the plan as JSON matching the schema"""
+    return f"""
+    Create a personalized fitness and nutrition plan in {language_name(language)} for someone with these characteristics:
+    
+{profile_block(user_data)}{metrics_block(metrics)}
+    
+    Reply with ONLY a JSON object (no markdown, no commentary) matching this JSON Schema:
+    
+    {json.dumps(PLAN_JSON_SCHEMA, separators=(",", ":"))}
+    
+    - "assessment": a short markdown paragraph on BMI, fitness level and goal feasibility
+    - "days": one entry per training day with specific exercises, integer sets and reps
+    - "nutrition": the daily calorie target and macros above, meal timing and sample meals
+    - "milestones": checkpoints by week number
+    - "tips": motivation strategies, pitfalls to avoid and lifestyle tips
+    
+    All text values must be in {language_name(language)}. Keep the advice safe and encourage consulting healthcare professionals when appropriate.
+    """
+
+def structured_plan_messages(user_data: Dict[str, Any], language: str,
+                             metrics: Optional[Dict[str, Any]] = None) -> List[Dict[str, str]]:
+    """Chat messages for a structured plan request"""
+    metrics = metrics or compute_metrics(user_data)
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": build_structured_plan_prompt(user_data, language, metrics)}
+    ]
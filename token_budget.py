@@ -0,0 +1,204 @@
+"""Token accounting, prompt compaction and adaptive completion budgets
+
+Prompt tokens are counted before each call (with tiktoken when it is
+installed, otherwise a byte-length estimate) and over-budget prompts are
+compacted. Per-request usage and finish reasons are recorded to a local
+SQLite store, and ``max_tokens`` is chosen per request kind, language and
+goal from that history instead of a fixed 3000.
+
+    python token_budget.py report
+"""
+import argparse
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+try:
+    import tiktoken
+except ImportError:  # optional dependency; fall back to an estimate
+    tiktoken = None
+
+DATA_DIR = os.getenv("FITBOT_DATA_DIR", ".fitbot")
+DEFAULT_DB_PATH = os.path.join(DATA_DIR, "usage.sqlite3")
+
+# Prompt size above which messages are compacted before sending
+PROMPT_TOKEN_BUDGET = int(os.getenv("FITBOT_PROMPT_TOKEN_BUDGET", "2500"))
+# Largest completion the chat models accept
+MAX_COMPLETION_TOKENS = 4096
+
+# Adaptive budgets need this many untruncated samples before they kick in
+MIN_SAMPLES = 20
+HISTORY_WINDOW = 200
+HEADROOM = 1.15
+BUDGET_STEP = 50
+# Truncation rate above which the budget grows instead of tracking history
+MAX_TRUNCATION_RATE = 0.05
+
+# Chat format overhead per message and for the reply primer
+TOKENS_PER_MESSAGE = 4
+REPLY_PRIMER_TOKENS = 3
+
+_encodings = {}
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    """Number of tokens in a piece of text"""
+    if tiktoken is not None:
+        if model not in _encodings:
+            try:
+                _encodings[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _encodings[model] = tiktoken.get_encoding("cl100k_base")
+        return len(_encodings[model].encode(text))
+    # Roughly 4 bytes per token for English; UTF-8 byte length also charges
+    # accented text and emoji more, as real tokenizers do
+    return math.ceil(len(text.encode('utf-8')) / 4)
+
+def count_message_tokens(messages: List[Dict[str, str]], model: str = "gpt-3.5-turbo") -> int:
+    """Prompt tokens for a list of chat messages, including format overhead"""
+    return sum(TOKENS_PER_MESSAGE + count_tokens(m.get("content", ""), model) for m in messages) + REPLY_PRIMER_TOKENS
+
+def compact_text(text: str) -> str:
+    """Strip indentation, blank lines and repeated spaces from a prompt"""
+    lines = (re.sub(r"[ \t]+", " ", line).strip() for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+def fit_messages(messages: List[Dict[str, str]], budget: int = PROMPT_TOKEN_BUDGET,
+                 model: str = "gpt-3.5-turbo") -> List[Dict[str, str]]:
+    """Messages that fit the prompt budget
+
+    Over-budget prompts are compacted first; if that is not enough, the
+    middle of the last message is cut. Plan prompts open with the profile
+    and close with the output instructions, and both are kept.
+    """
+    if count_message_tokens(messages, model) <= budget:
+        return messages
+    compacted = [dict(m, content=compact_text(m.get("content", ""))) for m in messages]
+    overflow = count_message_tokens(compacted, model) - budget
+    if overflow <= 0:
+        return compacted
+
+    last = compacted[-1]["content"]
+    keep = max(len(last) - int(overflow * 4 * 1.1), 0)
+    head = keep // 2
+    compacted[-1] = dict(compacted[-1], content=last[:head] + "\n…\n" + last[len(last) - (keep - head):])
+    return compacted
+
+class UsageStore:
+    """Local SQLite store of per-request token usage"""
+
+    def __init__(self, path: str = DEFAULT_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS usage (
+                    ts REAL NOT NULL,
+                    kind TEXT NOT NULL,
+                    language TEXT NOT NULL,
+                    goal TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    prompt_tokens INTEGER,
+                    completion_tokens INTEGER,
+                    max_tokens INTEGER,
+                    finish_reason TEXT,
+                    latency_s REAL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS usage_bucket ON usage (kind, language, goal, ts)")
+
+    def record(self, kind: str, language: str, goal: str, model: str, prompt_tokens: int,
+               completion_tokens: int, max_tokens: int, finish_reason: Optional[str], latency_s: float):
+        """Record one request's token usage"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO usage VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), kind, language, goal or '', model, prompt_tokens, completion_tokens,
+                 max_tokens, finish_reason, latency_s)
+            )
+
+    def adaptive_max_tokens(self, kind: str, language: str, goal: str, default: int) -> int:
+        """Completion budget for a request, sized from recent history
+
+        Uses the 95th percentile of recent completions for the same kind,
+        language and goal plus headroom. Falls back to ``default`` until there
+        is enough history, and grows past history when recent requests were
+        being truncated.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT completion_tokens, finish_reason FROM usage "
+                "WHERE kind = ? AND language = ? AND goal = ? AND completion_tokens IS NOT NULL "
+                "ORDER BY ts DESC LIMIT ?",
+                (kind, language, goal or '', HISTORY_WINDOW)
+            ).fetchall()
+        if len(rows) < MIN_SAMPLES:
+            return default
+
+        truncated = sum(1 for _, reason in rows if reason == 'length')
+        if truncated / len(rows) > MAX_TRUNCATION_RATE:
+            largest_budget = max(tokens for tokens, _ in rows)
+            return min(max(default, int(largest_budget * 1.25)), MAX_COMPLETION_TOKENS)
+
+        completions = sorted(tokens for tokens, _ in rows)
+        p95 = completions[min(len(completions) - 1, int(len(completions) * 0.95))]
+        budget = math.ceil(p95 * HEADROOM / BUDGET_STEP) * BUDGET_STEP
+        return max(BUDGET_STEP, min(budget, MAX_COMPLETION_TOKENS))
+
+    def report(self) -> List[Dict[str, Any]]:
+        """Usage aggregated per request kind, language and goal"""
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT kind, language, goal, COUNT(*),
+                       SUM(prompt_tokens), SUM(completion_tokens),
+                       AVG(prompt_tokens), AVG(completion_tokens), MAX(completion_tokens),
+                       SUM(finish_reason = 'length'), AVG(latency_s)
+                FROM usage GROUP BY kind, language, goal ORDER BY kind, language, goal
+            """).fetchall()
+        return [{
+            'kind': kind,
+            'language': language,
+            'goal': goal,
+            'requests': count,
+            'prompt_tokens': prompt_total or 0,
+            'completion_tokens': completion_total or 0,
+            'avg_prompt_tokens': round(prompt_avg or 0, 1),
+            'avg_completion_tokens': round(completion_avg or 0, 1),
+            'max_completion_tokens': completion_max or 0,
+            'truncation_rate': round((truncated or 0) / count, 3),
+            'avg_latency_s': round(latency_avg or 0, 3)
+        } for (kind, language, goal, count, prompt_total, completion_total, prompt_avg,
+               completion_avg, completion_max, truncated, latency_avg) in rows]
+
+def main():
+    parser = argparse.ArgumentParser(description="Token usage telemetry")
+    sub = parser.add_subparsers(dest="command", required=True)
+    report = sub.add_parser("report", help="Aggregated usage per kind, language and goal")
+    report.add_argument("--db", default=DEFAULT_DB_PATH)
+    report.add_argument("--json", action="store_true", help="Print JSON instead of a table")
+    args = parser.parse_args()
+
+    rows = UsageStore(args.db).report()
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    columns = ['kind', 'language', 'goal', 'requests', 'avg_prompt_tokens', 'avg_completion_tokens',
+               'max_completion_tokens', 'truncation_rate', 'avg_latency_s']
+    widths = {c: max([len(c)] + [len(str(row[c])) for row in rows]) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for row in rows:
+        print("  ".join(str(row[c]).ljust(widths[c]) for c in columns))
+    totals = {k: sum(row[k] for row in rows) for k in ('requests', 'prompt_tokens', 'completion_tokens')}
+    print(f"\nTotal: {totals['requests']} requests, {totals['prompt_tokens']} prompt + "
+          f"{totals['completion_tokens']} completion tokens")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Parsing helpers for the free-text weight and height form inputs"""
+import re
+from typing import Optional
+
+KG_PER_LB = 0.45359237
+CM_PER_INCH = 2.54
+
+_NUMBER = r"(\d+(?:[.,]\d+)?)"
+_WEIGHT_RE = re.compile(_NUMBER + r"\s*(kg|kgs|kilos?|kilogram(?:s|os)?|lb|lbs|pounds?|libras?)?\b", re.IGNORECASE)
+# Feet and inch marks as typed, autocorrected ("smart" quotes) or as primes
+_FEET_MARK = r"(?:'|’|‘|′|ft|feet|foot|pies?)"
+_INCH_MARK = r"(?:\"|”|“|″|''|’’|′′|inch(?:es)?|in|pulgadas?)"
+_FEET_INCHES_RE = re.compile(_NUMBER + r"\s*" + _FEET_MARK + r"\s*(?:" + _NUMBER + r"\s*" + _INCH_MARK + r"?)?", re.IGNORECASE)
+_HEIGHT_RE = re.compile(_NUMBER + r"\s*(cm|centimet(?:er|re)s?|cent[ií]metros?|m|met(?:er|re)s?|metros?|inch(?:es)?|in|\"|”|″|pulgadas?)?", re.IGNORECASE)
+
+def _to_float(value: str) -> float:
+    return float(value.replace(',', '.'))
+
+def parse_weight_kg(text: str) -> Optional[float]:
+    """Parse a weight such as "70kg" or "154lbs" into kilograms
+
+    A bare number is read as kilograms, matching the form placeholder.
+    Returns None when no weight can be recognised.
+    """
+    match = _WEIGHT_RE.search(str(text or ''))
+    if not match:
+        return None
+    value = _to_float(match.group(1))
+    unit = (match.group(2) or 'kg').lower()
+    if unit.startswith(('lb', 'pound', 'libra')):
+        value *= KG_PER_LB
+    return value if value > 0 else None
+
+def parse_height_cm(text: str) -> Optional[float]:
+    """Parse a height such as "5'8\"", "175cm" or "1.75m" into centimetres
+
+    Bare numbers are disambiguated by magnitude: below 3 is metres, below 8
+    is feet, below 100 is inches and anything larger is centimetres.
+    Returns None unless the whole text is a height, so an unrecognised
+    notation is not misread from the number at its start.
+    """
+    text = str(text or '').strip()
+    match = _FEET_INCHES_RE.fullmatch(text)
+    if match:
+        feet = _to_float(match.group(1))
+        inches = _to_float(match.group(2)) if match.group(2) else 0.0
+        value = (feet * 12 + inches) * CM_PER_INCH
+        return value if value > 0 else None
+    
+    match = _HEIGHT_RE.fullmatch(text)
+    if not match:
+        return None
+    value = _to_float(match.group(1))
+    unit = (match.group(2) or '').lower()
+    if unit.startswith(('cm', 'cent')):
+        pass
+    elif unit.startswith('m'):
+        value *= 100
+    elif unit.startswith(('in', '"', '”', '″', 'pulgada')):
+        value *= CM_PER_INCH
+    elif value < 3:
+        value *= 100
+    elif value < 8:
+        value *= 12 * CM_PER_INCH
+    elif value < 100:
+        value *= CM_PER_INCH
+    return value if value > 0 else None